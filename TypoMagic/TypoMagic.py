@@ -11,23 +11,39 @@
 #
 
 import argparse
+import asyncio
+import functools
+import itertools
 from datetime import timedelta, date
 import sys
 import time
 import socket
+import threading
 import http.server
 import urllib
 import traceback
-from os import curdir, sep
+from os import curdir
 from socketserver import ThreadingMixIn
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import json
 
 import dns.resolver
 
 import typogen
+import typocache
+import dnscache
 import hostinfo
+import asynchostinfo
+import dnsbl
+import extrainfoquery
+import flagimages
+import metrics
+import profiling
+import staticfiles
+import spamhaus
 from objtypo import objtypo
 import safebrowsing
+import whois as whoisclient
 from whois import whois
 
 print ("[i] Running on : " + sys.platform)
@@ -37,10 +53,136 @@ if sys.platform.startswith('linux'):
     syslog.syslog('Log processing initiated...')
 
 _hostinfo = hostinfo.hostinfo()
+_flags = flagimages.FlagImages()
+_static = staticfiles.StaticFiles(curdir)
 _typogen = typogen.typogen()
+_typocache = typocache.TypoCache(_typogen)
 KEY = ''
+#DNS block list checker for the addresses found, or None if DNSBL checks are disabled
+_dnsbl = None
+#3rd party services queried about the addresses found, none of which are enabled by default
+_extrainfo = extrainfoquery.ProviderRegistry()
+#The ExtraInfoQuery providers which can be enabled, by name
+EXTRA_INFO_PROVIDERS = {'spamhaus': spamhaus.Spamhaus}
+#Profiler for requests which ask to be profiled or are picked at random, or None if profiling is disabled
+_profiler = None
+#The endpoints requests may be profiled for
+PROFILED_ENDPOINTS = ("typov2.ncc", "typostream.ncc", "entity.ncc", "entities.ncc")
+
+#Upper bound on the number of domains accepted by a single entities.ncc request
+MAX_BATCH_SIZE = 500
+#Upper bound on the number of addresses accepted by a single geo.ncc request
+MAX_GEO_BATCH_SIZE = 5000
+#Shared pool which bounds the number of entity lookups in flight across all requests
+_entity_executor = ThreadPoolExecutor(max_workers=20)
+#Number of entity lookups a single streaming request may have queued at once
+STREAM_WINDOW = 50
+#Number of DNS and Safe Browsing lookups each entity lookup may have in flight at once
+LOOKUPS_PER_ENTITY = 5
+#Pool which runs the individual lookups for each entity. Kept apart from _entity_executor, whose workers block waiting
+#on these, so that the two can't deadlock.
+_lookup_executor = ThreadPoolExecutor(max_workers=20 * LOOKUPS_PER_ENTITY)
+#Number of seconds an entity lookup may take before it returns what it has found so far
+ENTITY_DEADLINE = 10.0
+
+#The API endpoints requests are recorded under, anything else is recorded as static
+API_ENDPOINTS = ("typov2.ncc", "typostream.ncc", "entity.ncc", "entities.ncc", "geo.ncc", "geov4.ncc", "geov6.ncc",
+                 "keyboards.ncc", "providers.ncc", "whois.ncc")
+
+_http_seconds = metrics.histogram("typofinder_http_request_seconds", "HTTP requests by method, endpoint and status",
+                                  ("method", "endpoint", "status"))
+_http_in_flight = metrics.gauge("typofinder_http_requests_in_flight", "HTTP requests being handled")
+_entity_seconds = metrics.histogram("typofinder_entity_lookup_seconds", "Typo domain lookups by outcome",
+                                    ("outcome", ))
+_entities_in_flight = metrics.gauge("typofinder_entity_lookups_in_flight", "Typo domain lookups being made")
+
+
+def _cache_stats():
+    """
+    @return: A dict of cache name to its stats, read from whichever caches are in use now.
+    """
+    return {"dns": dnscache.shared_cache.stats(), "geoip": _hostinfo.geo_cache_stats(),
+            "typo": _typocache.stats(), "whois": whoisclient.cache_stats()}
+
+
+def _cache_metric(strKey):
+    return lambda: dict(((strCache, ), dictStats[strKey]) for strCache, dictStats in _cache_stats().items())
+
+
+metrics.callback("typofinder_cache_hits_total", "Cache hits", "counter", _cache_metric("hits"), ("cache", ))
+metrics.callback("typofinder_cache_misses_total", "Cache misses", "counter", _cache_metric("misses"), ("cache", ))
+metrics.callback("typofinder_cache_hit_ratio", "Fraction of cache lookups which were hits", "gauge",
+                 _cache_metric("hit_ratio"), ("cache", ))
+metrics.callback("typofinder_cache_entries", "Entries held in the cache", "gauge", _cache_metric("size"), ("cache", ))
+metrics.callback("typofinder_threads", "Live threads, including idle pool workers", "gauge", threading.active_count)
 
 # v2 AJAX API
+#
+# Each entity lookup is a small dependency graph of DNS queries. The apex A record is looked up first, since most typo
+# domains don't exist and an NXDOMAIN means nothing else is worth asking for. Everything else then runs concurrently on
+# _lookup_executor, with the MX exchanges fanning out as soon as the MX records arrive. Each task fills in its own
+# objtypo, which is merged into the result as it completes, so that a lookup can give up at its deadline and return
+# whatever has been found so far.
+def resolve_ipv4(sDomain, typo):
+    # IP address for domain, raising NXDOMAIN if it doesn't exist
+    ipv4addresses = _hostinfo.getIPv4(sDomain)
+    if ipv4addresses:
+        for hostData in ipv4addresses:
+            typo.IPv4Address.append(hostData.address)
+    #Else, found a domain with no IP associated with it.
+
+
+def resolve_ipv6(sDomain, typo):
+    try:
+        ipv6addresses = _hostinfo.getIPv6(sDomain)
+        if ipv6addresses:
+            for hostData in ipv6addresses:
+                typo.IPV6Address.append(hostData.address)
+    except dns.resolver.NXDOMAIN:
+        #The domain has been deleted since we asked for its A record
+        return
+
+
+def resolve_mx(sDomain, typo):
+    # MX
+    mxRecords = _hostinfo.getMX(sDomain)
+    if mxRecords:
+        for hostData in mxRecords:
+            typo.aMX.append(str(hostData.exchange).strip("."))
+
+
+def resolve_mx_host(strExchange, typo):
+    try:
+        ipv4addresses = _hostinfo.getIPv4(strExchange)
+        if ipv4addresses:
+            typo.aMXIPv4[strExchange] = [hostData.address for hostData in ipv4addresses]
+
+        ipv6addresses = _hostinfo.getIPv6(strExchange)
+        if ipv6addresses:
+            typo.aMXIPv6[strExchange] = [hostData.address for hostData in ipv6addresses]
+    except dns.resolver.NXDOMAIN:
+        #This MX record points at non-existent domain
+        pass
+
+
+def resolve_dnsbl(lstIPs, typo):
+    # DNS block lists
+    typo.DNSBL = _dnsbl.check(lstIPs)
+
+
+def resolve_extrainfo(sDomain, lstIPs, typo):
+    # 3rd party services
+    typo.ExtraInfo = _extrainfo.query(sDomain, lstIPs)
+
+
+def resolve_safebrowsing(sDomain, typo):
+    # Safe Browsing
+    try:
+        typo.SafeBrowsing = safebrowsing.safebrowsingqueryv2("www." + sDomain, KEY)
+    except:
+        pass
+
+
 def resolve_www(sDomain, typo):
     # WWW
     try:
@@ -107,88 +249,419 @@ def resolve_m(sDomain, typo):
         return
 
 
-def handleHostAJAX(sDomain):
+def lookup_partial(fnResolve, sDomain):
+    """
+    Runs one node of the entity lookup graph.
+
+    @param fnResolve: The resolve_* function to run.
+    @param sDomain: The domain (or MX exchange, or list of addresses) to pass to it.
+    @return: A new objtypo holding only the fields set by fnResolve.
+    """
     typo = objtypo()
-    
-    typo.strDomain = sDomain
-    
-    # IP address for domain
-    try:
-        ipv4addresses = _hostinfo.getIPv4(sDomain)
-        if ipv4addresses:
-            for hostData in ipv4addresses:
-                typo.IPv4Address.append(hostData.address)
-        #Else, found a domain with no IP associated with it.
+    fnResolve(sDomain, typo)
+    return typo
 
-        ipv6addresses = _hostinfo.getIPv6(sDomain)
+
+# With the asyncio DNS engine the DNS nodes of the graph run as coroutines on its event loop instead, so that they
+# don't each hold a worker thread while waiting for their answers. The A and AAAA records of a name are asked for
+# together.
+async def aresolve_addresses(afnIPv4, afnIPv6, sHostname):
+    """
+    @param afnIPv4: The asynchostinfo coroutine function looking up the name's A records.
+    @param afnIPv6: The asynchostinfo coroutine function looking up the name's AAAA records.
+    @param sHostname: The name to look up.
+    @return: The lists of IPv4 and IPv6 addresses. Both are empty if the name doesn't exist.
+    """
+    ipv4results, ipv6results = await asyncio.gather(afnIPv4(sHostname), afnIPv6(sHostname), return_exceptions=True)
+    if isinstance(ipv4results, dns.resolver.NXDOMAIN):
+        return list(), list()
+    if isinstance(ipv6results, dns.resolver.NXDOMAIN):
+        #This *should* only happen in the odd case that the domain has been deleted in the time that's
+        #passed since we asked for it's A record.
+        ipv6results = None
+    for results in (ipv4results, ipv6results):
+        if isinstance(results, BaseException):
+            raise results
+    return [hostData.address for hostData in ipv4results or ()], [hostData.address for hostData in ipv6results or ()]
+
+
+async def aresolve_ipv4(sDomain, typo):
+    # IP address for domain, raising NXDOMAIN if it doesn't exist
+    ipv4addresses = await _hostinfo.agetIPv4(sDomain)
+    if ipv4addresses:
+        typo.IPv4Address.extend(hostData.address for hostData in ipv4addresses)
+
+
+async def aresolve_ipv6(sDomain, typo):
+    try:
+        ipv6addresses = await _hostinfo.agetIPv6(sDomain)
         if ipv6addresses:
-            for hostData in ipv6addresses:
-                typo.IPV6Address.append(hostData.address)
+            typo.IPV6Address.extend(hostData.address for hostData in ipv6addresses)
     except dns.resolver.NXDOMAIN:
-        #Shortcut - If the domain query results in an NXDOMAIN, don't bother looking for subdomains.
-        return typo
+        #The domain has been deleted since we asked for its A record
+        return
 
-    # MX
-    mxRecords = _hostinfo.getMX(sDomain)
+
+async def aresolve_mx(sDomain, typo):
+    mxRecords = await _hostinfo.agetMX(sDomain)
     if mxRecords:
-        for hostData in mxRecords:
-            typo.aMX.append(str(hostData.exchange).strip("."))
+        typo.aMX.extend(str(hostData.exchange).strip(".") for hostData in mxRecords)
+
+
+async def aresolve_mx_host(strExchange, typo):
+    ipv4addresses, ipv6addresses = await aresolve_addresses(_hostinfo.agetIPv4, _hostinfo.agetIPv6, strExchange)
+    if ipv4addresses:
+        typo.aMXIPv4[strExchange] = ipv4addresses
+    if ipv6addresses:
+        typo.aMXIPv6[strExchange] = ipv6addresses
+
+
+async def aresolve_www(sDomain, typo):
+    typo.wwwv4, typo.wwwv6 = await aresolve_addresses(_hostinfo.agetWWW, _hostinfo.agetWWWv6, sDomain)
+
+
+async def aresolve_webmail(sDomain, typo):
+    typo.webmailv4, typo.webmailv6 = await aresolve_addresses(_hostinfo.agetWEBMail, _hostinfo.agetWEBMailv6, sDomain)
+
+
+async def aresolve_m(sDomain, typo):
+    typo.mv4, typo.mv6 = await aresolve_addresses(_hostinfo.agetM, _hostinfo.agetMv6, sDomain)
+
+
+#resolve_* function -> the coroutine function doing the same with the asyncio DNS engine
+ASYNC_RESOLVERS = {resolve_ipv4: aresolve_ipv4, resolve_ipv6: aresolve_ipv6, resolve_mx: aresolve_mx,
+                   resolve_mx_host: aresolve_mx_host, resolve_www: aresolve_www, resolve_webmail: aresolve_webmail,
+                   resolve_m: aresolve_m}
+
+
+async def alookup_partial(afnResolve, sDomain):
+    """
+    The asyncio equivalent of lookup_partial.
+
+    @param afnResolve: The aresolve_* coroutine function to run.
+    @param sDomain: The domain (or MX exchange) to pass to it.
+    @return: A new objtypo holding only the fields set by afnResolve.
+    """
+    typo = objtypo()
+    await afnResolve(sDomain, typo)
+    return typo
+
+
+def addresses(typo):
+    """
+    @return: Every IPv4 and IPv6 address in the objtypo.
+    """
+    lstIPs = typo.IPv4Address + typo.IPV6Address + typo.wwwv4 + typo.wwwv6 + typo.mv4 + typo.mv6 + typo.webmailv4 + \
+        typo.webmailv6
+    for lstMXIPs in itertools.chain(typo.aMXIPv4.values(), typo.aMXIPv6.values()):
+        lstIPs.extend(lstMXIPs)
+    return lstIPs
+
+
+def handleHostAJAX(sDomain, fDeadline=None):
+    """
+    Looks up everything shown for a typo domain.
+
+    @param sDomain: The domain to look up.
+    @param fDeadline: The number of seconds to spend on the lookup, defaulting to ENTITY_DEADLINE.
+    @return: The populated objtypo. If the deadline passed first, it holds what had been found by then and has
+    bPartial set.
+    """
+    _entities_in_flight.inc()
+    with _entity_seconds.time(outcome="complete") as dictLabels:
+        try:
+            typo = _lookup_entity(sDomain, fDeadline)
+            if typo.bPartial:
+                dictLabels['outcome'] = "partial"
+            return typo
+        except Exception:
+            dictLabels['outcome'] = "failed"
+            raise
+        finally:
+            _entities_in_flight.dec()
+
+
+def _lookup_entity(sDomain, fDeadline):
+    if fDeadline is None:
+        fDeadline = ENTITY_DEADLINE
+    fExpires = time.monotonic() + fDeadline
+    #Run as part of this request's profile, if it's being profiled
+    lookup_node = profiling.wrap(lookup_partial)
+    bAsync = isinstance(_hostinfo, asynchostinfo.asynchostinfo)
+
+    def submit(fnResolve, arg):
+        if bAsync and fnResolve in ASYNC_RESOLVERS:
+            return _hostinfo.submit(alookup_partial(ASYNC_RESOLVERS[fnResolve], arg))
+        return _lookup_executor.submit(lookup_node, fnResolve, arg)
+
+    typo = objtypo()
+    typo.strDomain = sDomain
+
+    try:
+        done, pending = wait([submit(resolve_ipv4, sDomain)], fDeadline)
+        if pending:
+            typo.bPartial = True
+            for future in pending:
+                future.cancel()
+            return typo
+        partial = done.pop().result()
+        typo.merge(partial)
+    except dns.resolver.NXDOMAIN:
+        #Shortcut - If the domain query results in an NXDOMAIN, don't bother looking for subdomains.
+        return typo
 
+    futureMX = submit(resolve_mx, sDomain)
+    pending = {futureMX}
+
+    #Addresses are checked against the DNS block lists and 3rd party services as soon as each node finds them
+    setCheckedIPs = set()
+
+    def check_addresses(partial):
+        if _dnsbl is None and not _extrainfo.providers():
+            return
+        lstNewIPs = [strIP for strIP in addresses(partial) if strIP not in setCheckedIPs]
+        if not lstNewIPs:
+            return
+        setCheckedIPs.update(lstNewIPs)
+        if _dnsbl is not None:
+            pending.add(submit(resolve_dnsbl, lstNewIPs))
+        if _extrainfo.providers():
+            pending.add(submit(functools.partial(resolve_extrainfo, sDomain), lstNewIPs))
+
+    check_addresses(partial)
+    for fnResolve in (resolve_ipv6, resolve_safebrowsing, resolve_www, resolve_webmail, resolve_m):
+        pending.add(submit(fnResolve, sDomain))
+
+    while pending:
+        done, pending = wait(pending, max(0, fExpires - time.monotonic()), FIRST_COMPLETED)
+        if not done:
+            break
+
+        for future in done:
             try:
-                ipv4addresses = _hostinfo.getIPv4(str(hostData.exchange).strip("."))
-
-                if ipv4addresses:
-                    for hostDataInnerv4 in ipv4addresses:
-                        if str(hostData.exchange).strip(".") in typo.aMXIPv4:
-                            typo.aMXIPv4[str(hostData.exchange).strip(".")].append(hostDataInnerv4.address)
-                        else:
-                            typo.aMXIPv4[str(hostData.exchange).strip(".")] = [hostDataInnerv4.address]
-
-                ipv6addresses = _hostinfo.getIPv6(str(hostData.exchange).strip("."))
-                if ipv6addresses:
-                    for hostDataInnerv6 in ipv6addresses:
-                        if str(hostData.exchange).strip(".") in typo.aMXIPv6:
-                            typo.aMXIPv6[str(hostData.exchange).strip(".")].append(hostDataInnerv6.address)
-                        else:
-                            typo.aMXIPv6[str(hostData.exchange).strip(".")] = [hostDataInnerv6.address]
-            except dns.resolver.NXDOMAIN:
-                #This MX record points at non-existent domain
-                pass
-    # Safe Browsing
+                partial = future.result()
+            except Exception:
+                print("[!] Lookup failed for part of " + sDomain)
+                traceback.print_exc(file=sys.stdout)
+                continue
+
+            typo.merge(partial)
+            check_addresses(partial)
+            if future is futureMX:
+                for strExchange in set(partial.aMX):
+                    pending.add(submit(resolve_mx_host, strExchange))
+
+    if pending:
+        print("[!] Lookup deadline passed for " + sDomain)
+        typo.bPartial = True
+        for future in pending:
+            future.cancel()
+
+    return typo
+
+
+def handleHostAJAXSafe(sDomain):
+    """
+    Wrapper around handleHostAJAX for use from the worker pool, so that a failure for one domain doesn't take down
+    the rest of the batch.
+
+    @param sDomain: The domain to look up.
+    @return: The populated objtypo, or an empty one for this domain if the lookup failed.
+    """
     try:
-        typo.SafeBrowsing = safebrowsing.safebrowsingqueryv2("www." + sDomain, KEY)
-    except:
-        pass
+        return handleHostAJAX(sDomain)
+    except Exception:
+        print("[!] Lookup failed for " + sDomain)
+        traceback.print_exc(file=sys.stdout)
+        typo = objtypo()
+        typo.strDomain = sDomain
+        return typo
 
-    resolve_www(sDomain, typo)
 
-    resolve_webmail(sDomain, typo)
+def handleHostsAJAX(lstDomains):
+    """
+    Resolves a batch of domains concurrently using the shared entity worker pool.
 
-    resolve_m(sDomain, typo)
+    @param lstDomains: The list of domains to look up.
+    @return: A list of objtypo objects, in the same order as lstDomains.
+    """
+    return list(_entity_executor.map(profiling.wrap(handleHostAJAXSafe), lstDomains))
 
-    return typo
+
+def iterHostsAJAX(iterDomains, iWindow=STREAM_WINDOW, fnLookup=handleHostAJAXSafe):
+    """
+    Resolves domains concurrently using the shared entity worker pool, yielding each result as soon as it is ready.
+    Only iWindow lookups are queued at any one time, so the domains can be consumed lazily.
+
+    @param iterDomains: An iterable of domains to look up.
+    @param iWindow: The maximum number of outstanding lookups.
+    @param fnLookup: The function to look up each domain with, which must not raise.
+    @return: A generator of the results of fnLookup (objtypo objects by default), in completion order. Closing it,
+    e.g. when the client has gone away, cancels the lookups which haven't started yet.
+    """
+    pending = set()
+    fnLookup = profiling.wrap(fnLookup)
+    try:
+        for sDomain in iterDomains:
+            pending.add(_entity_executor.submit(fnLookup, sDomain))
+            if len(pending) >= iWindow:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def set_workers(iWorkers):
+    """
+    Replaces the worker pools, so that up to iWorkers entity lookups can be in flight at once.
+
+    @param iWorkers: The number of entity lookup workers.
+    """
+    global _entity_executor, _lookup_executor
+    _entity_executor.shutdown()
+    _entity_executor = ThreadPoolExecutor(max_workers=iWorkers)
+    _lookup_executor.shutdown()
+    _lookup_executor = ThreadPoolExecutor(max_workers=iWorkers * LOOKUPS_PER_ENTITY)
 
 
 class MyHandler(http.server.BaseHTTPRequestHandler):
 
+    #Keep connections open between requests, which means every response needs a Content-Length or to close the
+    #connection when it's done
+    protocol_version = "HTTP/1.1"
+
+    def handle_one_request(self):
+        #Timed from when the request line has been read, so the wait for it on a kept alive connection isn't counted.
+        #Requests which fail before a response is sent are recorded with the status "aborted".
+        self._fStart = None
+        self._iStatus = None
+        try:
+            super(MyHandler, self).handle_one_request()
+        finally:
+            if self._fStart is not None:
+                _http_in_flight.dec()
+                _http_seconds.observe(time.perf_counter() - self._fStart, method=self.command,
+                                      endpoint=self.endpoint(), status=self._iStatus or "aborted")
+
+    def parse_request(self):
+        self._fStart = time.perf_counter()
+        _http_in_flight.inc()
+        return super(MyHandler, self).parse_request()
+
+    def send_response(self, code, message=None):
+        self._iStatus = code
+        super(MyHandler, self).send_response(code, message)
+
+    def endpoint(self):
+        """
+        @return: The name the request is recorded under, which is one of a fixed few so that the metrics stay small.
+        """
+        strPath = urllib.parse.urlsplit(getattr(self, "path", "")).path
+        if strPath == "/metrics":
+            return "metrics"
+        for strSegment in strPath.split("/"):
+            if strSegment in API_ENDPOINTS:
+                return strSegment
+        return "static"
+
     def output(self, outputString):
         self.wfile.write(outputString.encode('utf-8'))
 
+    def send_body(self, outputString, strContentType):
+        """
+        Sends a complete response.
+
+        @param outputString: The body of the response.
+        @param strContentType: The "Content-type" header.
+        """
+        data = outputString.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-type", strContentType)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def output_error(self, strMessage, bStream, bSSE):
+        """
+        Sends an error instead of the typos. A stream, whose headers have already been sent, gets it as an
+        {"error": ...} record so that NDJSON and SSE clients can parse it. Otherwise it's the whole body, which the
+        JavaScript client relies on not being valid JSON.
+        """
+        if bStream:
+            self.output_event({"error": strMessage}, bSSE)
+            if bSSE:
+                self.output("event: end\ndata: {}\n\n")
+        else:
+            self.send_body(strMessage, "application/json")
+
+    def output_event(self, dictEvent, bSSE):
+        """
+        Writes a single record of a streamed response and flushes it to the client.
+
+        @param dictEvent: The JSON serialisable record to send.
+        @param bSSE: True to frame the record as a Server-Sent Event, False for a line of NDJSON.
+        """
+        if bSSE:
+            self.output("data: " + json.dumps(dictEvent) + "\n\n")
+        else:
+            self.output(json.dumps(dictEvent) + "\n")
+        self.wfile.flush()
+
+    def stream_typos(self, lstTypos, bResolve, bSSE):
+        """
+        Streams the given typos to the client, one record per typo. If requested, each record also includes the
+        resolved entity for that typo, sent as soon as its lookup completes.
+
+        @param lstTypos: The typo domains to send.
+        @param bResolve: True to resolve each typo before sending it.
+        @param bSSE: True to use Server-Sent Events framing, False for NDJSON.
+        """
+        if bResolve:
+            for typo in iterHostsAJAX(lstTypos):
+                self.output_event({"typo": typo.strDomain, "entity": typo.reprJSON()}, bSSE)
+        else:
+            for strTypoHost in lstTypos:
+                self.output_event({"typo": strTypoHost}, bSSE)
+
+        if bSSE:
+            self.output("event: end\ndata: {}\n\n")
+
     def do_HEAD(self):
+        strPath = urllib.parse.urlsplit(self.path).path
+        if strPath.endswith("/"):
+            strPath = "/index.html"
+        if self.output_static(strPath, True):
+            return
+
         self.send_response(200)
         self.send_header("Content-type", "text/html")
+        self.send_header("Content-Length", "0")
         self.end_headers()
 
     def do_POST(self):
         """Respond to a POST request."""
 
+        session = None
+        if _profiler is not None and self.endpoint() in PROFILED_ENDPOINTS and _profiler.wanted(self.headers):
+            try:
+                session = _profiler.start(self.endpoint())
+            except Exception:
+                #The request is still answered, just not profiled
+                print("[!] Unable to start profiling " + self.path)
+
         try:
-            # v2 AJAX API generate typo domains
-            if self.path.endswith("typov2.ncc"):
-                self.send_response(200)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-       
+            # v2 AJAX API generate typo domains, either as a single JSON list or streamed one per record
+            if self.path.endswith("typov2.ncc") or self.path.endswith("typostream.ncc"):
+                bStream = self.path.endswith("typostream.ncc")
+                bSSE = bStream and "text/event-stream" in str(self.headers['Accept'])
+
                 length = int(self.headers['Content-Length'])
                 post_data = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
                 print("[i] " + str(post_data))
@@ -218,6 +691,22 @@ class MyHandler(http.server.BaseHTTPRequestHandler):
                 bBitFlip = 'bitflip' in post_data
                 bHomoglyphs = 'homoglyph' in post_data
                 bDoppelganger = 'doppelganger' in post_data
+                bResolve = 'resolve' in post_data
+                try:
+                    iCountryCodeIntensity = int(post_data['countrycodeamount'][0])
+                except:
+                    iCountryCodeIntensity = 0
+                try:
+                    iLimit = int(post_data['limit'][0])
+                except:
+                    iLimit = None
+                if iLimit is not None and iLimit < 0:
+                    #Checked before a stream's headers are sent, as it can't be reported as an error after them
+                    self.send_error(400, '[!] Invalid limit %d' % iLimit)
+                    return
+                strKeyboard = post_data.get('keyboard', ['gb'])[0]
+                if strKeyboard not in _typogen.keyboards():
+                    strKeyboard = 'gb'
                 bOnlyAlexa = False
                 bNeverAlexa = False
 
@@ -227,31 +716,53 @@ class MyHandler(http.server.BaseHTTPRequestHandler):
                     elif post_data["alexafilter"][0] == "onlyalexa":
                         bOnlyAlexa = True
 
+                profiling.tag(host=strHost, keyboard=strKeyboard, typos=bTypos, typoamount=iTypoIntensity, tld=bTLD,
+                              bitflip=bBitFlip, homoglyph=bHomoglyphs, doppelganger=bDoppelganger,
+                              onlyalexa=bOnlyAlexa, neveralexa=bNeverAlexa, charsetamount=icharsetamount,
+                              limit=iLimit, countrycodeamount=iCountryCodeIntensity, resolve=bResolve)
+
+                if bStream:
+                    self.send_response(200)
+                    if bSSE:
+                        self.send_header("Content-type", "text/event-stream")
+                        self.send_header("Cache-Control", "no-cache")
+                    else:
+                        self.send_header("Content-type", "application/x-ndjson")
+                    #The length of a stream isn't known up front, so it ends when the connection is closed
+                    self.send_header("Connection", "close")
+                    self.end_headers()
 
 
                 # stupid user
                 if not bTypos and not bTLD and not bBitFlip and not bHomoglyphs and not bDoppelganger:
                     print("[i] No typos to process for " + strHost + " due to user option")
                     # this will cause an error in the JavaScript client which is relied upon
-                    self.output("[!] No typos for " + strHost)
+                    self.output_error("[!] No typos for " + strHost, bStream, bSSE)
                     return
 
                 # domain name validation
                 if _typogen.is_domain_valid(strHost):
                     print("[i] Processing typos for " + strHost) 
-                    lstTypos = _typogen.generatetyposv2(strHost, "gb", bTypos, iTypoIntensity, bTLD, bBitFlip, bHomoglyphs, bDoppelganger, bOnlyAlexa, bNeverAlexa, icharsetamount)
-                    if lstTypos is not None:
-                        self.output(json.dumps([strTypoHost for strTypoHost in lstTypos]))
+                    if bStream:
+                        # generated lazily, so each typo is sent as soon as it has been found
+                        lstTypos = itertools.islice(_typogen.itertyposv2(strHost, strKeyboard, bTypos, iTypoIntensity, bTLD, bBitFlip, bHomoglyphs, bDoppelganger, bOnlyAlexa, bNeverAlexa, icharsetamount, iCountryCodeIntensity), iLimit)
+                    else:
+                        lstTypos = _typocache.generatetyposv2(strHost, strKeyboard, bTypos, iTypoIntensity, bTLD, bBitFlip, bHomoglyphs, bDoppelganger, bOnlyAlexa, bNeverAlexa, icharsetamount, iLimit, iCountryCodeIntensity)
+                    if lstTypos is not None and bStream:
+                        self.stream_typos(lstTypos, bResolve, bSSE)
+                    elif lstTypos is not None:
+                        self.send_body(json.dumps([strTypoHost for strTypoHost in lstTypos]), "application/json")
                     else:
                         # this will cause an error in the JavaScript client which is relied upon
-                        self.output("[!] No typos for " + strHost) 
+ 
+                        self.output_error("[!] No typos for " + strHost, bStream, bSSE)
                         print("[!] No typos for " + strHost)   
 
                     print("[i] Processed typos for " + strHost)   
                     return
                 else:
                     # this will cause an error in the JavaScript client which is relied upon
-                    self.output("[!] Invalid domain " + strHost)  
+                    self.output_error("[!] Invalid domain " + strHost, bStream, bSSE)
                     print("[i] Invalid domain " + strHost)    
                     return
             # v2 AJAX API - get basic information for a domain      
@@ -259,115 +770,154 @@ class MyHandler(http.server.BaseHTTPRequestHandler):
                 length = int(self.headers['Content-Length'])
                 post_data = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
                 strHost = str(post_data['host'])[2:-2]
+                profiling.tag(host=strHost)
 
                 objFoo = handleHostAJAX(strHost)
 
-                self.send_response(200)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.output(json.dumps(objFoo.reprJSON()))
-                
+                self.send_body(json.dumps(objFoo.reprJSON()), "application/json")
+
+            # v2 AJAX API - get basic information for many domains in one request
+            elif self.path.endswith("entities.ncc"):
+                length = int(self.headers['Content-Length'])
+                post_data = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+                lstHosts = post_data.get('host', [])
+
+                if len(lstHosts) > MAX_BATCH_SIZE:
+                    self.send_error(413, '[!] Too many domains in batch, maximum is %d' % MAX_BATCH_SIZE)
+                    return
+                profiling.tag(hosts=lstHosts)
+
+                lstTypos = handleHostsAJAX(lstHosts)
+
+                self.send_body(json.dumps([typo.reprJSON() for typo in lstTypos]), "application/json")
+
+            # v2 AJAX API - get the country codes of many addresses in one request
+            elif self.path.endswith("geo.ncc"):
+                length = int(self.headers['Content-Length'])
+                post_data = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+                lstIPs = post_data.get('ip', [])
+
+                if len(lstIPs) > MAX_GEO_BATCH_SIZE:
+                    self.send_error(413, '[!] Too many addresses in batch, maximum is %d' % MAX_GEO_BATCH_SIZE)
+                    return
+
+                self.send_body(json.dumps(dict((strIP, _hostinfo.getGeo(strIP)) for strIP in lstIPs)), "application/json")
+
+            else:
+                self.send_error(404, '[!] File Not Found: %s' % self.path)
+
         except:
             print(sys.exc_info())
             traceback.print_exc(file=sys.stdout)
-            pass
-              
+            #The response may have been cut short, so the client can only tell where it ends by the connection closing
+            self.close_connection = True
+        finally:
+            if session is not None:
+                strProfile = session.stop()
+                if strProfile is not None:
+                    print("[i] Profile written to " + strProfile)
+
         return
 
-    def output_file(self, path, mime_type):
+    def output_static(self, strPath, bHead=False):
         """
-        Sends the contents of the given file with the given "Content-type" header.
+        Sends a static file from the in memory cache, compressed if the client accepts it, or just a 304 if the
+        client's copy is still current.
 
-        @param path: The path to the file to send.
-        @param mime_type: The content type.
-        @raise IOError: If a path traversal is attempted.
+        @param strPath: The request path of the file.
+        @param bHead: True to only send the headers.
+        @return: False if there's no such file, in which case nothing has been sent.
         """
-        if '..' in path:
-            raise IOError
-        else:
-            with open(path, "rb") as f:
-                self.send_response(200)
-                self.send_header('Content-type', mime_type)
-                self.end_headers()
-                self.wfile.write(f.read())
+        staticfile = _static.get(strPath)
+        if staticfile is None:
+            return False
+
+        bGzip = staticfile.gzipped is not None and 'gzip' in str(self.headers['Accept-Encoding'])
+        bFresh = staticfile.is_fresh(self.headers['If-None-Match'], self.headers['If-Modified-Since'])
+        self.send_response(304 if bFresh else 200)
+        self.send_header('ETag', staticfile.strGzipETag if bGzip else staticfile.strETag)
+        self.send_header('Last-Modified', staticfile.strLastModified)
+        self.send_header('Cache-Control', 'public, max-age=%d' % staticfile.iMaxAge)
+        self.send_header('Vary', 'Accept-Encoding')
+        if bFresh:
+            self.end_headers()
+            return True
+
+        data = staticfile.data
+        if bGzip:
+            data = staticfile.gzipped
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-type', staticfile.strMimeType)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if not bHead:
+            self.wfile.write(data)
+        return True
+
+    def output_image(self, image):
+        """
+        Sends one of the preloaded flag images, or just a 304 if the client's copy is still current.
+
+        @param image: The tuple of the image and its ETag.
+        """
+        data, strETag = image
+        if self.headers['If-None-Match'] == strETag:
+            self.send_response(304)
+            self.send_header('ETag', strETag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        month = timedelta(days=30)
+        futuredate = date.today() + month
+        self.send_header('Expires', futuredate.strftime('%a, %d %b %Y %H:%M:%S GMT'))
+        self.send_header('ETag', strETag)
+        self.send_header('Content-type', 'image/png')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
 
     def do_GET(self):
         """Respond to a GET request."""
 
         try:
-            if self.path.endswith("/"):
-                self.output_file(curdir + sep + "index.html", 'text/html')
-                return
-            elif self.path.endswith(".html"):
-                self.output_file(curdir + sep + self.path, 'text/html')
-                return
-            elif self.path.endswith(".css"):
-                self.output_file(curdir + sep + self.path, 'text/css')
-                return
-            elif self.path.endswith(".js"):
-                self.output_file(curdir + sep + self.path, 'application/javascript')
-                return
-            elif self.path.endswith(".map"):
-                self.output_file(curdir + sep + self.path, 'application/json')
-                return
-            elif self.path.endswith(".ico"):
-                self.output_file(curdir + sep + self.path, 'image/x-icon')
+            strPath = urllib.parse.urlsplit(self.path).path
+            if strPath.endswith("/"):
+                strPath = "/index.html"
+
+            if strPath.endswith(".png") and _flags.get_path(strPath) is not None:
+                self.output_image(_flags.get_path(strPath))
                 return
-            elif self.path.endswith(".png") and self.path.find("..") != 0:
-                f = open(curdir + sep + self.path, "rb") 
-                self.send_response(200)
-
-                month = timedelta(days=30)
-                futuredate = date.today() + month
-                self.send_header('Expires', futuredate.strftime('%a, %d %b %Y %H:%M:%S GMT'))
-                self.send_header('Content-type', 'image/png')
-                self.end_headers()
-                self.wfile.write(f.read())
-                f.close()
+            elif strPath == "/metrics":
+                self.send_body(metrics.REGISTRY.render(), metrics.CONTENT_TYPE)
+            elif ".ncc" not in strPath and self.output_static(strPath):
                 return
             # v2 REST API - get geo for an IPv4
             elif "geov4.ncc" in self.path:
                 lastSlash = self.path.rfind("/")
                 strIP = self.path[lastSlash + 1:]
-                strIMG = _hostinfo.getGeoImagebyIPv4new(strIP)
-
-                f = open(curdir + sep + strIMG, "rb") 
-                self.send_response(200)
-
-                month = timedelta(days=30)
-                futuredate = date.today() + month
-                self.send_header('Expires', futuredate.strftime('%a, %d %b %Y %H:%M:%S GMT'))
-                self.send_header('Content-type', 'image/png')
-                self.end_headers()
-                self.wfile.write(f.read())
-                f.close()
+                self.output_image(_flags.get(_hostinfo.getGeobyIP(strIP)))
 
             # v2 REST API - get geo for an IPv6
             elif "geov6.ncc" in self.path:
                 lastSlash = self.path.rfind("/")
                 strIP = self.path[lastSlash + 1:]
-                strIMG = _hostinfo.getGeoImagebyIPv6new(strIP)
+                self.output_image(_flags.get(_hostinfo.getGeobyIPv6(strIP)))
 
-                f = open(curdir + sep + strIMG, "rb") 
-                self.send_response(200)
+            # v2 REST API - list the available keyboard layouts
+            elif self.path.endswith("keyboards.ncc"):
+                self.send_body(json.dumps(sorted(_typogen.keyboards())), "application/json")
 
-                month = timedelta(days=30)
-                futuredate = date.today() + month
-                self.send_header('Expires', futuredate.strftime('%a, %d %b %Y %H:%M:%S GMT'))
-                self.send_header('Content-type', 'image/png')
-                self.end_headers()
-                self.wfile.write(f.read())
-                f.close()
+            # v2 REST API - call counts and latencies of the 3rd party services
+            elif self.path.endswith("providers.ncc"):
+                self.send_body(json.dumps(_extrainfo.stats()), "application/json")
 
             # v2 REST API - get whois for domain
             elif "whois.ncc" in self.path:
                 lastSlash = self.path.rfind("/")
                 strDomain = urllib.parse.unquote(self.path[lastSlash + 1:])
-                
-                self.send_response(200)
-                self.send_header("Content-type", "text/html")
-                self.end_headers()
-                self.output(whois(strDomain))
+
+                self.send_body(whois(strDomain), "text/html")
                 
             else:
                 self.send_error(404, '[!] File Not Found: %s' % self.path)
@@ -375,7 +925,7 @@ class MyHandler(http.server.BaseHTTPRequestHandler):
         except IOError:
             self.send_error(404, '[!] File Not Found: %s' % self.path)
         except:
-            pass
+            self.close_connection = True
 
 class MultiThreadedHTTPServer(ThreadingMixIn, http.server.HTTPServer):
     pass
@@ -404,8 +954,53 @@ if __name__ == '__main__':
     parser.add_argument('-p', '--port', help='Port to listen on',required=False, type=tcpport, default=801)
     parser.add_argument('-a', '--address', help='hostname / IP address to bind to', required=False, type=str, default='')
     parser.add_argument('-k', '--key',help='Google SafeBrowsing API key', required=False)
+    parser.add_argument('-w', '--workers', help='Maximum number of domain lookups in flight at once', required=False, type=int, default=20)
+    parser.add_argument('-d', '--deadline', help='Maximum number of seconds to spend looking up a domain', required=False, type=float, default=ENTITY_DEADLINE)
+    parser.add_argument('--typo-cache', help='Directory to cache generated typos in across restarts', required=False)
+    parser.add_argument('--whois-cache', help='Directory to cache whois results in across restarts', required=False)
+    parser.add_argument('--dnsbl', help='Check the addresses found against these comma separated DNS block list zones', required=False, nargs='?', const=','.join(dnsbl.DEFAULT_ZONES))
+    parser.add_argument('--extra-info', help='Query the addresses found with these comma separated services: ' + ', '.join(sorted(EXTRA_INFO_PROVIDERS)), required=False)
+    parser.add_argument('--profile-dir', help='Profile requests with the ' + profiling.HEADER + ' header, writing collapsed stacks to this directory', required=False)
+    parser.add_argument('--profile-rate', help='Percentage of typo and entity requests to profile at random', required=False, type=float, default=0)
+    parser.add_argument('--async-dns', help='Resolve with the asyncio DNS engine, waiting for all the DNS queries on one event loop rather than a worker thread each', required=False, action='store_true')
     args = parser.parse_args()
 
+    if args.async_dns:
+        print("[i] Using asyncio DNS resolution")
+        _hostinfo = asynchostinfo.asynchostinfo()
+
+    if args.workers < 1:
+        parser.error("Number of workers needs to be at least 1")
+    set_workers(args.workers)
+
+    if args.deadline <= 0:
+        parser.error("Deadline needs to be a positive number of seconds")
+    ENTITY_DEADLINE = args.deadline
+
+    if not 0 <= args.profile_rate <= 100:
+        parser.error("Profile rate needs to be a percentage")
+    if args.profile_dir or args.profile_rate:
+        _profiler = profiling.Profiler(args.profile_dir or profiling.PROFILE_DIR, args.profile_rate / 100)
+        print("[i] Profiling requests to " + _profiler.strDir)
+
+    if args.typo_cache:
+        _typocache = typocache.TypoCache(_typogen, strDir=args.typo_cache)
+
+    if args.whois_cache:
+        whoisclient.set_cache_dir(args.whois_cache)
+
+    if args.dnsbl:
+        print("[i] Checking addresses against " + args.dnsbl)
+        _dnsbl = dnsbl.DNSBL(args.dnsbl.split(','), iWorkers=args.workers * LOOKUPS_PER_ENTITY)
+
+    if args.extra_info:
+        _extrainfo = extrainfoquery.ProviderRegistry(iWorkers=args.workers * LOOKUPS_PER_ENTITY)
+        for strProvider in args.extra_info.split(','):
+            if strProvider not in EXTRA_INFO_PROVIDERS:
+                parser.error("Unknown extra info service " + strProvider)
+            _extrainfo.register(EXTRA_INFO_PROVIDERS[strProvider]())
+        print("[i] Querying addresses with " + ', '.join(_extrainfo.providers()))
+
     if args.key:
         print("[i] Google safe browsing key supplied")
         KEY = args.key	
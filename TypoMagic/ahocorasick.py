@@ -0,0 +1,84 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# Aho-Corasick automaton for finding many substrings in a single pass over a string
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+from collections import deque
+
+
+class Automaton(object):
+    """
+    Matches every occurrence of a fixed set of patterns in one pass over the input, in time proportional to the length
+    of the input plus the number of matches. Build it once, then call find_all as many times as required; a built
+    automaton is read only and so can be shared between threads.
+    """
+
+    def __init__(self, patterns):
+        """
+        @param patterns: An iterable of the non-empty strings to search for.
+        """
+        #Each state is a dict of character -> next state, state 0 is the root
+        self._goto = [dict()]
+        self._fail = [0]
+        #The patterns which end at each state, including those inherited from the failure links
+        self._output = [()]
+
+        for pattern in patterns:
+            self._add(pattern)
+        self._build_failure_links()
+
+    def _add(self, pattern):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append(dict())
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        if pattern and pattern not in self._output[state]:
+            self._output[state] += (pattern,)
+
+    def _build_failure_links(self):
+        #Breadth first, so that a state's failure link is always complete before its children's are calculated
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fail_state = self._fail[state]
+                while fail_state and char not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                self._fail[next_state] = self._goto[fail_state].get(char, 0)
+
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def find_all(self, text):
+        """
+        Finds every (possibly overlapping) occurrence of the patterns in the text.
+
+        @param text: The string to search.
+        @return: A generator of (start index, pattern) tuples, ordered by the index at which each match ends.
+        """
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+
+        state = 0
+        for idx, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            for pattern in output[state]:
+                yield idx + 1 - len(pattern), pattern
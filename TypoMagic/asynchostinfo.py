@@ -0,0 +1,259 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# asyncio based DNS resolution engine for hostinfo
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import asyncio
+import secrets
+import socket
+import struct
+import threading
+
+import dns.exception
+import dns.flags
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.resolver
+
+import dnscache
+import hostinfo
+
+
+def _nxdomain(qname, response):
+    try:
+        return dns.resolver.NXDOMAIN(qnames=[qname], responses={qname: response})
+    except TypeError:
+        #Older versions of dnspython don't take the response
+        return dns.resolver.NXDOMAIN()
+
+
+def _noanswer(response):
+    try:
+        return dns.resolver.NoAnswer(response=response)
+    except TypeError:
+        return dns.resolver.NoAnswer()
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+    """
+    The UDP socket of a single query, which takes the first datagram answering it as the response.
+    """
+
+    def __init__(self, request, nameserver, future):
+        self.request = request
+        self.nameserver = nameserver
+        self.future = future
+
+    def datagram_received(self, data, addr):
+        #Ignore anything that didn't come from the server we asked, or doesn't answer our question
+        if self.future.done() or addr[0] != self.nameserver:
+            return
+        try:
+            response = dns.message.from_wire(data)
+        except dns.message.Truncated:
+            self.future.set_result(None)
+            return
+        except dns.exception.DNSException:
+            return
+        if self.request.is_response(response):
+            self.future.set_result(response)
+
+    def error_received(self, exc):
+        #e.g. ICMP port unreachable, the query will time out and be retried
+        pass
+
+    def connection_lost(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc or ConnectionError("DNS socket closed"))
+
+
+class AsyncResolver(object):
+    """
+    A minimal asyncio stub resolver, so that thousands of lookups can be in flight at once without a thread each.
+    Like dnspython, each query is sent from its own socket on a random ephemeral port with a random message id, which
+    makes spoofed answers hard to get into the shared DNS cache. Truncated responses are retried over TCP.
+    """
+
+    def __init__(self, nameservers=None, port=53, timeout=2.0, retries=1):
+        """
+        @param nameservers: The list of recursive name server addresses, defaulting to the system's.
+        @param port: The port the name servers listen on.
+        @param timeout: The time in seconds to wait for each query attempt.
+        @param retries: The number of times to retry each name server after the first attempt times out.
+        """
+        if nameservers is None:
+            nameservers = dns.resolver.Resolver().nameservers
+        self.nameservers = [str(nameserver) for nameserver in nameservers]
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+
+    async def _udp_query(self, request, nameserver):
+        """
+        @return: The response, or None if it was truncated.
+        """
+        loop = asyncio.get_running_loop()
+        request.id = secrets.randbelow(65536)
+        future = loop.create_future()
+        family = socket.AF_INET6 if ':' in nameserver else socket.AF_INET
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: _UDPProtocol(request, nameserver, future), family=family)
+        try:
+            transport.sendto(request.to_wire(), (nameserver, self.port))
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            transport.close()
+
+    async def _tcp_query(self, request, nameserver):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(nameserver, self.port), self.timeout)
+        try:
+            wire = request.to_wire()
+            writer.write(struct.pack("!H", len(wire)) + wire)
+            length = struct.unpack("!H", await asyncio.wait_for(reader.readexactly(2), self.timeout))[0]
+            response = dns.message.from_wire(await asyncio.wait_for(reader.readexactly(length), self.timeout))
+        finally:
+            writer.close()
+        if not request.is_response(response):
+            raise dns.exception.FormError("Response does not match the query")
+        return response
+
+    async def resolve(self, qname, rdtype):
+        """
+        Resolves the given name and record type.
+
+        @param qname: The dns.name.Name (or string) to query.
+        @param rdtype: The record type to query for.
+        @return: The dns.resolver.Answer.
+        @raise dns.resolver.NXDOMAIN: If the name doesn't exist.
+        @raise dns.resolver.NoAnswer: If the name exists but has no records of rdtype.
+        @raise dns.exception.Timeout: If every attempt timed out.
+        @raise dns.resolver.NoNameservers: If every name server failed to answer.
+        """
+        if isinstance(qname, str):
+            qname = dns.name.from_text(qname)
+        request = dns.message.make_query(qname, rdtype)
+
+        timed_out = True
+        for attempt in range(self.retries + 1):
+            for nameserver in self.nameservers:
+                try:
+                    response = await self._udp_query(request, nameserver)
+                    if response is None or response.flags & dns.flags.TC:
+                        response = await self._tcp_query(request, nameserver)
+                except asyncio.TimeoutError:
+                    continue
+                except (OSError, EOFError, dns.exception.DNSException):
+                    timed_out = False
+                    continue
+
+                rcode = response.rcode()
+                if rcode == dns.rcode.NXDOMAIN:
+                    raise _nxdomain(qname, response)
+                elif rcode != dns.rcode.NOERROR:
+                    #e.g. SERVFAIL, so try the next server
+                    timed_out = False
+                    continue
+
+                try:
+                    answer = dns.resolver.Answer(qname, rdtype, dns.rdataclass.IN, response)
+                except dns.resolver.NoAnswer:
+                    #Older versions of dnspython raise this from the constructor
+                    answer = None
+                if answer is None or answer.rrset is None:
+                    raise _noanswer(response)
+                return answer
+
+            if not timed_out:
+                #Only time outs are worth retrying, the servers have already given their answer
+                break
+
+        if timed_out:
+            raise dns.exception.Timeout()
+        raise dns.resolver.NoNameservers()
+
+
+class asynchostinfo(hostinfo.hostinfo):
+    """
+    Host information class backed by the asyncio resolver. The blocking hostinfo API is still available to threads,
+    which wait on lookups run on a shared event loop, and each method has an async equivalent prefixed with 'a'.
+    """
+
+    def __init__(self, timeout=2.0, retries=1):
+        super(asynchostinfo, self).__init__()
+        self._async_resolver = AsyncResolver(self._resolver.nameservers, timeout=timeout, retries=retries)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="asynchostinfo", daemon=True)
+        self._thread.start()
+
+    def submit(self, coroutine):
+        """
+        Schedules the coroutine on this object's event loop, without waiting for it.
+
+        @return: The concurrent.futures.Future of its result, which cancels the coroutine if it's cancelled.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def run(self, coroutine):
+        """
+        Runs the coroutine on this object's event loop, blocking the calling thread until it's done. Must not be called
+        from the event loop itself.
+
+        @return: The result of the coroutine.
+        """
+        return self.submit(coroutine).result()
+
+    async def ado_query(self, prefix, sHostname, rdatatype):
+        with hostinfo._dns_seconds.time(rdtype=dns.rdatatype.to_text(rdatatype), outcome="answer") as dictLabels:
+            try:
+                domainname = self.domainname(prefix, sHostname)
+
+                dnsAnswers = await dnscache.shared_cache.aquery(self._async_resolver, domainname, rdatatype)
+                return dnsAnswers
+            except Exception as e:
+                dictLabels['outcome'] = hostinfo.query_outcome(e)
+                if isinstance(e, (dns.exception.Timeout, dns.resolver.NoAnswer, dns.resolver.NoNameservers)):
+                    return None
+                raise
+
+    def do_query(self, prefix, sHostname, rdatatype):
+        return self.run(self.ado_query(prefix, sHostname, rdatatype))
+
+    async def agetWWW(self, sHostname):
+        return await self.ado_query('www', sHostname, self.A_type)
+
+    async def agetWWWv6(self, sHostname):
+        return await self.ado_query('www', sHostname, self.AAAA_type)
+
+    async def agetM(self, sHostname):
+        return await self.ado_query('m', sHostname, self.A_type)
+
+    async def agetMv6(self, sHostname):
+        return await self.ado_query('m', sHostname, self.AAAA_type)
+
+    async def agetWEBMail(self, sHostname):
+        return await self.ado_query('webmail', sHostname, self.A_type)
+
+    async def agetWEBMailv6(self, sHostname):
+        return await self.ado_query('webmail', sHostname, self.AAAA_type)
+
+    async def agetMX(self, sHostname):
+        try:
+            return await self.ado_query(None, sHostname, dns.rdatatype.MX)
+        except dns.resolver.NXDOMAIN:
+            return None
+
+    async def agetIPv4(self, sHostname):
+        return await self.ado_query(None, sHostname, self.A_type)
+
+    async def agetIPv6(self, sHostname):
+        return await self.ado_query(None, sHostname, self.AAAA_type)
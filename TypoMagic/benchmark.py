@@ -0,0 +1,314 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# Performance benchmarks, run from the TypoMagic directory e.g. python benchmark.py rankstore
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import argparse
+import codecs
+import glob
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import rankstore
+import whois
+
+#Short, long, IDN and multi-label public suffix domains, used when no corpus is given
+TYPOGEN_CORPUS = ("bt.com", "ncc.io", "example.com", "nccgroup.com", "internationalbusinessmachines.com",
+                  "averyveryverylongdomainnameforbenchmarking.co.uk", "xn--bcher-kva.de", "xn--mnchen-3ya.de",
+                  "examplebank.co.uk", "bank.com.au", "city.kawasaki.jp")
+
+#Option combinations for the end to end generatetyposv2 benchmark, as keyword arguments
+TYPOGEN_PROFILES = (
+    ("quick", dict(bTypos=True, iTypoIntensity=0, bTLDS=False, bBitFlip=False, bHomoglyphs=False,
+                   bDoppelganger=False)),
+    ("default", dict(bTypos=True, iTypoIntensity=100, bTLDS=False, bBitFlip=True, bHomoglyphs=True,
+                     bDoppelganger=True)),
+    ("everything", dict(bTypos=True, iTypoIntensity=100, bTLDS=True, bBitFlip=True, bHomoglyphs=True,
+                        bDoppelganger=True, iCountryCodeIntensity=100)),
+)
+
+#Fraction by which a benchmark's ops/s may fall below its baseline before it's reported as a regression
+REGRESSION_TOLERANCE = 0.2
+
+
+def _time_per_call(fn, lstArgs, iRepeat=3):
+    """
+    Calls fn once for each of lstArgs, iRepeat times over, and returns the best average time per call in seconds.
+    """
+    best = None
+    for _ in range(iRepeat):
+        start = time.perf_counter()
+        for arg in lstArgs:
+            fn(arg)
+        elapsed = (time.perf_counter() - start) / len(lstArgs)
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def _write_fake_top_sites(strPath, iCount):
+    with open(strPath, "w") as f:
+        for i in range(1, iCount + 1):
+            f.write("%d,site%d-example.com\n" % (i, i))
+
+
+def bench_rankstore(strCsvPath, iLookups):
+    """
+    Compares the memory cost and lookup latency of the old dict of Alexa ranks against the memory-mapped rank store.
+    """
+    with tempfile.TemporaryDirectory() as strTempDir:
+        if strCsvPath is None:
+            strCsvPath = os.path.join(strTempDir, "top-1m.csv")
+            _write_fake_top_sites(strCsvPath, 1000000)
+        strStorePath = os.path.join(strTempDir, "top-1m.ranks")
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        alexa_top = {}
+        with open(strCsvPath) as top1m:
+            for line in top1m:
+                parts = line.rstrip().split(',', 1)
+                if len(parts) == 2:
+                    alexa_top[parts[1]] = int(parts[0])
+        dict_load = time.perf_counter() - start
+        dict_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        rankstore.build(strCsvPath, strStorePath)
+        store_build = time.perf_counter() - start
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        store = rankstore.RankStore(strStorePath)
+        store_load = time.perf_counter() - start
+        store_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        hits = random.sample(list(alexa_top), min(iLookups, len(alexa_top)))
+        misses = ["not-" + domain for domain in hits]
+
+        print("%-22s %12s %12s %14s %14s" % ("", "load (s)", "heap (MB)", "hit (us)", "miss (us)"))
+        print("%-22s %12.3f %12.1f %14.2f %14.2f" % ("dict", dict_load, dict_memory / 1048576.0,
+                                                     _time_per_call(alexa_top.get, hits) * 1e6,
+                                                     _time_per_call(alexa_top.get, misses) * 1e6))
+        print("%-22s %12.3f %12.1f %14.2f %14.2f" % ("rankstore (mmap)", store_load, store_memory / 1048576.0,
+                                                     _time_per_call(store.lookup, hits) * 1e6,
+                                                     _time_per_call(store.lookup, misses) * 1e6))
+        print("rankstore build: %.3fs, file size: %.1f MB (shared between processes via the page cache)" %
+              (store_build, os.path.getsize(strStorePath) / 1048576.0))
+        store.close()
+
+
+def bench_whois(strCorpus, iRepeat):
+    """
+    Compares the time taken to parse a corpus of saved whois responses by the field by field parser and the single
+    pass parser.
+    """
+    lstResponses = list()
+    for strPath in sorted(glob.glob(os.path.join(strCorpus, "*.txt"))):
+        with open(strPath, "r", encoding="utf-8") as f:
+            lstResponses.append(f.read())
+    if not lstResponses:
+        print("No whois responses (*.txt) found in " + strCorpus)
+        return
+
+    for response in lstResponses:
+        if whois.parse(response) != whois._parse_by_field(response):
+            print("Warning: the parsers disagree on a response")
+
+    lstResponses = lstResponses * iRepeat
+    print("%-22s %14s" % ("", "parse (us)"))
+    print("%-22s %14.1f" % ("field by field", _time_per_call(whois._parse_by_field, lstResponses) * 1e6))
+    print("%-22s %14.1f" % ("single pass", _time_per_call(whois.parse, lstResponses) * 1e6))
+    print("%d responses, %.1f KB on average" % (len(lstResponses) // iRepeat,
+                                                sum(len(r) for r in lstResponses) / len(lstResponses) / 1024.0))
+
+
+def _measure(fn, lstArgs, fMinTime=0.2):
+    """
+    Calls fn once for each of lstArgs, repeating the whole list until at least fMinTime seconds have passed, then once
+    more with tracemalloc running to find the peak memory of a single pass.
+
+    @return: A dict of the calls per second, results per second (fn returning an iterable whose items are counted) and
+    peak memory in KB.
+    """
+    iCalls = 0
+    iResults = 0
+    start = time.perf_counter()
+    while True:
+        for arg in lstArgs:
+            iResults += sum(1 for _ in fn(arg))
+        iCalls += len(lstArgs)
+        elapsed = time.perf_counter() - start
+        if elapsed >= fMinTime:
+            break
+
+    tracemalloc.start()
+    for arg in lstArgs:
+        for _ in fn(arg):
+            pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return dict(ops_per_s=iCalls / elapsed, candidates_per_s=iResults / elapsed, peak_kb=peak / 1024.0)
+
+
+def bench_typogen(lstDomains, fMinTime):
+    """
+    Measures data source loading, each typo generator, the filters applied to their candidates and the end to end
+    generatetyposv2 over a corpus of domains.
+
+    @param lstDomains: The IDNA encoded domains to generate typos for.
+    @param fMinTime: The minimum number of seconds to spend on each benchmark.
+    @return: A dict of benchmark name to its results, as returned by _measure.
+    """
+    from typogen import typogen
+
+    dictResults = dict()
+
+    start = time.perf_counter()
+    typogen._parseconfusables("datasources/confusables.txt")
+    dictResults["startup.parseconfusables"] = dict(seconds=time.perf_counter() - start)
+    start = time.perf_counter()
+    typogen.loadconfusables()
+    dictResults["startup.loadconfusables"] = dict(seconds=time.perf_counter() - start)
+    start = time.perf_counter()
+    generator = typogen()
+    dictResults["startup.typogen"] = dict(seconds=time.perf_counter() - start)
+
+    lstGenerators = [
+        ("bitflipstring", typogen.bitflipstring),
+        ("missing_character", typogen.generate_missing_character_typos),
+        ("duplicate_character", typogen.generate_duplicate_character_typos),
+        ("miskeyed", lambda strHost: typogen.generate_miskeyed_typos(strHost, "gb")),
+        ("miskeyed_sequence", lambda strHost: typogen.generate_miskeyed_sequence_typos(strHost, "gb")),
+        ("miskeyed_addition", lambda strHost: typogen.generate_miskeyed_addition_typos(strHost, "gb")),
+        ("transposed_character", typogen.generate_transposed_character_typos),
+        ("tld_swapped", generator.generate_tld_swapped_typos),
+        ("homoglyph_confusables", typogen.generate_homoglyph_confusables_typos),
+        ("additional_homoglyph", typogen.generate_additional_homoglyph_typos),
+        ("subdomain_doppelgangers", typogen.generate_subdomain_doppelgangers),
+        ("extra_dot_doppelgangers", typogen.generate_extra_dot_doppelgangers),
+        ("country_code_doppelgangers", typogen.generate_country_code_doppelgangers),
+    ]
+    lstCandidates = list()
+    for strName, fn in lstGenerators:
+        dictResults["generate." + strName] = _measure(fn, lstDomains, fMinTime)
+        for strHost in lstDomains:
+            lstCandidates.extend(fn(strHost))
+
+    #The filters are measured over a sample of the candidates, each call counting as one result
+    lstCandidates = random.Random(0).sample(lstCandidates, min(len(lstCandidates), 20000))
+    lstUnicode = list()
+    for strCandidate in lstCandidates:
+        try:
+            lstUnicode.append(codecs.decode(strCandidate.encode(), "idna"))
+        except UnicodeError:
+            pass
+    dictResults["filter.is_domain_valid"] = _measure(lambda strCandidate: (generator.is_domain_valid(strCandidate), ),
+                                                     lstCandidates, fMinTime)
+    dictResults["filter.is_in_charset"] = _measure(lambda strCandidate: (typogen.is_in_charset(strCandidate, 50), ),
+                                                   lstUnicode, fMinTime)
+
+    for strName, dictOptions in TYPOGEN_PROFILES:
+        dictResults["generatetyposv2." + strName] = _measure(
+            lambda strHost: generator.generatetyposv2(strHost, **dictOptions), lstDomains, fMinTime)
+
+    return dictResults
+
+
+def compare_baseline(dictResults, dictBaseline, fTolerance=REGRESSION_TOLERANCE):
+    """
+    @return: The names of the benchmarks whose ops/s fell, or whose time (for the start up timings) grew, by more than
+    fTolerance compared to the baseline.
+    """
+    lstRegressions = list()
+    for strName, dictResult in dictResults.items():
+        dictPrevious = dictBaseline.get(strName) or {}
+        if 'ops_per_s' in dictResult and 'ops_per_s' in dictPrevious:
+            bRegressed = dictResult['ops_per_s'] < dictPrevious['ops_per_s'] * (1 - fTolerance)
+        elif 'seconds' in dictResult and 'seconds' in dictPrevious:
+            bRegressed = dictResult['seconds'] > dictPrevious['seconds'] * (1 + fTolerance)
+        else:
+            bRegressed = False
+        if bRegressed:
+            lstRegressions.append(strName)
+    return lstRegressions
+
+
+def print_typogen(dictResults, dictBaseline):
+    print("%-40s %12s %16s %12s %10s" % ("", "ops/s", "candidates/s", "peak (KB)", "baseline"))
+    for strName, dictResult in dictResults.items():
+        dictPrevious = dictBaseline.get(strName) or {}
+        if 'seconds' in dictResult:
+            strVersus = "%+.0f%%" % ((dictResult['seconds'] / dictPrevious['seconds'] - 1) * 100) \
+                if dictPrevious.get('seconds') else ""
+            print("%-40s %12s %16s %12s %10s" % (strName, "%.3fs" % dictResult['seconds'], "", "", strVersus))
+        else:
+            strVersus = "%+.0f%%" % ((dictResult['ops_per_s'] / dictPrevious['ops_per_s'] - 1) * 100) \
+                if dictPrevious.get('ops_per_s') else ""
+            print("%-40s %12.1f %16.0f %12.1f %10s" % (strName, dictResult['ops_per_s'], dictResult['candidates_per_s'],
+                                                       dictResult['peak_kb'], strVersus))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Typofinder performance benchmarks")
+    subparsers = parser.add_subparsers(dest='benchmark')
+
+    rankstore_parser = subparsers.add_parser('rankstore', help='Alexa rank dict vs memory-mapped rank store')
+    rankstore_parser.add_argument('--csv', help='rank,domain CSV to use (default: 1m generated domains)')
+    rankstore_parser.add_argument('--lookups', type=int, default=100000, help='Number of lookups to time')
+
+    whois_parser = subparsers.add_parser('whois', help='Field by field vs single pass whois parsing')
+    whois_parser.add_argument('--corpus', default='testdata/whois', help='Directory of saved whois responses (*.txt)')
+    whois_parser.add_argument('--repeat', type=int, default=100, help='Number of times to parse each response')
+
+    typogen_parser = subparsers.add_parser('typogen', help='Typo generators, filters and end to end generatetyposv2')
+    typogen_parser.add_argument('--corpus', help='File of domains to generate typos for, one per line (default: a built in mix)')
+    typogen_parser.add_argument('--min-time', type=float, default=0.2, help='Minimum number of seconds to spend on each benchmark')
+    typogen_parser.add_argument('--baseline', help='JSON results of an earlier run to compare with, exiting with 1 on a regression')
+    typogen_parser.add_argument('--save', help='File to save the results to as JSON, for use as a later baseline')
+    typogen_parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE, help='Fraction of ops/s a benchmark may lose, or of time a start up timing may gain, before it counts as a regression')
+
+    args = parser.parse_args()
+
+    if args.benchmark == 'rankstore':
+        bench_rankstore(args.csv, args.lookups)
+    elif args.benchmark == 'whois':
+        bench_whois(args.corpus, args.repeat)
+    elif args.benchmark == 'typogen':
+        lstDomains = list(TYPOGEN_CORPUS)
+        if args.corpus:
+            with open(args.corpus, "r", encoding="utf-8") as f:
+                lstDomains = [codecs.encode(line.strip().lower(), "idna").decode() for line in f
+                              if line.strip() and not line.startswith("#")]
+        dictBaseline = dict()
+        if args.baseline:
+            with open(args.baseline, "r") as f:
+                dictBaseline = json.load(f)
+
+        dictResults = bench_typogen(lstDomains, args.min_time)
+        print_typogen(dictResults, dictBaseline)
+        if args.save:
+            with open(args.save, "w") as f:
+                json.dump(dictResults, f, indent=2, sort_keys=True)
+
+        lstRegressions = compare_baseline(dictResults, dictBaseline, args.tolerance)
+        if lstRegressions:
+            print("Regressed by more than %d%%: %s" % (args.tolerance * 100, ", ".join(lstRegressions)))
+            sys.exit(1)
+    else:
+        parser.print_help()
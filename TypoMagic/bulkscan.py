@@ -0,0 +1,294 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# Bulk typo squat monitoring of a list of brand domains, run from the TypoMagic directory e.g.
+#   python bulkscan.py brands.txt -o results.jsonl
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+
+import TypoMagic
+import resultstore
+import whois
+
+CSV_FIELDS = ("typo", "brands", "change", "IPv4Addresses", "IPv6Addresses", "aMX", "wwwv4", "wwwv6", "webmailv4", "webmailv6",
+              "mv4", "mv6", "SafeBrowsing", "bPartial", "registrar", "created", "updated", "expires")
+
+#Number of seconds between throughput reports
+REPORT_INTERVAL = 10
+
+
+def read_brands(strPath):
+    """
+    @param strPath: The path to a file of brand domains, one per line. Blank lines and lines starting with # are ignored.
+    @return: The list of unique brand domains, in file order.
+    """
+    lstBrands = list()
+    with open(strPath, "r", encoding="utf-8") as f:
+        for line in f:
+            strBrand = line.strip().lower()
+            if strBrand and not strBrand.startswith("#") and strBrand not in lstBrands:
+                lstBrands.append(strBrand)
+    return lstBrands
+
+
+def generate_typos(lstBrands, dictOptions):
+    """
+    Generates the typos for every brand, merging the typos which more than one brand has in common.
+
+    @param lstBrands: The brand domains.
+    @param dictOptions: The keyword arguments for typogen.generatetyposv2.
+    @return: An OrderedDict of typo domain to the list of brands it is a typo of.
+    """
+    dictTypos = OrderedDict()
+    for strBrand in lstBrands:
+        if not TypoMagic._typogen.is_domain_valid(strBrand):
+            print("[!] Invalid domain " + strBrand, file=sys.stderr)
+            continue
+
+        for strTypo in TypoMagic._typogen.generatetyposv2(strBrand, **dictOptions):
+            dictTypos.setdefault(strTypo, list()).append(strBrand)
+    return dictTypos
+
+
+def scan_typo(strTypo, bWhois=True, dictPrevious=None, store=None):
+    """
+    Looks up a typo domain, adding the parsed whois record for domains which have been registered.
+
+    @param strTypo: The typo domain.
+    @param bWhois: False to skip the whois lookup.
+    @param dictPrevious: The typo's result from the previous scan, if there is one.
+    @param store: The resultstore.ResultStore dictPrevious came from, to decide whether its whois record can be reused.
+    @return: A tuple of the objtypo, the parsed whois dict (or None if there isn't one) and the time that was looked up
+    at (or None if just now).
+    """
+    typo = TypoMagic.handleHostAJAXSafe(strTypo)
+
+    dictWhois = None
+    fWhoisChecked = None
+    if bWhois and resultstore.is_registered(typo.reprJSON()):
+        if store is not None and store.whois_is_fresh(dictPrevious) and \
+                resultstore.is_registered(dictPrevious['entity']):
+            dictWhois = dictPrevious['whois']
+            fWhoisChecked = dictPrevious['whois_checked']
+        else:
+            try:
+                dictWhois = whois.parse(whois.whois(strTypo))
+            except Exception:
+                print("[!] Whois failed for " + strTypo, file=sys.stderr)
+                if dictPrevious is not None and dictPrevious['whois'] is not None:
+                    #Don't report a change just because the whois server didn't answer this time
+                    dictWhois = dictPrevious['whois']
+                    fWhoisChecked = dictPrevious['whois_checked']
+    return typo, dictWhois, fWhoisChecked
+
+
+def make_record(typo, dictWhois, lstBrands, strChange=None):
+    """
+    @return: The output record for a scanned typo, as a JSON serialisable dict.
+    """
+    dictRecord = OrderedDict(typo=typo.strDomain, brands=lstBrands, change=strChange)
+    dictRecord.update(typo.reprJSON())
+    del dictRecord['strDomain']
+    dictRecord['whois'] = dictWhois
+    return dictRecord
+
+
+class JSONLWriter(object):
+    """Writes one JSON record per line."""
+
+    def __init__(self, f):
+        self._f = f
+
+    def write(self, dictRecord):
+        self._f.write(json.dumps(dictRecord, default=str) + "\n")
+
+    @staticmethod
+    def read_done(f):
+        setDone = set()
+        for line in f:
+            try:
+                setDone.add(json.loads(line)['typo'])
+            except (ValueError, KeyError):
+                pass
+        return setDone
+
+
+class CSVWriter(object):
+    """Writes one row per record, flattening lists with ; and keeping only the main whois fields."""
+
+    def __init__(self, f, bHeader):
+        self._writer = csv.writer(f)
+        if bHeader:
+            self._writer.writerow(CSV_FIELDS)
+
+    def write(self, dictRecord):
+        dictWhois = dictRecord['whois'] or {}
+        dictDates = dictWhois.get('date') or {}
+        row = list()
+        for strField in CSV_FIELDS:
+            if strField == "registrar":
+                value = (dictWhois.get('registrar') or {}).get('name')
+            elif strField in ("created", "updated", "expires"):
+                value = dictDates.get(strField)
+            else:
+                value = dictRecord[strField]
+
+            if isinstance(value, list):
+                value = ";".join(value)
+            row.append("" if value is None else str(value))
+        self._writer.writerow(row)
+
+    @staticmethod
+    def read_done(f):
+        reader = csv.reader(f)
+        next(reader, None)
+        return set(row[0] for row in reader if len(row) == len(CSV_FIELDS))
+
+
+def open_output(strPath, strFormat, bResume):
+    """
+    Opens the output file, which doubles as the checkpoint of a scan. When resuming, any incomplete record left at the
+    end of the file by an interrupted scan is removed.
+
+    @return: A tuple of the open file, its writer and the set of typos which have already been written.
+    """
+    clsWriter = CSVWriter if strFormat == "csv" else JSONLWriter
+
+    setDone = set()
+    if bResume and os.path.exists(strPath):
+        with open(strPath, "rb+") as f:
+            data = f.read()
+            f.truncate(data.rfind(b"\n") + 1)
+
+        with open(strPath, "r", encoding="utf-8", newline="") as f:
+            setDone = clsWriter.read_done(f)
+
+    f = open(strPath, "a" if bResume else "w", encoding="utf-8", newline="")
+    if clsWriter is CSVWriter:
+        #Only a new file needs the header row
+        return f, CSVWriter(f, f.tell() == 0), setDone
+    return f, JSONLWriter(f), setDone
+
+
+def scan(lstBrands, strOutput, strFormat="jsonl", bResume=False, bWhois=True, iWindow=TypoMagic.STREAM_WINDOW,
+         dictOptions=None, store=None, bDiff=False):
+    """
+    Scans the typos of every brand, writing a record for each typo to strOutput as soon as it has been looked up.
+    Typos which more than one brand has in common are only looked up once. With a result store, only the typos which
+    are due a recheck are looked up, and each record says how the typo has changed since it was last looked up.
+
+    @param lstBrands: The brand domains.
+    @param strOutput: The path of the output file.
+    @param strFormat: "jsonl" or "csv".
+    @param bResume: True to skip the typos already in strOutput from a previous, interrupted scan.
+    @param bWhois: False to skip the whois lookups.
+    @param iWindow: The maximum number of typos queued for lookup at once.
+    @param dictOptions: The keyword arguments for typogen.generatetyposv2.
+    @param store: The resultstore.ResultStore to check and record results in, or None.
+    @param bDiff: True to only write the typos which have changed, which requires a store.
+    @return: The number of typos scanned.
+    """
+    dictTypos = generate_typos(lstBrands, dictOptions or {})
+
+    f, writer, setDone = open_output(strOutput, strFormat, bResume)
+    if setDone:
+        print("[i] Resuming, %d of %d typos already scanned" % (len(setDone), len(dictTypos)), file=sys.stderr)
+    lstTodo = [strTypo for strTypo in dictTypos if strTypo not in setDone]
+
+    dictPrevious = dict()
+    if store is not None:
+        iTodo = len(lstTodo)
+        lstTodo = store.due(lstTodo)
+        dictPrevious = store.get_many(lstTodo)
+        print("[i] %d of %d typos are due a recheck" % (len(lstTodo), iTodo), file=sys.stderr)
+
+    iDone = 0
+    fStart = fLastReport = time.monotonic()
+    try:
+        fnLookup = lambda strTypo: scan_typo(strTypo, bWhois, dictPrevious.get(strTypo), store)
+        for typo, dictWhois, fWhoisChecked in TypoMagic.iterHostsAJAX(lstTodo, iWindow, fnLookup):
+            iDone += 1
+            strChange = None
+            if store is not None:
+                strChange = store.update(typo.strDomain, typo.reprJSON(), dictWhois, fWhoisChecked)
+
+            if strChange is not None or not bDiff:
+                writer.write(make_record(typo, dictWhois, dictTypos[typo.strDomain], strChange))
+                f.flush()
+
+            fNow = time.monotonic()
+            if fNow - fLastReport >= REPORT_INTERVAL or iDone == len(lstTodo):
+                fLastReport = fNow
+                print("[i] %d/%d typos scanned, %.1f domains/s" % (iDone, len(lstTodo), iDone / max(fNow - fStart, 1e-9)),
+                      file=sys.stderr)
+    finally:
+        f.close()
+        if store is not None:
+            store.commit()
+
+    return iDone
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scans the typo domains of a list of brand domains")
+    parser.add_argument('brands', help='File of brand domains, one per line')
+    parser.add_argument('-o', '--output', help='File to write the results to, which is also the checkpoint to resume from', required=True)
+    parser.add_argument('-f', '--format', help='Output format, by default taken from the output file extension', choices=('jsonl', 'csv'))
+    parser.add_argument('-r', '--resume', help='Skip the typos already in the output file', action='store_true')
+    parser.add_argument('-w', '--workers', help='Maximum number of domain lookups in flight at once', type=int, default=20)
+    parser.add_argument('-k', '--key', help='Google SafeBrowsing API key')
+    parser.add_argument('-s', '--store', help='Result store database, to only recheck typos when they are due and report what has changed')
+    parser.add_argument('-d', '--diff', help='Only write the typos which have changed since they were last checked, requires --store', action='store_true')
+    parser.add_argument('--no-whois', help='Skip the whois lookups', action='store_true')
+    parser.add_argument('--whois-cache', help='Directory to cache whois results in across runs')
+    parser.add_argument('--keyboard', help='Keyboard layout for miskeyed typos', default='gb')
+    parser.add_argument('--types', help='Comma separated typo types to generate', default='typos,tld,bitflip,homoglyph,doppelganger')
+    parser.add_argument('--countrycodeamount', help='Percentage of country code doppelgangers to generate', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("Number of workers needs to be at least 1")
+    if args.keyboard not in TypoMagic._typogen.keyboards():
+        parser.error("Unknown keyboard layout " + args.keyboard)
+    if args.diff and not args.store:
+        parser.error("--diff requires --store")
+    strFormat = args.format or ("csv" if args.output.lower().endswith(".csv") else "jsonl")
+    setTypes = set(args.types.split(','))
+
+    TypoMagic.set_workers(args.workers)
+    if args.whois_cache:
+        whois.set_cache_dir(args.whois_cache)
+    if args.key:
+        TypoMagic.KEY = args.key
+
+    lstBrands = read_brands(args.brands)
+    dictOptions = dict(strCountry=args.keyboard, bTypos='typos' in setTypes, bTLDS='tld' in setTypes,
+                       bBitFlip='bitflip' in setTypes, bHomoglyphs='homoglyph' in setTypes,
+                       bDoppelganger='doppelganger' in setTypes, iCountryCodeIntensity=args.countrycodeamount)
+
+    store = resultstore.ResultStore(args.store) if args.store else None
+
+    print("[i] Scanning %d brand domains" % len(lstBrands), file=sys.stderr)
+    try:
+        iScanned = scan(lstBrands, args.output, strFormat, args.resume, not args.no_whois, args.workers * 2, dictOptions,
+                        store, args.diff)
+    except KeyboardInterrupt:
+        print("[!] Interrupted, rerun with --resume to carry on", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if store is not None:
+            store.close()
+    print("[i] Scanned %d typos" % iScanned, file=sys.stderr)
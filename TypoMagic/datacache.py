@@ -0,0 +1,106 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# On-disk cache of data structures compiled from the files in datasources/
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+#Bump this whenever the structure of any compiled data source changes, to invalidate existing caches
+CACHE_VERSION = 1
+CACHE_DIR = "datasources/cache"
+
+
+def source_hash(lstSources):
+    """
+    Calculates a digest over the names and contents of the given source files.
+
+    @param lstSources: The list of source file paths.
+    @return: The hex digest string.
+    """
+    digest = hashlib.sha256()
+    for strSource in lstSources:
+        digest.update(strSource.encode('utf-8'))
+        with open(strSource, "rb") as f:
+            for block in iter(lambda: f.read(65536), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_path(strName):
+    return os.path.join(CACHE_DIR, strName + ".pickle")
+
+
+def load(strName, lstSources, fnBuild):
+    """
+    Returns the compiled data for strName, using the on-disk cache if it was built by this CACHE_VERSION from source
+    files with identical contents. Otherwise the data is rebuilt by calling fnBuild and the cache is rewritten.
+
+    @param strName: The unique name of the compiled data source, used as the cache file name.
+    @param lstSources: The list of source file paths that fnBuild reads.
+    @param fnBuild: A callable, taking no arguments, which compiles the data from the source files.
+    @return: The compiled data.
+    """
+    strHash = source_hash(lstSources)
+
+    try:
+        with open(_cache_path(strName), "rb") as f:
+            version, cached_hash, data = pickle.load(f)
+        if version == CACHE_VERSION and cached_hash == strHash:
+            return data
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        #Missing or corrupt cache, fall through and rebuild it
+        pass
+
+    data = fnBuild()
+    _store(strName, strHash, data)
+    return data
+
+
+def _store(strName, strHash, data):
+    """
+    Atomically writes the compiled data to the cache, so that concurrently starting processes never read a partial
+    file. Failure to write the cache isn't fatal, it just means the data will be rebuilt next time.
+    """
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, strTempPath = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((CACHE_VERSION, strHash, data), f, protocol=pickle.HIGHEST_PROTOCOL)
+        #mkstemp creates the file readable only by us, but the cache may be shared between workers
+        os.chmod(strTempPath, 0o644)
+        os.replace(strTempPath, _cache_path(strName))
+    except OSError as e:
+        print("[!] Unable to write data source cache for " + strName + ": " + str(e))
+
+
+def clear():
+    """
+    Removes every compiled data source from the cache.
+    """
+    try:
+        for strFile in os.listdir(CACHE_DIR):
+            if strFile.endswith(".pickle"):
+                os.remove(os.path.join(CACHE_DIR, strFile))
+    except OSError:
+        #No cache directory, so nothing to clear
+        pass
+
+
+if __name__ == '__main__':
+    #Build step: compile every data source ahead of time so that server processes start quickly
+    from typogen import typogen
+
+    clear()
+    print("Compiling data sources...", end=" ", flush=True)
+    typogen.compiledatasources()
+    print("Done.")
@@ -0,0 +1,130 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# DNS block list checks of the addresses found for typo domains
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import ipaddress
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import dns.exception
+import dns.rdatatype
+import dns.resolver
+
+import dnscache
+
+DEFAULT_ZONES = ("zen.spamhaus.org", )
+#Use OpenDNS name servers, as not all name servers will respond to DNSBL queries, e.g. Google.
+DEFAULT_NAMESERVERS = ('208.67.222.222', '208.67.220.220')
+
+
+def query_name(strIP, strZone):
+    """
+    @param strIP: An IPv4 or IPv6 address.
+    @param strZone: The DNSBL zone.
+    @return: The name to look up in the zone for the address, i.e. its reversed octets or nibbles under the zone.
+    @raise ValueError: If strIP isn't an address.
+    """
+    strReverse = ipaddress.ip_address(strIP).reverse_pointer
+    return strReverse[:strReverse.rindex(".", 0, strReverse.rindex("."))] + "." + strZone
+
+
+class DNSBL(object):
+    """
+    Checks addresses against DNS block lists. Every zone is checked for every address concurrently, and the answers
+    are cached for their TTL by dnscache.shared_cache, so the parking and hosting addresses which many typo domains
+    have in common are only looked up once. The TXT record explaining a listing is only fetched for listed addresses.
+    Safe to share between threads.
+    """
+
+    def __init__(self, lstZones=DEFAULT_ZONES, lstNameservers=DEFAULT_NAMESERVERS, iWorkers=20):
+        """
+        @param lstZones: The DNSBL zones to check, e.g. zen.spamhaus.org.
+        @param lstNameservers: The recursive name servers to query through.
+        @param iWorkers: The maximum number of DNSBL queries in flight at once.
+        """
+        self.lstZones = list(lstZones)
+        self._resolver = dns.resolver.Resolver()
+        self._resolver.Timeout = 2.0
+        self._resolver.lifetime = 2.0
+        #Caching is done by the process wide dnscache.shared_cache instead
+        self._resolver.cache = None
+        self._resolver.nameservers = list(lstNameservers)
+        self._executor = ThreadPoolExecutor(max_workers=iWorkers)
+        #Reentrant, as a check may complete and be forgotten while it's still being submitted
+        self._lock = threading.RLock()
+        #(address, zone) -> Future of the check in progress
+        self._inflight = dict()
+
+    def _check_one(self, strIP, strZone):
+        """
+        @return: The listing of strIP in strZone, as a dict of its zone, return codes and detail, or None if it isn't
+        listed.
+        """
+        queryname = query_name(strIP, strZone)
+        try:
+            answer = dnscache.shared_cache.query(self._resolver, queryname, dns.rdatatype.A)
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+            return None
+
+        lstCodes = sorted(rdata.address for rdata in answer)
+        lstDetails = list()
+        try:
+            for rdata in dnscache.shared_cache.query(self._resolver, queryname, dns.rdatatype.TXT):
+                lstDetails.append(b"".join(rdata.strings).decode("utf-8", "replace"))
+        except dns.exception.DNSException:
+            pass
+
+        return dict(zone=strZone, codes=lstCodes, detail=" ".join(lstDetails))
+
+    def _submit(self, strIP, strZone):
+        """
+        @return: The Future of checking strIP in strZone, shared with any other caller checking it at the same time.
+        """
+        key = (strIP, strZone)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._check_one, strIP, strZone)
+                self._inflight[key] = future
+                future.add_done_callback(lambda f: self._forget(key))
+        return future
+
+    def _forget(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def check(self, lstIPs):
+        """
+        Checks each address against every zone.
+
+        @param lstIPs: The IPv4 and IPv6 addresses to check.
+        @return: A dict of each listed address to the list of its listings, each a dict of the zone, the list of
+        return codes (e.g. 127.0.0.2) and the detail from the TXT record. Unlisted addresses are left out, as are
+        those whose checks failed.
+        """
+        lstChecks = list()
+        for strIP in set(lstIPs):
+            try:
+                ipaddress.ip_address(strIP)
+            except ValueError:
+                continue
+            for strZone in self.lstZones:
+                lstChecks.append((strIP, self._submit(strIP, strZone)))
+
+        dictListed = dict()
+        for strIP, future in lstChecks:
+            try:
+                listing = future.result()
+            except dns.exception.DNSException:
+                continue
+            if listing is not None:
+                dictListed.setdefault(strIP, list()).append(listing)
+        return dictListed
@@ -0,0 +1,166 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# Process wide DNS cache shared by every resolver, with negative caching per RFC 2308
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import threading
+import time
+
+import dns.exception
+import dns.rdatatype
+import dns.resolver
+
+from lrucache import LRUCache
+
+
+class _Negative(object):
+    """
+    A cached NXDOMAIN or NoAnswer result. The exception's class and arguments are kept rather than the exception
+    itself, so that every hit raises a new exception instead of threads sharing, and changing, one instance.
+    """
+
+    def __init__(self, exception):
+        self.cls = type(exception)
+        self.args = exception.args
+        self.kwargs = getattr(exception, 'kwargs', None)
+
+    def exception(self):
+        #dnspython doesn't allow both, and builds args from the kwargs when they're given
+        if self.kwargs:
+            return self.cls(**self.kwargs)
+        return self.cls(*self.args)
+
+
+class DNSCache(object):
+    """
+    Caches DNS answers for as long as their TTL allows, across all threads and all resolvers in the process. NXDOMAIN
+    and NoAnswer results are cached too, for the negative TTL given by the SOA record in the authority section of the
+    response (RFC 2308), so that the many unregistered typo domains aren't re-queried on every search.
+    """
+
+    def __init__(self, maxsize=100000, default_negative_ttl=300, max_ttl=86400, clock=time.monotonic):
+        """
+        @param maxsize: The maximum number of answers to hold.
+        @param default_negative_ttl: The negative TTL in seconds to use when a response doesn't carry an SOA record.
+        @param max_ttl: The cap in seconds on how long any answer is held, whatever its TTL.
+        @param clock: The function returning the current time in seconds, replaceable for testing.
+        """
+        self._cache = LRUCache(maxsize, clock=clock)
+        self.default_negative_ttl = default_negative_ttl
+        self.max_ttl = max_ttl
+        self._lock = threading.Lock()
+        self.negative_hits = 0
+
+    def query(self, resolver, qname, rdtype):
+        """
+        Resolves qname through the cache, only querying the resolver if there isn't an unexpired answer.
+
+        @param resolver: The dns.resolver.Resolver to query on a cache miss.
+        @param qname: The dns.name.Name to query.
+        @param rdtype: The record type to query for.
+        @return: The dns.resolver.Answer.
+        @raise dns.resolver.NXDOMAIN: If the name doesn't exist, whether cached or not.
+        @raise dns.resolver.NoAnswer: If the name exists but has no records of rdtype, whether cached or not.
+        @raise dns.exception.DNSException: For uncached failures, such as timeouts.
+        """
+        key = self._key(resolver, qname, rdtype)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        try:
+            answer = resolver.query(qname, rdtype)
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer) as e:
+            self._store_negative(key, e)
+            raise
+
+        self._store(key, answer)
+        return answer
+
+    async def aquery(self, resolver, qname, rdtype):
+        """
+        Asynchronous version of query(), for resolvers whose resolve() method is a coroutine, such as
+        asynchostinfo.AsyncResolver.
+        """
+        key = self._key(resolver, qname, rdtype)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        try:
+            answer = await resolver.resolve(qname, rdtype)
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer) as e:
+            self._store_negative(key, e)
+            raise
+
+        self._store(key, answer)
+        return answer
+
+    @staticmethod
+    def _key(resolver, qname, rdtype):
+        #Answers can differ between resolvers, e.g. DNSBLs only answer some name servers
+        return str(qname).lower(), rdtype, tuple(resolver.nameservers)
+
+    def _lookup(self, key):
+        """
+        @return: The cached answer for the key, or None on a miss.
+        @raise dns.exception.DNSException: The cached negative result.
+        """
+        cached = self._cache.get(key)
+        if isinstance(cached, _Negative):
+            with self._lock:
+                self.negative_hits += 1
+            raise cached.exception()
+        return cached
+
+    def _store(self, key, answer):
+        if answer.rrset is not None:
+            self._cache.put(key, answer, min(answer.rrset.ttl, self.max_ttl))
+
+    def _store_negative(self, key, exception):
+        self._cache.put(key, _Negative(exception), self._negative_ttl(exception))
+
+    def _negative_ttl(self, exception):
+        """
+        Finds the negative caching TTL for an NXDOMAIN or NoAnswer result, which RFC 2308 defines as the smaller of
+        the TTL and MINIMUM field of the SOA record in the authority section.
+        """
+        responses = list()
+        try:
+            if isinstance(exception, dns.resolver.NXDOMAIN):
+                responses = list(exception.responses().values())
+            else:
+                responses = [exception.response()]
+        except (AttributeError, KeyError, TypeError):
+            #Older versions of dnspython don't keep the response
+            pass
+
+        for response in responses:
+            for rrset in getattr(response, 'authority', ()):
+                if rrset.rdtype == dns.rdatatype.SOA and len(rrset):
+                    return min(rrset.ttl, rrset[0].minimum, self.max_ttl)
+
+        return self.default_negative_ttl
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        """
+        @return: A dict of the cache's size and hit/miss counters.
+        """
+        stats = self._cache.stats()
+        with self._lock:
+            stats['negative_hits'] = self.negative_hits
+        return stats
+
+
+#The cache shared by everything in this process which performs DNS lookups
+shared_cache = DNSCache()
@@ -1,11 +1,43 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# Pluggable 3rd party services queried for additional info about the hosts found
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import threading
+import time
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from lrucache import LRUCache
 
+#Seconds a provider may take to answer a single query before its result is given up on
+DEFAULT_TIMEOUT = 3.0
+#Seconds results are cached for
+RESULT_TTL = 3600
+#Number of consecutive failures or time outs after which a provider is skipped
+FAILURE_THRESHOLD = 5
+#Seconds a failing provider is skipped for before it is tried again
+COOLDOWN = 60.0
 
-class ExtraInfoQuery(object):
+
+class ExtraInfoQuery(object, metaclass=ABCMeta):
     """
     Abstract superclass for classes which query 3rd party services for additional info about hosts.
     """
-    __metaclass__ = ABCMeta
+
+    #The name the provider is registered and reported under
+    strName = None
+    #Seconds the provider may take to answer a single query
+    fTimeout = DEFAULT_TIMEOUT
+    #False if query() only looks at the ip address, so its results can be shared between hostnames
+    bUsesHostname = True
 
     @abstractmethod
     def query(self, hostname, ipaddress):
@@ -18,5 +50,199 @@ class ExtraInfoQuery(object):
         @return A 2 part tuple of HTML compatible strings. The first should be a short representation of a few words.
          The second string should be a more detailed explanation of the result. If there is no additional information
          available, (None, None) should be returned.
+        @raise Exception: If the service couldn't be queried, which counts towards tripping the provider's circuit
+         breaker.
         """
         pass
+
+
+class CircuitBreaker(object):
+    """
+    Stops calls to a provider after it has failed several times in a row. Once the cool down has passed a single trial
+    call is let through, which either closes the breaker again or restarts the cool down.
+    """
+
+    def __init__(self, iThreshold=FAILURE_THRESHOLD, fCooldown=COOLDOWN, clock=time.monotonic):
+        self.iThreshold = iThreshold
+        self.fCooldown = fCooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.iFailures = 0
+        self._fOpenedAt = None
+        self._bTrialInFlight = False
+
+    def is_open(self):
+        with self._lock:
+            return self._fOpenedAt is not None and self._clock() - self._fOpenedAt < self.fCooldown
+
+    def allow(self):
+        """
+        @return: True if a call may be made now.
+        """
+        with self._lock:
+            if self._fOpenedAt is None:
+                return True
+            if self._clock() - self._fOpenedAt < self.fCooldown or self._bTrialInFlight:
+                return False
+            self._bTrialInFlight = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.iFailures = 0
+            self._fOpenedAt = None
+            self._bTrialInFlight = False
+
+    def failure(self):
+        with self._lock:
+            self.iFailures += 1
+            if self._bTrialInFlight or self.iFailures >= self.iThreshold:
+                self._fOpenedAt = self._clock()
+            self._bTrialInFlight = False
+
+
+class ProviderStats(object):
+    """Call counts and latencies of one provider."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.iCalls = 0
+        self.iFailures = 0
+        self.iTimeouts = 0
+        self.iSkipped = 0
+        self.iCacheHits = 0
+        self.fTotalLatency = 0.0
+        self.fMaxLatency = 0.0
+
+    def record(self, fLatency, bFailed=False, bTimedOut=False):
+        with self._lock:
+            self.iCalls += 1
+            self.iFailures += bFailed
+            self.iTimeouts += bTimedOut
+            self.fTotalLatency += fLatency
+            self.fMaxLatency = max(self.fMaxLatency, fLatency)
+
+    def skipped(self):
+        with self._lock:
+            self.iSkipped += 1
+
+    def cache_hit(self):
+        with self._lock:
+            self.iCacheHits += 1
+
+    def reprJSON(self):
+        with self._lock:
+            return dict(calls=self.iCalls, failures=self.iFailures, timeouts=self.iTimeouts, skipped=self.iSkipped,
+                        cache_hits=self.iCacheHits, mean_latency=self.fTotalLatency / self.iCalls if self.iCalls else 0.0,
+                        max_latency=self.fMaxLatency)
+
+
+class ProviderRegistry(object):
+    """
+    Runs every enabled ExtraInfoQuery provider for a host's addresses in parallel. Each provider has its own time out
+    and circuit breaker, so a slow or failing 3rd party only loses its own results rather than holding up the lookup.
+    Results are cached, and each provider's latency is recorded. Safe to share between threads.
+    """
+
+    def __init__(self, iWorkers=20, iCacheSize=10000, fTTL=RESULT_TTL, clock=time.monotonic):
+        """
+        @param iWorkers: The maximum number of provider queries in flight at once.
+        @param iCacheSize: The maximum number of results to cache.
+        @param fTTL: Seconds to cache results for.
+        @param clock: The function returning the current time in seconds, replaceable for testing.
+        """
+        self._clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=iWorkers)
+        self._cache = LRUCache(maxsize=iCacheSize, ttl=fTTL, clock=clock)
+        #name -> (provider, CircuitBreaker, ProviderStats), in registration order
+        self._providers = dict()
+
+    def register(self, provider):
+        """
+        Enables a provider, replacing any already registered under the same name.
+
+        @param provider: The ExtraInfoQuery instance.
+        """
+        self._providers[provider.strName] = (provider, CircuitBreaker(clock=self._clock), ProviderStats())
+
+    def unregister(self, strName):
+        self._providers.pop(strName, None)
+
+    def providers(self):
+        """
+        @return: The names of the registered providers.
+        """
+        return list(self._providers)
+
+    def _call(self, provider, hostname, ipaddress):
+        """
+        @return: A tuple of how long the query took, its result and the exception it raised, if any. The breaker and
+        stats are left to the caller, so that a call which has already been given up on isn't counted twice.
+        """
+        fStart = self._clock()
+        try:
+            result = provider.query(hostname, ipaddress)
+            return self._clock() - fStart, result, None
+        except Exception as e:
+            return self._clock() - fStart, None, e
+
+    def query(self, hostname, lstIPs):
+        """
+        Queries every registered provider about each of the addresses, waiting no longer than the slowest provider's
+        time out. Providers whose circuit breaker is open are skipped.
+
+        @param hostname: The hostname the addresses belong to.
+        @param lstIPs: The ip addresses to query about.
+        @return: A dict of provider name to a dict of ip address to its (short, detail) tuple. Addresses the provider
+        had nothing to say about, or which failed or timed out, are left out.
+        """
+        fStart = self._clock()
+        lstCalls = list()
+        dictResults = dict()
+        for strName, (provider, breaker, stats) in list(self._providers.items()):
+            for strIP in set(lstIPs):
+                key = (strName, hostname if provider.bUsesHostname else None, strIP)
+                result = self._cache.get(key)
+                if result is not None:
+                    stats.cache_hit()
+                    if result[0] is not None:
+                        dictResults.setdefault(strName, dict())[strIP] = result
+                elif breaker.allow():
+                    lstCalls.append((strName, strIP, key, provider, breaker, stats,
+                                     self._executor.submit(self._call, provider, hostname, strIP)))
+                else:
+                    stats.skipped()
+
+        for strName, strIP, key, provider, breaker, stats, future in lstCalls:
+            try:
+                fLatency, result, exception = future.result(max(0, fStart + provider.fTimeout - self._clock()))
+            except TimeoutError:
+                #The call carries on in the background, but its result is no longer wanted
+                future.cancel()
+                breaker.failure()
+                stats.record(provider.fTimeout, bTimedOut=True)
+                continue
+
+            if exception is not None:
+                breaker.failure()
+                stats.record(fLatency, bFailed=True)
+                continue
+            breaker.success()
+            stats.record(fLatency)
+
+            result = tuple(result) if result else (None, None)
+            self._cache.put(key, result)
+            if result[0] is not None:
+                dictResults.setdefault(strName, dict())[strIP] = result
+
+        return dictResults
+
+    def stats(self):
+        """
+        @return: A dict of provider name to its call counts, latencies and whether its circuit breaker is open.
+        """
+        dictStats = dict()
+        for strName, (provider, breaker, stats) in list(self._providers.items()):
+            dictStats[strName] = stats.reprJSON()
+            dictStats[strName]['open'] = breaker.is_open()
+        return dictStats
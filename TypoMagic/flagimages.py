@@ -0,0 +1,56 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# In memory copy of the flag images shown for the country of each address
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import hashlib
+import os
+
+FLAG_DIR = "flags/flags-iso/shiny/16"
+UNKNOWN = "_unknown"
+
+
+class FlagImages(object):
+    """
+    The flag images of one size, read once at start up so that serving a flag doesn't touch the disk. Each image has an
+    ETag, so browsers can revalidate their copy without it being sent again.
+    """
+
+    def __init__(self, strDir=FLAG_DIR):
+        """
+        @param strDir: The directory of flag images, named by ISO country code e.g. GB.png.
+        """
+        self.strDir = strDir.strip("/")
+        #country code -> (image, ETag)
+        self._images = dict()
+        for strFile in os.listdir(strDir):
+            strCode, strExt = os.path.splitext(strFile)
+            if strExt == ".png":
+                with open(os.path.join(strDir, strFile), "rb") as f:
+                    data = f.read()
+                self._images[strCode] = (data, '"' + hashlib.sha1(data).hexdigest()[:16] + '"')
+
+    def get(self, strCountryCode):
+        """
+        @param strCountryCode: The ISO country code, or None if it isn't known.
+        @return: A tuple of the flag image for the country and its ETag, which is the unknown flag if there isn't one.
+        """
+        return self._images.get(strCountryCode or UNKNOWN) or self._images[UNKNOWN]
+
+    def get_path(self, strPath):
+        """
+        @param strPath: The request path of an image e.g. /flags/flags-iso/shiny/16/GB.png.
+        @return: A tuple of the image and its ETag, or None if the path isn't one of these flags.
+        """
+        strDir, strFile = os.path.split(strPath.strip("/"))
+        strCode, strExt = os.path.splitext(strFile)
+        if strDir != self.strDir or strExt != ".png":
+            return None
+        return self._images.get(strCode)
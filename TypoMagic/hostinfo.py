@@ -10,9 +10,42 @@
 # Released under AGPL see LICENSE for more information#
 #
 
+import time
+
 import dns.resolver
 import pygeoip
 
+import dnscache
+import metrics
+from lrucache import LRUCache
+
+#Number of address to country lookups to cache
+GEO_CACHE_SIZE = 100000
+
+_dns_seconds = metrics.histogram("typofinder_dns_query_seconds",
+                                 "DNS lookups by record type and outcome, including those answered from the cache",
+                                 ("rdtype", "outcome"))
+_geoip_seconds = metrics.histogram("typofinder_geoip_lookup_seconds",
+                                   "GeoIP database lookups, which are only made for addresses not in the cache")
+
+
+def query_outcome(exception):
+    """
+    @param exception: The exception raised by a DNS lookup, or None if it succeeded.
+    @return: The outcome label the lookup is recorded under.
+    """
+    if exception is None:
+        return "answer"
+    elif isinstance(exception, dns.resolver.NXDOMAIN):
+        return "nxdomain"
+    elif isinstance(exception, dns.resolver.NoAnswer):
+        return "noanswer"
+    elif isinstance(exception, dns.exception.Timeout):
+        return "timeout"
+    elif isinstance(exception, dns.resolver.NoNameservers):
+        return "servfail"
+    return "error"
+
 
 class hostinfo(object):
     """Host information class"""
@@ -24,26 +57,34 @@ class hostinfo(object):
         self._resolver = dns.resolver.Resolver()
         self._resolver.Timeout = 2.0
         self._resolver.lifetime = 2.0
-        self._resolver.cache = dns.resolver.LRUCache()
+        #Caching is done by the process wide dnscache.shared_cache instead
+        self._resolver.cache = None
         self._resolver.search = list() #Ensure no search suffixes
-        self._gi = pygeoip.GeoIP('datasources/GeoIP.dat')
-        self._giv6 = pygeoip.GeoIP('datasources/GeoIPv6.dat')
+        #The databases are held in memory, which avoids a seek and read per lookup and the lock around them
+        self._gi = pygeoip.GeoIP('datasources/GeoIP.dat', pygeoip.MEMORY_CACHE)
+        self._giv6 = pygeoip.GeoIP('datasources/GeoIPv6.dat', pygeoip.MEMORY_CACHE)
+        #address -> country code, or "" if it isn't known
+        self._geocache = LRUCache(maxsize=GEO_CACHE_SIZE)
+
+    @staticmethod
+    def domainname(prefix, sHostname):
+        if prefix:
+            return dns.name.from_text(prefix + '.' + sHostname, origin=dns.name.root)
+        else:
+            return dns.name.from_text(sHostname, origin=dns.name.root)
 
     def do_query(self, prefix, sHostname, rdatatype):
-        try:
-            if prefix:
-                domainname = dns.name.from_text(prefix + '.' + sHostname, origin=dns.name.root)
-            else:
-                domainname = dns.name.from_text(sHostname, origin=dns.name.root)
-
-            dnsAnswers = self._resolver.query(domainname, rdatatype)
-            return dnsAnswers
-        except dns.exception.Timeout:
-            return None
-        except dns.resolver.NoAnswer:
-            return None
-        except dns.resolver.NoNameservers:
-            return None
+        with _dns_seconds.time(rdtype=dns.rdatatype.to_text(rdatatype), outcome="answer") as dictLabels:
+            try:
+                domainname = self.domainname(prefix, sHostname)
+
+                dnsAnswers = dnscache.shared_cache.query(self._resolver, domainname, rdatatype)
+                return dnsAnswers
+            except Exception as e:
+                dictLabels['outcome'] = query_outcome(e)
+                if isinstance(e, (dns.exception.Timeout, dns.resolver.NoAnswer, dns.resolver.NoNameservers)):
+                    return None
+                raise
 
     def getWWW(self, sHostname):
         return self.do_query('www', sHostname, self.A_type)
@@ -76,37 +117,38 @@ class hostinfo(object):
     def getIPv6(self, sHostname):
         return self.do_query(None, sHostname, self.AAAA_type)
 
+    def _geo_lookup(self, gi, sIP):
+        #Keyed on the database too, as an IPv4 address looked up in the IPv6 one has no country
+        key = (gi is self._giv6, sIP)
+        strCountryCode = self._geocache.get(key)
+        if strCountryCode is None:
+            fStart = time.perf_counter()
+            try:
+                # Geo Location
+                strCountryCode = gi.country_code_by_addr(sIP) or ""
+            except Exception:
+                strCountryCode = ""
+            _geoip_seconds.observe(time.perf_counter() - fStart)
+            self._geocache.put(key, strCountryCode)
+        return strCountryCode or None
+
     def getGeobyIP(self, sIP):
-        try:
-            # Geo Location
-            return self._gi.country_code_by_addr(sIP)
-        except Exception:
-            pass
-    
+        return self._geo_lookup(self._gi, sIP)
+
     def getGeobyIPv6(self, sIP):
-        try:
-            # Geo Location
-            return self._giv6.country_code_by_addr(sIP)
-        except Exception:
-            pass
-
-    #
-    # these are used by the v2 AJAX API
-    #
-    def getGeoImagebyIPv4new(self, sIP):
-        try:
-            countrycode = self.getGeobyIP(sIP)
-            if countrycode:
-                return "/flags/flags-iso/shiny/16/"+ countrycode + ".png"
-        except Exception:
-            pass
-        return "/flags/flags-iso/shiny/16/_unknown.png"
-
-    def getGeoImagebyIPv6new(self, sIP):
-        try:
-            countrycode = self.getGeobyIPv6(sIP)
-            if countrycode:
-                return "/flags/flags-iso/shiny/16/"+ countrycode + ".png"
-        except Exception:
-            pass
-        return "/flags/flags-iso/shiny/16/_unknown.png"
+        return self._geo_lookup(self._giv6, sIP)
+
+    def getGeo(self, sIP):
+        """
+        @param sIP: An IPv4 or IPv6 address.
+        @return: The ISO country code of the address, or None if it isn't known.
+        """
+        if ':' in sIP:
+            return self.getGeobyIPv6(sIP)
+        return self.getGeobyIP(sIP)
+
+    def geo_cache_stats(self):
+        """
+        @return: A dict of the address to country cache's size and hit/miss counters.
+        """
+        return self._geocache.stats()
@@ -17,6 +17,10 @@ var intPBarMax = 0;
 var intPBarCount = 0;
 var domainsNoResults = [];
 var masterData = null;
+// number of domains sent to the server per entities.ncc request
+var intBatchSize = 25;
+// country code of each address, looked up with geo.ncc for a whole batch of domains at once
+var geoCountries = {};
 
 
 // -------------------------------------
@@ -61,6 +65,9 @@ function getCookies() {
     }
 
     document.getElementById('doppelganger').checked = isCookieSet("typofinder-doppelganger");
+    if (getCookie("typofinder-countrycodeamount") != "") {
+        document.getElementById('countrycodeamount').value = getCookie("typofinder-countrycodeamount");
+    }
     document.getElementById('noreg').checked = isCookieSet("typofinder-noreg");
 
     try {
@@ -92,6 +99,25 @@ function getCookies() {
     }
 }
 
+// -------------------------------------
+// Populate the keyboard layouts from
+// those available on the server
+// -------------------------------------
+function getKeyboards() {
+    $.getJSON("./keyboards.ncc", function (data) {
+        var strSelected = getCookie("typofinder-keyboard");
+        var domSelect = $("#keyboard");
+        domSelect.empty();
+        for (var intCount = 0; intCount < data.length; intCount++) {
+            var domOption = $("<option></option>").attr("value", data[intCount]).text(data[intCount]);
+            if (data[intCount] == strSelected) {
+                domOption.attr("selected", "selected");
+            }
+            domSelect.append(domOption);
+        }
+    });
+}
+
 // -------------------------------------
 // Get the original domains data
 // -------------------------------------
@@ -183,6 +209,18 @@ function generateTag(data) {
         bVal = true;
     }
 
+    // DNS block lists
+    if (data.DNSBL && Object.keys(data.DNSBL).length > 0) {
+        strTag = strTag + "DNSBLAlert ";
+        bVal = true;
+    }
+
+    // 3rd party services
+    if (data.ExtraInfo && Object.keys(data.ExtraInfo).length > 0) {
+        strTag = strTag + "ExtraInfoAlert ";
+        bVal = true;
+    }
+
 
     if (bVal == true) return strTag;
     else {
@@ -192,37 +230,95 @@ function generateTag(data) {
 }
 
 // -------------------------------------
-// this returns an image DOM object
-// for the flag for the geo of the 
-// IPv4 address
+// this returns the URL of the flag for
+// the geo of the address, which must
+// have been looked up by lookupGeo
+// -------------------------------------
+function geoIPImageURL(sIP) {
+    var strCountry = geoCountries[sIP];
+    return "./flags/flags-iso/shiny/16/" + (strCountry ? strCountry : "_unknown") + ".png";
+}
+
+// -------------------------------------
+// this adds the flag for the geo of
+// the IPv4 address
 // -------------------------------------
 function geoIPImageIPv4(sIP, strTBL) {
-    var URL = "./geov4.ncc/" + sIP;
-    var img = document.createElement('img');
-    img.src = URL;
     if (strTBL != null) {
-        strTBL = strTBL + "<img src =\"" + URL + "\"><br/>"; // this is horrible and dangerous
+        strTBL = strTBL + "<img src =\"" + geoIPImageURL(sIP) + "\"><br/>"; // this is horrible and dangerous
     }
 
     return strTBL;
 }
 
 // -------------------------------------
-// this returns an image DOM object
-// for the flag for the geo of the 
-// IPv6 address
+// this adds the flag for the geo of
+// the IPv6 address
 // -------------------------------------
 function geoIPImageIPv6(sIP, strTBL) {
-    var URL = "./geov6.ncc/" + sIP;
-    var img = document.createElement('img');
-    img.src = URL;
     if (strTBL != null) {
-        strTBL = strTBL + "<img src =\"" + URL + "\"><br/>"; // this is horrible and dangerous
+        strTBL = strTBL + "<img src =\"" + geoIPImageURL(sIP) + "\"><br/>"; // this is horrible and dangerous
     }
 
     return strTBL;
 }
 
+// -------------------------------------
+// this returns every address of the
+// domain which gets a flag
+// -------------------------------------
+function entityAddresses(data) {
+    var aIPs = data.IPv4Addresses.concat(data.IPv6Addresses, data.wwwv4, data.wwwv6, data.mv4, data.mv6,
+                                         data.webmailv4, data.webmailv6);
+    for (var sMX in data.aMXIPv4) {
+        aIPs = aIPs.concat(data.aMXIPv4[sMX]);
+    }
+    for (var sMX in data.aMXIPv6) {
+        aIPs = aIPs.concat(data.aMXIPv6[sMX]);
+    }
+    return aIPs;
+}
+
+// -------------------------------------
+// this looks up the countries of the
+// addresses of a batch of domains in
+// one request, then calls fnDone
+// -------------------------------------
+function lookupGeo(aEntities, fnDone) {
+    var aIPs = [];
+    for (var intCount = 0; intCount < aEntities.length; intCount++) {
+        if (aEntities[intCount] == null) {
+            continue;
+        }
+        var aEntityIPs = entityAddresses(aEntities[intCount]);
+        for (var intIP = 0; intIP < aEntityIPs.length; intIP++) {
+            if (!(aEntityIPs[intIP] in geoCountries) && aIPs.indexOf(aEntityIPs[intIP]) < 0) {
+                aIPs.push(aEntityIPs[intIP]);
+            }
+        }
+    }
+
+    if (aIPs.length == 0) {
+        fnDone();
+        return;
+    }
+
+    $.ajax({
+        type: "POST",
+        url: "./geo.ncc",
+        data: { ip: aIPs },
+        traditional: true,
+        dataType: 'json'
+    })
+        .done(function (data) {
+            $.extend(geoCountries, data);
+        })
+        .fail(function (xhr, textStatus, errorThrown) {
+            console.log("Error " + textStatus + " " + errorThrown + " looking up countries");
+        })
+        .always(fnDone);
+}
+
 // -------------------------------------
 // this generates the results table row contents for this domain
 // -------------------------------------
@@ -322,6 +418,25 @@ function fillDetails(data) {
         }
     }
 
+    // DNS block list listings of any of the addresses, shown along with the safe browsing result
+    var strTBLReputation = data.SafeBrowsing;
+    if (data.DNSBL) {
+        for (var sIP in data.DNSBL) {
+            for (intCount = 0; intCount < data.DNSBL[sIP].length; intCount++) {
+                var listing = data.DNSBL[sIP][intCount];
+                strTBLReputation = strTBLReputation + "<br/>" + $('<div/>').text(sIP + " listed by " + listing.zone + " (" + listing.codes.join(", ") + ") " + listing.detail).html();
+            }
+        }
+    }
+    // the services give HTML compatible results
+    if (data.ExtraInfo) {
+        for (var sProvider in data.ExtraInfo) {
+            for (var sIP in data.ExtraInfo[sProvider]) {
+                strTBLReputation = strTBLReputation + "<br/>" + $('<div/>').text(sIP + ": ").html() + data.ExtraInfo[sProvider][sIP].join(" ");
+            }
+        }
+    }
+
     var strDomain = "";
 
     if (document.getElementById("host").value == data.strDomain) {
@@ -340,7 +455,7 @@ function fillDetails(data) {
                                                     strTBLwww, // www.
                                                     strTBLwebmail, // webmail.
                                                     strTBLm, // m.
-                                                    data.SafeBrowsing // safe browsing
+                                                    strTBLReputation // safe browsing and DNS block lists
                                                 ]
                                             );
 
@@ -370,55 +485,61 @@ function unVeil()
 // this is called for each domain
 // to parse the JSON results
 // -------------------------------------
-function loadDetails(strDomain) {
-    var URL = "./entity.ncc";
+function processDetails(strDomain, data) {
 
-    //console.log("processing " + strDomain);
-
-    $.post(URL, { host: strDomain }, function (data) {
-
-        intPBarCount++;
+    intPBarCount++;
 
-        //console.log("processed " + strDomain);
-        var strTag = generateTag(data);
-        //console.log("got tag " + strDomain);
-        if (strTag != null && data != null) {
-            //console.log("filling " + strDomain);
-            fillDetails(data);
-            //console.log("filled " + strDomain);
-        } else {
-            // Add the no results row to the table
-            //console.log("no results for " + strDomain);
-            $('#notregtabletable').dataTable().fnAddData(
-                                                [
-                                                    strDomain // domain
-                                                ]
-                                            );
-        }
+    var strTag = null;
+    if (data != null) {
+        strTag = generateTag(data);
+    }
+    if (strTag != null) {
+        fillDetails(data);
+    } else {
+        // Add the no results row to the table
+        $('#notregtabletable').dataTable().fnAddData(
+                                            [
+                                                strDomain // domain
+                                            ]
+                                        );
+    }
 
+    if (intPBarCount >= intPBarMax) {
+        unVeil();
+    }
 
+    $("#progressbar").progressbar("option", "value", intPBarCount);
+}
 
-        if (intPBarCount >= intPBarMax) {
-            unVeil();
-        } else {
-            //console.log(intPBarCount + " of " + intPBarMax);
-        }
+// -------------------------------------
+// this is called for a batch of domains
+// which the server resolves concurrently
+// -------------------------------------
+function loadDetailsBatch(aDomains) {
+    var URL = "./entities.ncc";
 
-        $("#progressbar").progressbar("option", "value", intPBarCount);
+    $.ajax({
+        type: "POST",
+        url: URL,
+        data: { host: aDomains },
+        traditional: true,
+        dataType: 'json'
     })
+        .done(function (data) {
+            lookupGeo(data, function () {
+                for (var intCount = 0; intCount < aDomains.length; intCount++) {
+                    processDetails(aDomains[intCount], data[intCount]);
+                }
+            });
+        })
         .fail(function (xhr, textStatus, errorThrown) {
-            console.log("Error " + textStatus + " " + errorThrown + " " + strDomain);
-            intPBarCount++;
+            console.log("Error " + textStatus + " " + errorThrown + " " + aDomains.join(", "));
+            intPBarCount += aDomains.length;
             if (intPBarCount >= intPBarMax) {
                 unVeil();
-            } else {
-                //console.log(intPBarCount + " of " + intPBarMax);
             }
             $("#progressbar").progressbar("option", "value", intPBarCount);
-        })
-        .always(function (data) {
-
-        }, 'json');
+        });
 }
 
 
@@ -660,6 +781,9 @@ $(document).ready(function () {
     // Read the cookie values if present from a previous session
     getCookies();
 
+    // Load the keyboard layouts, selecting the one from a previous session
+    getKeyboards();
+
     // Submit function processing
     $("#typogulator").submit(function () {
 
@@ -740,6 +864,12 @@ $(document).ready(function () {
             setCookie("typofinder-doppelganger", false, 365);
         }
 
+        try {
+            setCookie("typofinder-countrycodeamount", document.getElementById('countrycodeamount').value, 365);
+        } catch (err) {
+            setCookie("typofinder-countrycodeamount", 0, 365);
+        }
+
         try {
             setCookie("typofinder-noreg", document.getElementById('noreg').checked, 365);
         } catch (err) {
@@ -768,6 +898,12 @@ $(document).ready(function () {
             setCookie("typofinder-allresults", document.getElementById('allresults'), true, 365);
         }
 
+        try {
+            setCookie("typofinder-keyboard", document.getElementById('keyboard').value, 365);
+        } catch (err) {
+            setCookie("typofinder-keyboard", "gb", 365);
+        }
+
         //Do the AJAX post
         var typogulator = $("#typogulator");
         $.post(typogulator.attr("action"), typogulator.serialize(), function (data) {
@@ -781,10 +917,9 @@ $(document).ready(function () {
             // Get the original domains data
             getMasterData();
 
-            // now loop through and process them
-            for (var key in data) {
-                // the success function
-                loadDetails(data[key]);
+            // now process them in batches, each of which the server resolves concurrently
+            for (var intStart = 0; intStart < data.length; intStart += intBatchSize) {
+                loadDetailsBatch(data.slice(intStart, intStart + intBatchSize));
             }
 
 
@@ -0,0 +1,94 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# Thread safe, size bounded LRU cache with per entry expiry
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A size bounded cache which evicts the least recently used entry when full. Entries may also be given a time to
+    live, after which they're treated as missing. Safe to share between threads.
+    """
+
+    def __init__(self, maxsize=10000, ttl=None, clock=time.monotonic):
+        """
+        @param maxsize: The maximum number of entries to hold.
+        @param ttl: The default time to live of an entry in seconds, or None for entries to never expire.
+        @param clock: The function returning the current time in seconds, replaceable for testing.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        @return: The cached value for key, or default if it is missing or has expired.
+        """
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires is not None and expires <= self._clock():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl=None):
+        """
+        Adds or replaces the cached value for key.
+
+        @param ttl: The time to live in seconds, overriding the cache's default.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        expires = None if ttl is None else self._clock() + ttl
+
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def remove(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """
+        @return: A dict of the cache's size and hit/miss counters.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(size=len(self._data), maxsize=self.maxsize, hits=self.hits, misses=self.misses,
+                        evictions=self.evictions, hit_ratio=(self.hits / lookups) if lookups else 0.0)
@@ -0,0 +1,230 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# Process wide counters, gauges and latency histograms, served in the Prometheus text format
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+#Upper bounds of the latency histogram buckets in seconds, from in memory lookups up to network time outs
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(lstNames, lstValues):
+    if not lstNames:
+        return ""
+    return "{" + ",".join('%s="%s"' % (strName, _escape(value)) for strName, value in zip(lstNames, lstValues)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(object):
+    strType = None
+
+    def __init__(self, strName, strHelp, lstLabelNames=()):
+        """
+        @param strName: The metric name, e.g. typofinder_dns_query_seconds.
+        @param strHelp: A description of what is measured.
+        @param lstLabelNames: The names of the labels each sample is broken down by.
+        """
+        self.strName = strName
+        self.strHelp = strHelp
+        self.lstLabelNames = tuple(lstLabelNames)
+        self._lock = threading.Lock()
+        #label values tuple -> value
+        self._values = dict()
+
+    def _key(self, dictLabels):
+        return tuple(str(dictLabels.get(strName, "")) for strName in self.lstLabelNames)
+
+    def render(self):
+        """
+        @return: The lines of the metric in the Prometheus text format.
+        """
+        lstLines = ["# HELP %s %s" % (self.strName, self.strHelp), "# TYPE %s %s" % (self.strName, self.strType)]
+        with self._lock:
+            lstSamples = sorted(self._values.items())
+        for key, value in lstSamples:
+            lstLines.append(self.strName + _format_labels(self.lstLabelNames, key) + " " + _format_value(value))
+        return lstLines
+
+
+class Counter(_Metric):
+    """A count which only goes up."""
+
+    strType = "counter"
+
+    def inc(self, amount=1, **dictLabels):
+        key = self._key(dictLabels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value which goes up and down, such as the number of requests in flight."""
+
+    strType = "gauge"
+
+    def set(self, value, **dictLabels):
+        with self._lock:
+            self._values[self._key(dictLabels)] = value
+
+    def inc(self, amount=1, **dictLabels):
+        key = self._key(dictLabels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **dictLabels):
+        self.inc(-amount, **dictLabels)
+
+
+class Callback(_Metric):
+    """A metric whose samples are read from elsewhere each time the metrics are rendered, e.g. a cache's counters."""
+
+    def __init__(self, strName, strHelp, strType, fnCollect, lstLabelNames=()):
+        """
+        @param strType: "counter" or "gauge".
+        @param fnCollect: The function returning the current value, or with labels a dict of label values tuple to
+        value.
+        """
+        super(Callback, self).__init__(strName, strHelp, lstLabelNames)
+        self.strType = strType
+        self._fnCollect = fnCollect
+
+    def render(self):
+        try:
+            values = self._fnCollect()
+        except Exception:
+            #A broken collector mustn't take the rest of the metrics down with it
+            values = dict()
+        if not self.lstLabelNames:
+            values = {(): values}
+        with self._lock:
+            self._values = dict((tuple(str(v) for v in key), value) for key, value in values.items())
+        return super(Callback, self).render()
+
+
+class Histogram(_Metric):
+    """Counts observations, such as latencies, into cumulative buckets, along with their count and sum."""
+
+    strType = "histogram"
+
+    def __init__(self, strName, strHelp, lstLabelNames=(), lstBuckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(strName, strHelp, lstLabelNames)
+        self.lstBuckets = tuple(sorted(lstBuckets)) + (float("inf"), )
+
+    def observe(self, value, **dictLabels):
+        key = self._key(dictLabels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                #[per bucket counts, sum]
+                entry = [[0] * len(self.lstBuckets), 0.0]
+                self._values[key] = entry
+            for i, bound in enumerate(self.lstBuckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **dictLabels):
+        """
+        Observes how long the body of the with statement takes. Labels may be changed by the body, through the
+        yielded dict, e.g. to record the outcome.
+        """
+        fStart = time.perf_counter()
+        try:
+            yield dictLabels
+        finally:
+            self.observe(time.perf_counter() - fStart, **dictLabels)
+
+    def render(self):
+        lstLines = ["# HELP %s %s" % (self.strName, self.strHelp), "# TYPE %s %s" % (self.strName, self.strType)]
+        with self._lock:
+            lstSamples = sorted((key, (list(entry[0]), entry[1])) for key, entry in self._values.items())
+        for key, (lstCounts, fSum) in lstSamples:
+            iCumulative = 0
+            for bound, iCount in zip(self.lstBuckets, lstCounts):
+                iCumulative += iCount
+                lstLines.append(self.strName + "_bucket" +
+                                _format_labels(self.lstLabelNames + ("le", ), key + (_format_value(bound), )) +
+                                " " + str(iCumulative))
+            strLabels = _format_labels(self.lstLabelNames, key)
+            lstLines.append(self.strName + "_sum" + strLabels + " " + _format_value(fSum))
+            lstLines.append(self.strName + "_count" + strLabels + " " + str(iCumulative))
+        return lstLines
+
+
+class Registry(object):
+    """The set of metrics to render. Safe to share between threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        #name -> metric, in registration order
+        self._metrics = dict()
+
+    def register(self, metric):
+        """
+        @return: The metric, or the one already registered under its name, so modules can be reloaded safely.
+        """
+        with self._lock:
+            return self._metrics.setdefault(metric.strName, metric)
+
+    def unregister(self, strName):
+        with self._lock:
+            self._metrics.pop(strName, None)
+
+    def render(self):
+        """
+        @return: Every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            lstMetrics = list(self._metrics.values())
+        lstLines = list()
+        for metric in lstMetrics:
+            lstLines.extend(metric.render())
+        return "\n".join(lstLines) + "\n"
+
+
+#The registry served by the /metrics endpoint
+REGISTRY = Registry()
+
+
+def counter(strName, strHelp, lstLabelNames=()):
+    return REGISTRY.register(Counter(strName, strHelp, lstLabelNames))
+
+
+def gauge(strName, strHelp, lstLabelNames=()):
+    return REGISTRY.register(Gauge(strName, strHelp, lstLabelNames))
+
+
+def histogram(strName, strHelp, lstLabelNames=(), lstBuckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(strName, strHelp, lstLabelNames, lstBuckets))
+
+
+def callback(strName, strHelp, strType, fnCollect, lstLabelNames=()):
+    """
+    Registers a Callback metric, replacing any already registered under the same name so that it reads from the
+    latest objects.
+    """
+    REGISTRY.unregister(strName)
+    return REGISTRY.register(Callback(strName, strHelp, strType, fnCollect, lstLabelNames))
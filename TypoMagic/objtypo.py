@@ -30,6 +30,9 @@ class objtypo:
     aMX = []
     aMXIPv4 = dict()
     aMXIPv6 = dict()
+    DNSBL = dict()
+    ExtraInfo = dict()
+    bPartial = False
 
     def __init__(self):
         self.strDomain = ""
@@ -48,10 +51,38 @@ class objtypo:
         self.aMX = []
         self.aMXIPv4 = dict()
         self.aMXIPv6 = dict()
+        self.DNSBL = dict()
+        self.ExtraInfo = dict()
+        self.bPartial = False
+
+    def merge(self, other):
+        """
+        Adds the records found by another lookup of the same domain to this one.
+
+        @param other: The objtypo to copy records from.
+        """
+        self.IPv4Address.extend(other.IPv4Address)
+        self.IPV6Address.extend(other.IPV6Address)
+        if other.SafeBrowsing:
+            self.SafeBrowsing = other.SafeBrowsing
+        self.wwwv4.extend(other.wwwv4)
+        self.wwwv6.extend(other.wwwv6)
+        self.mv4.extend(other.mv4)
+        self.mv6.extend(other.mv6)
+        self.webmailv4.extend(other.webmailv4)
+        self.webmailv6.extend(other.webmailv6)
+        self.aMX.extend(other.aMX)
+        self.aMXIPv4.update(other.aMXIPv4)
+        self.aMXIPv6.update(other.aMXIPv6)
+        self.DNSBL.update(other.DNSBL)
+        for strProvider, dictResults in other.ExtraInfo.items():
+            self.ExtraInfo.setdefault(strProvider, dict()).update(dictResults)
+        self.bPartial = self.bPartial or other.bPartial
 
     # http://stackoverflow.com/questions/5160077/encoding-nested-python-object-in-json
     def reprJSON(self):
         return dict(strDomain=self.strDomain, strHost=self.strHost, bMX=self.bMX, bTypo=self.bTypo, IPv4Addresses=self.IPv4Address,
                     IPv6Addresses=self.IPV6Address, SafeBrowsing = self.SafeBrowsing, wwwv4 = self.wwwv4, wwwv6 = self.wwwv6,
                     mv4 = self.mv4, mv6 = self.mv6, webmailv4 = self.webmailv4, webmailv6 = self.webmailv6, aMX = self.aMX,
-                    aMXIPv4 = self.aMXIPv4, aMXIPv6 = self.aMXIPv6)
+                    aMXIPv4 = self.aMXIPv4, aMXIPv6 = self.aMXIPv6, DNSBL = self.DNSBL,
+                    ExtraInfo = self.ExtraInfo, bPartial = self.bPartial)
@@ -0,0 +1,226 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# Opt in sampling profiler for individual requests, written out as collapsed stacks for flame graphs
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+#The request header which asks for a request to be profiled
+HEADER = "X-Typofinder-Profile"
+#Seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+#The most requests profiled at once, so that profiling can't slow the server down much
+MAX_SESSIONS = 4
+#The directory profiles are written to by default
+PROFILE_DIR = "profiles"
+
+_local = threading.local()
+
+
+def collapse(frame):
+    """
+    @param frame: The innermost frame of a stack.
+    @return: The stack in the collapsed format, outermost frame first e.g. "TypoMagic.py:do_POST;typogen.py:bitflipstring"
+    """
+    lstFrames = list()
+    while frame is not None:
+        code = frame.f_code
+        lstFrames.append(os.path.basename(code.co_filename) + ":" + getattr(code, "co_qualname", code.co_name))
+        frame = frame.f_back
+    return ";".join(reversed(lstFrames))
+
+
+class Session(object):
+    """
+    The samples taken during one request, from the thread handling it and any worker threads which have joined it.
+    """
+
+    def __init__(self, profiler, strEndpoint, fInterval=SAMPLE_INTERVAL):
+        self._profiler = profiler
+        self.strEndpoint = strEndpoint
+        self.fInterval = fInterval
+        self.dictTags = dict()
+        #collapsed stack -> number of samples
+        self.samples = Counter()
+        self._lock = threading.Lock()
+        #thread ident -> name of the root frame its stacks are recorded under
+        self._threads = {threading.get_ident(): "request"}
+        self._stopped = threading.Event()
+        self.fStart = time.time()
+        self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        while not self._stopped.wait(self.fInterval):
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, strRoot in self._threads.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        self.samples[strRoot + ";" + collapse(frame)] += 1
+
+    def tag(self, **dictTags):
+        """
+        Records what the request was for, e.g. the domain and options, which are written alongside the samples.
+        """
+        self.dictTags.update(dictTags)
+
+    @contextmanager
+    def join(self):
+        """
+        Samples the current thread too for the duration of the with statement, e.g. while a pool worker runs part of
+        the request.
+        """
+        ident = threading.get_ident()
+        with self._lock:
+            bSampled = ident in self._threads
+            self._threads.setdefault(ident, "worker")
+        if bSampled:
+            #Already being sampled, e.g. run inline on the request's own thread
+            yield self
+            return
+
+        previous = getattr(_local, "session", None)
+        _local.session = self
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._threads.pop(ident, None)
+            _local.session = previous
+
+    def stop(self):
+        """
+        Stops sampling and writes the profile.
+
+        @return: The path of the collapsed stacks file, or None if it couldn't be written.
+        """
+        self._stopped.set()
+        self._sampler.join()
+        _local.session = None
+        self._profiler.release()
+        return self._profiler.write(self, time.time() - self.fStart)
+
+
+class Profiler(object):
+    """
+    Decides which requests to profile and writes their profiles to a directory. Each profile is a file of collapsed
+    stacks, as read by flamegraph.pl and speedscope, and a JSON file of the request's tags. Safe to share between
+    threads.
+    """
+
+    def __init__(self, strDir=PROFILE_DIR, fRate=0.0, fInterval=SAMPLE_INTERVAL, fnRandom=random.random):
+        """
+        @param strDir: The directory to write profiles to.
+        @param fRate: The fraction of requests to profile regardless of the header, from 0 to 1.
+        @param fInterval: Seconds between stack samples.
+        @param fnRandom: The function returning a random number in [0, 1), replaceable for testing.
+        """
+        self.strDir = strDir
+        self.fRate = fRate
+        self.fInterval = fInterval
+        self._fnRandom = fnRandom
+        self._lock = threading.Lock()
+        self._iSessions = 0
+        self._iWritten = 0
+
+    def wanted(self, headers):
+        """
+        @param headers: The request headers.
+        @return: True if the request asked to be profiled, or was picked at random.
+        """
+        strHeader = headers.get(HEADER)
+        if strHeader is not None and strHeader.strip().lower() not in ("", "0", "false", "no"):
+            return True
+        return self.fRate > 0 and self._fnRandom() < self.fRate
+
+    def start(self, strEndpoint):
+        """
+        Starts profiling the request being handled by the current thread.
+
+        @param strEndpoint: The endpoint the request is for.
+        @return: The Session, or None if too many requests are already being profiled.
+        """
+        with self._lock:
+            if self._iSessions >= MAX_SESSIONS:
+                return None
+            self._iSessions += 1
+        try:
+            session = Session(self, strEndpoint, self.fInterval)
+        except Exception:
+            #e.g. the sampler thread couldn't be started, which mustn't use up the slot for good
+            self.release()
+            raise
+        _local.session = session
+        return session
+
+    def release(self):
+        with self._lock:
+            self._iSessions -= 1
+
+    def write(self, session, fSeconds):
+        with self._lock:
+            self._iWritten += 1
+            iWritten = self._iWritten
+        strHost = re.sub(r"[^A-Za-z0-9.-]", "_", str(session.dictTags.get("host", "")))[:64]
+        strName = "%s-%d-%d-%s-%s" % (time.strftime("%Y%m%d-%H%M%S", time.localtime(session.fStart)), os.getpid(),
+                                      iWritten, session.strEndpoint, strHost)
+        strPath = os.path.join(self.strDir, strName.rstrip("-") + ".folded")
+        try:
+            os.makedirs(self.strDir, exist_ok=True)
+            with open(strPath, "w", encoding="utf-8") as f:
+                for strStack, iCount in sorted(session.samples.items()):
+                    f.write("%s %d\n" % (strStack, iCount))
+            with open(strPath[:-len(".folded")] + ".json", "w", encoding="utf-8") as f:
+                json.dump(dict(endpoint=session.strEndpoint, tags=session.dictTags, seconds=fSeconds,
+                               samples=sum(session.samples.values()), interval=session.fInterval), f, indent=1)
+        except (IOError, OSError):
+            print("[!] Unable to write profile to " + self.strDir)
+            return None
+        return strPath
+
+
+def current():
+    """
+    @return: The Session profiling the current thread, or None.
+    """
+    return getattr(_local, "session", None)
+
+
+def tag(**dictTags):
+    """
+    Tags the profile of the current request, if it's being profiled.
+    """
+    session = current()
+    if session is not None:
+        session.tag(**dictTags)
+
+
+def wrap(fn):
+    """
+    @param fn: A function to be run on another thread as part of the current request.
+    @return: A function which runs fn as part of the current request's profile, or fn if it isn't being profiled.
+    """
+    session = current()
+    if session is None:
+        return fn
+
+    def run(*args, **kwargs):
+        with session.join():
+            return fn(*args, **kwargs)
+    return run
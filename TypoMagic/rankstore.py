@@ -0,0 +1,157 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# Compact, memory-mapped store of domain popularity ranks
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import array
+import bisect
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+
+import datacache
+
+#File layout: header, then sorted array of 64 bit domain hashes, then the array of 32 bit ranks in the same order
+_MAGIC = b"TFRANK01"
+_HEADER = struct.Struct("=8s64sQ")
+
+
+def domain_hash(strDomain):
+    """
+    Maps a domain name to the 64 bit integer used as its key in the store.
+
+    @param strDomain: The domain name.
+    @return: The unsigned 64 bit hash.
+    """
+    return int.from_bytes(hashlib.blake2b(strDomain.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class RankStore(object):
+    """
+    Read only lookup of domain -> rank, backed by a memory-mapped file so that the pages are shared between every
+    process which opens the same store.
+    """
+
+    def __init__(self, strPath):
+        self._file = open(strPath, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            #Empty files can't be mapped
+            self._file.close()
+            raise ValueError("Invalid rank store " + strPath)
+
+        self._view = None
+        try:
+            magic, source_hash, count = _HEADER.unpack_from(self._mmap)
+        except struct.error:
+            magic = count = None
+        if magic != _MAGIC or len(self._mmap) != _HEADER.size + count * 12:
+            self.close()
+            raise ValueError("Invalid rank store " + strPath)
+
+        self.source_hash = source_hash.decode('ascii')
+        self._view = memoryview(self._mmap)
+        self._hashes = self._view[_HEADER.size:_HEADER.size + count * 8].cast('Q')
+        self._ranks = self._view[_HEADER.size + count * 8:].cast('I')
+
+    def lookup(self, strDomain):
+        """
+        @param strDomain: The domain name to look up.
+        @return: The rank of the domain, or None if it isn't in the store.
+        """
+        key = domain_hash(strDomain)
+        idx = bisect.bisect_left(self._hashes, key)
+        if idx < len(self._hashes) and self._hashes[idx] == key:
+            return self._ranks[idx]
+        return None
+
+    def __contains__(self, strDomain):
+        return self.lookup(strDomain) is not None
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def close(self):
+        if self._view is not None:
+            #The views must be released before the underlying mmap can be closed
+            self._hashes.release()
+            self._ranks.release()
+            self._view.release()
+            self._view = None
+            self._hashes = self._ranks = array.array('Q')
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+
+def build(strCsvPath, strStorePath, strHash=None):
+    """
+    Compiles a "rank,domain" CSV file, e.g. the Alexa top 1m list, into a rank store file.
+
+    @param strCsvPath: The path of the CSV file to read.
+    @param strStorePath: The path of the rank store file to write.
+    @param strHash: The datacache.source_hash of the CSV file, if already known.
+    """
+    if strHash is None:
+        strHash = datacache.source_hash([strCsvPath])
+
+    ranks = dict()
+    with open(strCsvPath) as csv:
+        for line in csv:
+            parts = line.rstrip().split(',', 1)
+            if len(parts) == 2:
+                key = domain_hash(parts[1])
+                rank = int(parts[0])
+                #Keep the best rank if a domain (or hash) appears more than once
+                if key not in ranks or rank < ranks[key]:
+                    ranks[key] = rank
+
+    keys = sorted(ranks)
+    hashes = array.array('Q', keys)
+    rank_values = array.array('I', (ranks[key] for key in keys))
+    del ranks
+
+    header = _HEADER.pack(_MAGIC, strHash.encode('ascii'), len(keys))
+
+    strDir = os.path.dirname(strStorePath) or '.'
+    os.makedirs(strDir, exist_ok=True)
+    fd, strTempPath = tempfile.mkstemp(dir=strDir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(header)
+        hashes.tofile(f)
+        rank_values.tofile(f)
+    os.chmod(strTempPath, 0o644)
+    os.replace(strTempPath, strStorePath)
+
+
+def load(strCsvPath, strStorePath):
+    """
+    Opens the rank store for the given CSV file, (re)building it first if it is missing or out of date.
+
+    @param strCsvPath: The path of the "rank,domain" CSV file the store is compiled from.
+    @param strStorePath: The path of the rank store file.
+    @return: The opened RankStore.
+    """
+    strHash = datacache.source_hash([strCsvPath])
+    try:
+        store = RankStore(strStorePath)
+        if store.source_hash == strHash:
+            return store
+        store.close()
+    except (OSError, ValueError):
+        #Missing or corrupt, fall through and rebuild it
+        pass
+
+    build(strCsvPath, strStorePath, strHash)
+    return RankStore(strStorePath)
@@ -0,0 +1,189 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# Persistent store of typo scan results, for detecting what has changed between bulk scans
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import hashlib
+import json
+import sqlite3
+import time
+
+STORE_VERSION = 1
+
+#Seconds between rechecks of a registered typo domain
+RECHECK_REGISTERED = 86400
+#Seconds between rechecks of an unregistered typo domain, which are the vast majority and rarely change
+RECHECK_UNREGISTERED = 7 * 86400
+#Seconds before the whois record of an unchanged domain is looked up again
+RECHECK_WHOIS = 7 * 86400
+
+#Number of updates between commits
+COMMIT_INTERVAL = 100
+
+#Change types reported by ResultStore.update
+NEW = "new"
+REGISTERED = "registered"
+CHANGED = "changed"
+DROPPED = "dropped"
+
+
+def is_registered(dictEntity):
+    """
+    @param dictEntity: The reprJSON() of an objtypo.
+    @return: True if the domain has any address or mail server records.
+    """
+    return bool(dictEntity['IPv4Addresses'] or dictEntity['IPv6Addresses'] or dictEntity['aMX'])
+
+
+def fingerprint(dictEntity, dictWhois):
+    """
+    @return: A digest of the scan result, which is the same for results that only differ in the order of their records.
+    """
+    dictComparable = dict()
+    for strKey, value in dictEntity.items():
+        if strKey == 'bPartial':
+            continue
+        if isinstance(value, list):
+            value = sorted(value)
+        elif isinstance(value, dict):
+            value = dict((k, sorted(v, key=lambda item: json.dumps(item, sort_keys=True)) if isinstance(v, list) else v)
+                         for k, v in value.items())
+        dictComparable[strKey] = value
+    dictComparable['whois'] = dictWhois
+
+    return hashlib.sha256(json.dumps(dictComparable, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class ResultStore(object):
+    """
+    A sqlite database holding the latest result for each typo domain, and when it is next due to be looked up again.
+    Must only be used from the thread which created it.
+    """
+
+    def __init__(self, strPath, iRecheckRegistered=RECHECK_REGISTERED, iRecheckUnregistered=RECHECK_UNREGISTERED,
+                 iRecheckWhois=RECHECK_WHOIS, clock=time.time):
+        """
+        @param strPath: The path of the database, which is created if it doesn't exist.
+        @param iRecheckRegistered: Seconds between rechecks of registered domains.
+        @param iRecheckUnregistered: Seconds between rechecks of unregistered domains.
+        @param iRecheckWhois: Seconds before a whois record is considered stale.
+        @param clock: The function returning the current time in seconds, replaceable for testing.
+        """
+        self.iRecheckRegistered = iRecheckRegistered
+        self.iRecheckUnregistered = iRecheckUnregistered
+        self.iRecheckWhois = iRecheckWhois
+        self._clock = clock
+        self._iUncommitted = 0
+
+        self._db = sqlite3.connect(strPath)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        iVersion = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if iVersion not in (0, STORE_VERSION):
+            raise ValueError("Unsupported result store version %d in %s" % (iVersion, strPath))
+
+        self._db.execute("""CREATE TABLE IF NOT EXISTS results (
+                                typo TEXT PRIMARY KEY,
+                                registered INTEGER NOT NULL,
+                                fingerprint TEXT NOT NULL,
+                                entity TEXT NOT NULL,
+                                whois TEXT,
+                                checked REAL NOT NULL,
+                                whois_checked REAL,
+                                changed REAL NOT NULL,
+                                next_check REAL NOT NULL)""")
+        self._db.execute("PRAGMA user_version = %d" % STORE_VERSION)
+        self._db.commit()
+
+    def due(self, lstTypos):
+        """
+        @param lstTypos: The typo domains to consider.
+        @return: The typos from lstTypos which have never been looked up, or whose recheck time has passed, in order.
+        """
+        fNow = self._clock()
+        dictNextCheck = dict(self._db.execute("SELECT typo, next_check FROM results"))
+        return [strTypo for strTypo in lstTypos if dictNextCheck.get(strTypo, 0) <= fNow]
+
+    def get_many(self, lstTypos):
+        """
+        @return: A dict of typo domain to its stored result, for each of lstTypos that has one. Each result is a dict of
+        its entity, whois, registered, checked, whois_checked and changed values.
+        """
+        dictResults = dict()
+        setTypos = set(lstTypos)
+        for row in self._db.execute("SELECT typo, entity, whois, registered, checked, whois_checked, changed FROM results"):
+            if row[0] in setTypos:
+                dictResults[row[0]] = dict(entity=json.loads(row[1]), whois=json.loads(row[2]) if row[2] else None,
+                                           registered=bool(row[3]), checked=row[4], whois_checked=row[5],
+                                           changed=row[6])
+        return dictResults
+
+    def whois_is_fresh(self, dictPrevious):
+        """
+        @param dictPrevious: A stored result from get_many, or None.
+        @return: True if the stored result has a whois record that doesn't need looking up again yet.
+        """
+        return bool(dictPrevious and dictPrevious['whois'] is not None and
+                    dictPrevious['whois_checked'] + self.iRecheckWhois > self._clock())
+
+    def update(self, strTypo, dictEntity, dictWhois, fWhoisChecked=None):
+        """
+        Records the latest result for a typo domain and schedules its next recheck. Partial results, where the lookup
+        ran out of time, aren't stored, so the typo stays due.
+
+        @param strTypo: The typo domain.
+        @param dictEntity: The reprJSON() of its objtypo.
+        @param dictWhois: Its parsed whois record, or None.
+        @param fWhoisChecked: When dictWhois was looked up, if not just now.
+        @return: How the result differs from the stored one, as one of NEW, REGISTERED, CHANGED or DROPPED, or None if
+        it hasn't changed in any way worth reporting.
+        """
+        if dictEntity.get('bPartial'):
+            return None
+
+        fNow = self._clock()
+        bRegistered = is_registered(dictEntity)
+        strFingerprint = fingerprint(dictEntity, dictWhois)
+
+        row = self._db.execute("SELECT registered, fingerprint, changed FROM results WHERE typo = ?",
+                               (strTypo, )).fetchone()
+        if row is None:
+            strChange = NEW if bRegistered else None
+            fChanged = fNow
+        elif row[1] == strFingerprint:
+            strChange = None
+            fChanged = row[2]
+        else:
+            if bRegistered and not row[0]:
+                strChange = REGISTERED
+            elif row[0] and not bRegistered:
+                strChange = DROPPED
+            else:
+                strChange = CHANGED
+            fChanged = fNow
+
+        fNextCheck = fNow + (self.iRecheckRegistered if bRegistered else self.iRecheckUnregistered)
+        self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (strTypo, int(bRegistered), strFingerprint, json.dumps(dictEntity),
+                          json.dumps(dictWhois, default=str) if dictWhois is not None else None, fNow,
+                          (fWhoisChecked or fNow) if dictWhois is not None else None, fChanged, fNextCheck))
+
+        self._iUncommitted += 1
+        if self._iUncommitted >= COMMIT_INTERVAL:
+            self.commit()
+
+        return strChange
+
+    def commit(self):
+        self._db.commit()
+        self._iUncommitted = 0
+
+    def close(self):
+        self.commit()
+        self._db.close()
@@ -1,19 +1,529 @@
-import datetime as DT
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# Google Safe Browsing (v4 Update API) client, which keeps a local database of hash prefixes so that most lookups are
+# answered without contacting Google
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import base64
+import codecs
+import hashlib
 import http.client
+import json
+import os
+import pickle
+import queue
+import tempfile
+import threading
+import time
 from urllib import parse
 
-# globals
-value = 0
-longtermthen = DT.datetime.now()
-now = DT.datetime.now()
+import datacache
+import metrics
+from lrucache import LRUCache
+
+API_HOST = "safebrowsing.googleapis.com"
+CLIENT_ID = "typofinder"
+CLIENT_VERSION = "2.0"
+
+#The threat lists kept locally, as (threat type, platform type, threat entry type)
+THREAT_LISTS = (("SOCIAL_ENGINEERING", "ANY_PLATFORM", "URL"),
+                ("MALWARE", "ANY_PLATFORM", "URL"),
+                ("UNWANTED_SOFTWARE", "ANY_PLATFORM", "URL"))
+
+#Google's preferred phrasing for each threat type, in order of precedence
+WARNINGS = (("SOCIAL_ENGINEERING", "Warning- Suspected phishing page. This page may be a forgery or imitation of another website, designed to trick users into sharing personal or financial information. Entering any personal information on this page may result in identity theft or other abuse. You can find out more about phishing from www.antiphishing.org."),
+            ("MALWARE", "Warning- Visiting this web site may harm your computer. This page appears to contain malicious code that could be downloaded to your computer without your consent. You can learn more about harmful web content including viruses and other malicious code and how to protect your computer at StopBadware.org."),
+            ("UNWANTED_SOFTWARE", "Warning- The site ahead may contain harmful programs. Attackers might attempt to trick you into installing programs that harm your browsing experience (for example, by changing your homepage or showing extra ads on sites you visit). You can learn more about unwanted software at https://www.google.com/about/company/unwanted-software-policy.html."))
+
+#The number of API requests allowed per day, and how many may be made in a burst
+DAILY_QUOTA = 10000
+BURST = 100
+#Seconds to wait for more lookups to join a batch of full hash checks
+BATCH_WINDOW = 0.05
+#Maximum number of idle connections kept open to the API
+POOL_SIZE = 4
+#Seconds to wait for the API to respond
+TIMEOUT = 10
+#Seconds between updates of the local database when the API doesn't say, and the most to back off for after errors
+DEFAULT_UPDATE_INTERVAL = 1800
+MAX_UPDATE_BACKOFF = 86400
+#Path the local database is saved to between restarts
+STATE_PATH = os.path.join(datacache.CACHE_DIR, "safebrowsing.pickle")
+STATE_VERSION = 1
+
+_lookup_seconds = metrics.histogram("typofinder_safebrowsing_lookup_seconds",
+                                    "Safe Browsing URL checks by outcome, most of which are answered locally",
+                                    ("outcome", ))
+_request_seconds = metrics.histogram("typofinder_safebrowsing_request_seconds",
+                                     "Requests made to the Safe Browsing API by method and outcome",
+                                     ("method", "outcome"))
+
+
+class SafeBrowsingError(Exception):
+    """The Safe Browsing API couldn't be queried."""
+    pass
+
+
+class TokenBucket(object):
+    """
+    Thread safe token bucket, allowing rate operations per second on average in bursts of up to capacity.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        """
+        @param rate: The number of tokens added per second.
+        @param capacity: The maximum number of tokens held, which the bucket starts full with.
+        @param clock: The function returning the current time in seconds, replaceable for testing.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens=1):
+        """
+        @return: True if the tokens were taken, False if there weren't enough.
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+
+def _duration(strDuration, default=0.0):
+    """
+    @param strDuration: An API duration such as "300.5s", or None.
+    @return: The duration in seconds.
+    """
+    if not strDuration:
+        return default
+    return float(strDuration.rstrip("s"))
+
+
+def url_expressions(strHostname):
+    """
+    The host suffix expressions which Safe Browsing matches the root URL of a host against, as described at
+    https://developers.google.com/safe-browsing/v4/urls-hashing
+
+    @param strHostname: The hostname, e.g. "www.example.co.uk".
+    @return: The list of expressions, e.g. ["www.example.co.uk/", "example.co.uk/", "co.uk/"].
+    """
+    strHostname = strHostname.strip(".").lower()
+    try:
+        strHostname = str(codecs.encode(strHostname, "idna"), "ascii")
+    except UnicodeError:
+        pass
+
+    lstComponents = strHostname.split(".")
+    lstHosts = [strHostname]
+    #Then up to four hosts formed from the last five components, removing the leading component each time
+    for i in range(max(1, len(lstComponents) - 5), len(lstComponents) - 1):
+        lstHosts.append(".".join(lstComponents[i:]))
+
+    return [strHost + "/" for strHost in lstHosts]
+
+
+class _Batch(object):
+    def __init__(self):
+        self.prefixes = set()
+        self.iMembers = 0
+        self.done = threading.Event()
+        self.error = None
+
+
+class SafeBrowsing(object):
+    """
+    Safe Browsing client which keeps the threat lists' hash prefixes locally, so that only hosts matching a prefix need
+    to be checked with Google. Those checks are batched between threads, cached for as long as Google allows, sent over
+    pooled connections and limited to the daily quota. Safe to share between threads.
+    """
+
+    def __init__(self, key, strHost=API_HOST, iPort=None, bTLS=True, strStatePath=None, bucket=None,
+                 clock=time.time, sleep=time.sleep):
+        """
+        @param key: The Google Safe Browsing API key.
+        @param strHost: The API hostname.
+        @param iPort: The API port, if not the default for the protocol.
+        @param bTLS: False to use plain HTTP, e.g. for a local test server.
+        @param strStatePath: The path to save the local database to between restarts, or None not to.
+        @param bucket: The TokenBucket limiting API requests, by default DAILY_QUOTA per day.
+        @param clock: The function returning the current time in seconds, replaceable for testing.
+        @param sleep: The function to wait with, replaceable for testing.
+        """
+        self.key = key
+        self.strHost = strHost
+        self.iPort = iPort
+        self.bTLS = bTLS
+        self.strStatePath = strStatePath
+        self._bucket = bucket or TokenBucket(DAILY_QUOTA / 86400.0, BURST)
+        self._clock = clock
+        self._sleep = sleep
+
+        self._pool = queue.LifoQueue(POOL_SIZE)
+
+        #(threat type, platform type, threat entry type) -> (client state, sorted list of prefixes)
+        self._lists = dict()
+        #prefix length -> set of prefixes, across all lists
+        self._prefixes = dict()
+        self._next_update = 0
+        self._update_errors = 0
+        self._update_lock = threading.Lock()
+        self._updating = False
+        #Set once there's a database to check against, either loaded or downloaded
+        self.ready = threading.Event()
+
+        #full hash -> frozenset of threat types, for each match's cache duration
+        self._full_hash_cache = LRUCache(100000)
+        #prefix -> True, for prefixes Google had no matches for, for the negative cache duration
+        self._negative_cache = LRUCache(100000)
+        self._next_find = 0
+
+        self._batch = None
+        self._batch_lock = threading.Lock()
+
+        self._load_state()
+        #The first download runs in the background too, rather than holding up the first lookups
+        self._ensure_updated()
+
+    #
+    # API requests
+    #
+    def _connect(self):
+        if self.bTLS:
+            return http.client.HTTPSConnection(self.strHost, self.iPort, timeout=TIMEOUT)
+        return http.client.HTTPConnection(self.strHost, self.iPort, timeout=TIMEOUT)
+
+    def _request(self, strMethod, dictBody):
+        """
+        POSTs a request to the API over a pooled connection.
+
+        @param strMethod: The API method, e.g. "threatListUpdates:fetch".
+        @param dictBody: The JSON request body.
+        @return: The decoded JSON response.
+        @raise SafeBrowsingError: If the quota has been used up, or the request failed.
+        """
+        with _request_seconds.time(method=strMethod, outcome="ok") as dictLabels:
+            try:
+                return self._post(strMethod, dictBody)
+            except SafeBrowsingError:
+                dictLabels['outcome'] = "error"
+                raise
+
+    def _post(self, strMethod, dictBody):
+        if not self._bucket.try_acquire():
+            raise SafeBrowsingError("Quota exceeded")
+
+        strPath = "/v4/" + strMethod + "?key=" + parse.quote(self.key, safe='')
+        body = json.dumps(dictBody).encode("utf-8")
+
+        for attempt in range(2):
+            try:
+                connection = self._pool.get_nowait()
+                bReused = True
+            except queue.Empty:
+                connection = self._connect()
+                bReused = False
+
+            try:
+                connection.request("POST", strPath, body, {"Content-Type": "application/json"})
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                connection.close()
+                if bReused:
+                    #The server probably closed the idle connection, so retry on a new one
+                    continue
+                raise SafeBrowsingError(str(e))
+
+            try:
+                self._pool.put_nowait(connection)
+            except queue.Full:
+                connection.close()
+
+            if response.status != 200:
+                raise SafeBrowsingError("HTTP %d from %s" % (response.status, strMethod))
+            try:
+                return json.loads(data.decode("utf-8"))
+            except ValueError:
+                raise SafeBrowsingError("Invalid response from " + strMethod)
+
+        raise SafeBrowsingError("Unable to connect to " + self.strHost)
+
+    def _client(self):
+        return dict(clientId=CLIENT_ID, clientVersion=CLIENT_VERSION)
+
+    #
+    # Local database
+    #
+    def update(self):
+        """
+        Brings the local database of hash prefixes up to date.
+
+        @raise SafeBrowsingError: If the update failed, in which case the next is backed off.
+        """
+        lstRequests = list()
+        for threat_list in THREAT_LISTS:
+            strState = self._lists.get(threat_list, ("", None))[0]
+            lstRequests.append(dict(threatType=threat_list[0], platformType=threat_list[1],
+                                    threatEntryType=threat_list[2], state=strState,
+                                    constraints=dict(supportedCompressions=["RAW"])))
+
+        try:
+            dictResponse = self._request("threatListUpdates:fetch",
+                                         dict(client=self._client(), listUpdateRequests=lstRequests))
+
+            lists = dict(self._lists)
+            for dictUpdate in dictResponse.get("listUpdateResponses", []):
+                threat_list = (dictUpdate["threatType"], dictUpdate["platformType"], dictUpdate["threatEntryType"])
+                lists[threat_list] = self._apply_update(lists.get(threat_list, ("", [])), dictUpdate)
+        except (SafeBrowsingError, KeyError, ValueError, TypeError) as e:
+            self._update_errors += 1
+            self._next_update = self._clock() + min(MAX_UPDATE_BACKOFF, 60 * 2 ** self._update_errors)
+            if isinstance(e, SafeBrowsingError):
+                raise
+            raise SafeBrowsingError("Invalid update: " + repr(e))
+
+        self._set_lists(lists)
+        self._update_errors = 0
+        self._next_update = self._clock() + _duration(dictResponse.get("minimumWaitDuration"), DEFAULT_UPDATE_INTERVAL)
+        self._save_state()
+
+    @staticmethod
+    def _apply_update(current, dictUpdate):
+        """
+        @param current: The (client state, sorted list of prefixes) of a threat list.
+        @param dictUpdate: The list's ListUpdateResponse.
+        @return: The updated (client state, sorted list of prefixes), or an empty list to be fully updated next time if
+        the checksum didn't match.
+        """
+        if dictUpdate.get("responseType") == "FULL_UPDATE":
+            lstPrefixes = list()
+        else:
+            lstPrefixes = list(current[1])
+
+        #Removals are indices into the sorted list before this update's additions
+        setRemove = set()
+        for dictRemoval in dictUpdate.get("removals", []):
+            setRemove.update(dictRemoval.get("rawIndices", {}).get("indices", []))
+        if setRemove:
+            lstPrefixes = [prefix for i, prefix in enumerate(lstPrefixes) if i not in setRemove]
+
+        #Sorted once at the end, as inserting each of millions of prefixes into place would take minutes
+        for dictAddition in dictUpdate.get("additions", []):
+            raw = dictAddition["rawHashes"]
+            iSize = raw["prefixSize"]
+            data = base64.b64decode(raw["rawHashes"])
+            lstPrefixes.extend(data[i:i + iSize] for i in range(0, len(data), iSize))
+        lstPrefixes.sort()
+
+        strChecksum = dictUpdate.get("checksum", {}).get("sha256")
+        if strChecksum and base64.b64decode(strChecksum) != hashlib.sha256(b"".join(lstPrefixes)).digest():
+            print("[!] Safe Browsing checksum mismatch for " + dictUpdate["threatType"] + ", resetting the list")
+            return "", []
+
+        return dictUpdate.get("newClientState", ""), lstPrefixes
+
+    def _set_lists(self, lists):
+        prefixes = dict()
+        for strState, lstPrefixes in lists.values():
+            for prefix in lstPrefixes:
+                prefixes.setdefault(len(prefix), set()).add(prefix)
+        #Replaced rather than modified, so that lookups in other threads always see a consistent database
+        self._lists = lists
+        self._prefixes = prefixes
+        self.ready.set()
+
+    def _load_state(self):
+        if self.strStatePath is None:
+            return
+        try:
+            with open(self.strStatePath, "rb") as f:
+                version, key, lists, next_update = pickle.load(f)
+            if version == STATE_VERSION and key == self.key:
+                self._set_lists(lists)
+                self._next_update = next_update
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            pass
+
+    def _save_state(self):
+        if self.strStatePath is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.strStatePath) or ".", exist_ok=True)
+            fd, strTempPath = tempfile.mkstemp(dir=os.path.dirname(self.strStatePath) or ".", suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((STATE_VERSION, self.key, self._lists, self._next_update), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(strTempPath, self.strStatePath)
+        except OSError:
+            print("[!] Unable to save the Safe Browsing database to " + self.strStatePath)
+
+    def _background_update(self):
+        try:
+            self.update()
+        except SafeBrowsingError as e:
+            print("[!] Safe Browsing update failed: " + str(e))
+        finally:
+            self._updating = False
+
+    def _ensure_updated(self):
+        """
+        Starts updating the local database in the background if it's due.
+        """
+        if self._clock() < self._next_update:
+            return
+
+        with self._update_lock:
+            if self._updating:
+                return
+            self._updating = True
+        threading.Thread(target=self._background_update, name="safebrowsing-update", daemon=True).start()
+
+    #
+    # Lookups
+    #
+    def _find_full_hashes(self, setPrefixes):
+        """
+        Asks Google for the full hashes matching the prefixes, caching the results.
+        """
+        if self._clock() < self._next_find:
+            raise SafeBrowsingError("Waiting for the minimum wait duration")
+
+        dictResponse = self._request("fullHashes:find", dict(
+            client=self._client(),
+            clientStates=[state for state, prefixes in self._lists.values() if state],
+            threatInfo=dict(threatTypes=sorted(set(t[0] for t in THREAT_LISTS)),
+                            platformTypes=sorted(set(t[1] for t in THREAT_LISTS)),
+                            threatEntryTypes=sorted(set(t[2] for t in THREAT_LISTS)),
+                            threatEntries=[dict(hash=base64.b64encode(prefix).decode("ascii"))
+                                           for prefix in sorted(setPrefixes)])))
+
+        dictThreats = dict()
+        dictDurations = dict()
+        for dictMatch in dictResponse.get("matches", []):
+            full_hash = base64.b64decode(dictMatch["threat"]["hash"])
+            dictThreats.setdefault(full_hash, set()).add(dictMatch["threatType"])
+            fDuration = _duration(dictMatch.get("cacheDuration"), 300)
+            dictDurations[full_hash] = min(dictDurations.get(full_hash, fDuration), fDuration)
+        for full_hash, setThreats in dictThreats.items():
+            self._full_hash_cache.put(full_hash, frozenset(setThreats), dictDurations[full_hash])
+
+        fNegative = _duration(dictResponse.get("negativeCacheDuration"), 300)
+        for prefix in setPrefixes:
+            self._negative_cache.put(prefix, True, fNegative)
+
+        self._next_find = self._clock() + _duration(dictResponse.get("minimumWaitDuration"))
+
+    def _batched_find_full_hashes(self, setPrefixes):
+        """
+        Checks the prefixes along with those of any other threads looking up at the same time, in a single request.
+        """
+        with self._batch_lock:
+            batch = self._batch
+            bLeader = batch is None
+            if bLeader:
+                batch = self._batch = _Batch()
+            batch.prefixes.update(setPrefixes)
+            batch.iMembers += 1
+
+        if bLeader:
+            self._sleep(BATCH_WINDOW)
+            with self._batch_lock:
+                self._batch = None
+            try:
+                self._find_full_hashes(batch.prefixes)
+            except SafeBrowsingError as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+
+    def lookup(self, strHostname):
+        """
+        @param strHostname: The hostname whose root URL to check.
+        @return: The set of threat types the URL is listed for, which is empty if it's safe.
+        @raise SafeBrowsingError: If a full hash check was needed but failed, or the database hasn't been downloaded yet.
+        """
+        with _lookup_seconds.time(outcome="safe") as dictLabels:
+            try:
+                setThreats = self._lookup(strHostname)
+            except Exception:
+                dictLabels['outcome'] = "error"
+                raise
+            if setThreats:
+                dictLabels['outcome'] = "listed"
+            return setThreats
+
+    def _lookup(self, strHostname):
+        self._ensure_updated()
+        if not self.ready.is_set():
+            #Not yet known, rather than safe
+            raise SafeBrowsingError("The threat lists haven't been downloaded yet")
+
+        lstHashes = [hashlib.sha256(expression.encode("ascii", "ignore")).digest()
+                     for expression in url_expressions(strHostname)]
+        prefixes = self._prefixes
+
+        setThreats = set()
+        setUnknown = set()
+        for full_hash in lstHashes:
+            lstMatching = [full_hash[:iSize] for iSize, setPrefixes in prefixes.items()
+                           if full_hash[:iSize] in setPrefixes]
+            if not lstMatching:
+                continue
+
+            cached = self._full_hash_cache.get(full_hash)
+            if cached is not None:
+                setThreats.update(cached)
+            elif not all(self._negative_cache.get(prefix) for prefix in lstMatching):
+                setUnknown.update(lstMatching)
+
+        if setUnknown:
+            self._batched_find_full_hashes(setUnknown)
+            for full_hash in lstHashes:
+                setThreats.update(self._full_hash_cache.get(full_hash, ()))
+
+        return setThreats
+
+
+def warning(setThreats):
+    """
+    @param setThreats: The threat types a URL is listed for.
+    @return: Google's warning for the most serious of them, or the empty string if there are none.
+    """
+    for strThreat, strWarning in WARNINGS:
+        if strThreat in setThreats:
+            return strWarning
+    return ""
+
+
+_clients = dict()
+_clients_lock = threading.Lock()
+
 
 def safebrowsingqueryv2(query_hostname, key):
     """
     Performs a lookup against Google's Safe Browsing API and returns the result as HTML. Only the root HTTP URL is
-    passed to Google.
+    checked, and only its hash prefix is ever sent to Google.
 
     To use the Google Safe Browsing API you must register for an API key.
-    Obtain your API key here: https://developers.google.com/safe-browsing/key_signup
+    Obtain your API key here: https://developers.google.com/safe-browsing/v4/get-started
 
     You can find further information on Google Safe Browsing API here:
     https://developers.google.com/safe-browsing/
@@ -27,34 +537,13 @@ def safebrowsingqueryv2(query_hostname, key):
         # Return the same as a positive response string if the Safe Browsing API key is missing.
         return ""
 
-    global now, value, longtermthen
-    then = now
-    now = DT.datetime.now()
-
-    # Make sure the Google Safe Browsing API is not abused
-    if (value < 10000) and ((now - then).seconds < 86400):
-        value += 1
-    elif (now - longtermthen).seconds > 86400:
-        value = 0
-        longtermthen = now
-    else:
-        return ""
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = SafeBrowsing(key, strStatePath=STATE_PATH)
+            _clients[key] = client
 
-    query_url = parse.quote("http://" + query_hostname, safe='')
-
-    connection = http.client.HTTPSConnection("sb-ssl.google.com")
-    connection.request("GET", "/safebrowsing/api/lookup?client=api&apikey=" + key + "&appver=1.0&pver=3.0&url=" + query_url)
-    response = connection.getresponse()
-
-    if response.getcode() == 200:
-        body = "suspected " + response.read().decode('utf-8')
-        title = ""
-
-        if "phishing" in body:
-            title += "Warning- Suspected phishing page. This page may be a forgery or imitation of another website, designed to trick users into sharing personal or financial information. Entering any personal information on this page may result in identity theft or other abuse. You can find out more about phishing from www.antiphishing.org."
-        elif "malware" in body:
-            title += "Warning- Visiting this web site may harm your computer. This page appears to contain malicious code that could be downloaded to your computer without your consent. You can learn more about harmful web content including viruses and other malicious code and how to protect your computer at StopBadware.org."
-
-        return title
-    elif response.getcode() == 204:
-        return ""
\ No newline at end of file
+    try:
+        return warning(client.lookup(query_hostname))
+    except SafeBrowsingError:
+        return ""
@@ -1,20 +1,27 @@
 import re
-from dns.exception import DNSException
+import dns.exception
 import dns.resolver
 from dns.resolver import NXDOMAIN
 from extrainfoquery import ExtraInfoQuery
+import dnsbl
+import dnscache
 
 
 class Spamhaus(ExtraInfoQuery):
     """Spamhaus Integration class"""
 
-    _url_regex = re.compile(r'^.*"(http:.*)"$')
+    strName = "spamhaus"
+    #Listings only depend on the address
+    bUsesHostname = False
+
+    _url_regex = re.compile(r'^.*"(https?:.*)"$')
 
     def __init__(self):
         self._resolver = dns.resolver.Resolver()
         self._resolver.Timeout = 2.0
         self._resolver.lifetime = 2.0
-        self._resolver.cache = dns.resolver.LRUCache()
+        #Caching is done by the process wide dnscache.shared_cache instead
+        self._resolver.cache = None
 
         #Use OpenDNS name servers, as not all name servers will respond to spamhaus queries, e.g. Google.
         self._resolver.nameservers = ['208.67.222.222', '208.67.220.220']
@@ -24,22 +31,22 @@ class Spamhaus(ExtraInfoQuery):
         Example blocked IP: 127.0.0.2
 
         @param hostname: Ignored
+        @raise DNSException: If Spamhaus couldn't be queried.
         """
-        ipparts = ipaddress.split('.')
-        ipparts.reverse()
-        reverseipaddress = '.'.join(ipparts)
-        queryname = reverseipaddress + ".zen.spamhaus.org"
+        queryname = dnsbl.query_name(ipaddress, "zen.spamhaus.org")
 
         try:
-            self._resolver.query(queryname, "A")
+            dnscache.shared_cache.query(self._resolver, queryname, dns.rdatatype.A)
             short_msg = "Spamhaus Blocked"
-        except NXDOMAIN:
+        except (NXDOMAIN, dns.resolver.NoAnswer):
             return None, None
-        except DNSException:
-            return "DNS Failure", ""
 
         detail_msg = ""
-        txt_result_answer = self._resolver.query(queryname, "TXT")
+        try:
+            txt_result_answer = dnscache.shared_cache.query(self._resolver, queryname, dns.rdatatype.TXT)
+        except dns.exception.DNSException:
+            #The listing is known, only its explanation is missing
+            return short_msg, detail_msg
         for txt_result_line in txt_result_answer.rrset:
             match = self._url_regex.match(str(txt_result_line))
             if match:
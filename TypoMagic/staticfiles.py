@@ -0,0 +1,128 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# In memory cache of the static files served to the browser, with their compressed variants and caching headers
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import gzip
+import hashlib
+import os
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+
+MIME_TYPES = {
+    '.html': 'text/html',
+    '.css': 'text/css',
+    '.js': 'application/javascript',
+    '.map': 'application/json',
+    '.ico': 'image/x-icon',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+}
+#Types worth compressing, the images are already compressed
+COMPRESSIBLE = ('.html', '.css', '.js', '.map')
+#Files smaller than this aren't worth compressing
+MIN_COMPRESS_SIZE = 512
+
+#Seconds browsers may use their copy without asking again. Pages, scripts and style sheets aren't versioned, so
+#they're only cached briefly and then revalidated with a conditional request.
+MAX_AGE_IMAGES = 30 * 86400
+MAX_AGE_OTHER = 3600
+
+
+class StaticFile(object):
+    """One cached file."""
+
+    def __init__(self, strPath, data, fModified):
+        strExt = os.path.splitext(strPath)[1].lower()
+        self.data = data
+        self.fModified = fModified
+        self.strMimeType = MIME_TYPES[strExt]
+        self.strETag = '"' + hashlib.sha1(data).hexdigest()[:16] + '"'
+        self.strLastModified = formatdate(fModified, usegmt=True)
+        self.iMaxAge = MAX_AGE_IMAGES if self.strMimeType.startswith('image/') else MAX_AGE_OTHER
+
+        #Compressed once, rather than for every response. It's a different representation, so needs its own strong
+        #ETag.
+        self.gzipped = None
+        self.strGzipETag = None
+        if strExt in COMPRESSIBLE and len(data) >= MIN_COMPRESS_SIZE:
+            gzipped = gzip.compress(data, 9, mtime=0)
+            if len(gzipped) < len(data):
+                self.gzipped = gzipped
+                self.strGzipETag = self.strETag[:-1] + '-gz"'
+
+    def is_fresh(self, strIfNoneMatch, strIfModifiedSince):
+        """
+        @param strIfNoneMatch: The request's If-None-Match header, or None.
+        @param strIfModifiedSince: The request's If-Modified-Since header, or None.
+        @return: True if the client's copy is current, so it can be sent a 304.
+        """
+        if strIfNoneMatch is not None:
+            #Takes precedence over If-Modified-Since, see RFC 7232
+            lstETags = [strETag.strip() for strETag in strIfNoneMatch.split(',')]
+            if '*' in lstETags:
+                return True
+            #Either variant will do, as a 304 doesn't have a body to encode
+            for strETag in (self.strETag, self.strGzipETag):
+                if strETag is not None and (strETag in lstETags or 'W/' + strETag in lstETags):
+                    return True
+            return False
+
+        if strIfModifiedSince is not None:
+            try:
+                return int(self.fModified) <= parsedate_to_datetime(strIfModifiedSince).timestamp()
+            except (TypeError, ValueError, IndexError):
+                return False
+        return False
+
+
+class StaticFiles(object):
+    """
+    Serves the files under a directory from memory. Each file is read once, and again only if it changes on disk.
+    Safe to share between threads.
+    """
+
+    def __init__(self, strRoot="."):
+        """
+        @param strRoot: The directory to serve files from.
+        """
+        self.strRoot = os.path.realpath(strRoot)
+        self._lock = threading.Lock()
+        #path -> StaticFile
+        self._files = dict()
+
+    def get(self, strPath):
+        """
+        @param strPath: The request path of the file e.g. /js/typofinder.js.
+        @return: The StaticFile, or None if there isn't a file of a known type at that path under the root.
+        """
+        if os.path.splitext(strPath)[1].lower() not in MIME_TYPES:
+            return None
+        strFullPath = os.path.realpath(os.path.join(self.strRoot, strPath.lstrip('/')))
+        if not strFullPath.startswith(self.strRoot + os.sep):
+            #Path traversal
+            return None
+
+        try:
+            fModified = os.stat(strFullPath).st_mtime
+        except OSError:
+            return None
+
+        with self._lock:
+            staticfile = self._files.get(strFullPath)
+        if staticfile is None or staticfile.fModified != fModified:
+            try:
+                with open(strFullPath, 'rb') as f:
+                    staticfile = StaticFile(strFullPath, f.read(), fModified)
+            except OSError:
+                return None
+            with self._lock:
+                self._files[strFullPath] = staticfile
+        return staticfile
@@ -0,0 +1,234 @@
+import asyncio
+import threading
+import time
+from unittest import TestCase, mock
+
+import dns.resolver
+
+import asynchostinfo
+import testutils
+import typogen
+
+#The typogen created when TypoMagic is imported would otherwise need the real Alexa list
+with mock.patch.object(typogen.typogen, "loadalexa", testutils.loadalexa):
+    try:
+        #pytest imports this directory as a package, because of its __init__.py
+        from TypoMagic import TypoMagic
+    except ImportError:
+        import TypoMagic
+
+
+class Record(object):
+    def __init__(self, address=None, exchange=None):
+        self.address = address
+        self.exchange = exchange
+
+
+class FakeHostInfo(object):
+    """Answers every lookup for 'example.com' after a short delay, and blocks forever on 'm.example.com'."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def lookup(self, strName, answer):
+        if strName == "m.example.com":
+            self.release.wait()
+        time.sleep(0.05)
+        if not strName.endswith("example.com"):
+            raise dns.resolver.NXDOMAIN()
+        return answer
+
+    def getIPv4(self, sHostname):
+        return self.lookup(sHostname, [Record("192.0.2.1")])
+
+    def getIPv6(self, sHostname):
+        return self.lookup(sHostname, [Record("2001:db8::1")])
+
+    def getMX(self, sHostname):
+        return self.lookup(sHostname, [Record(exchange="mx1.example.com."), Record(exchange="mx2.example.com.")])
+
+    def getWWW(self, sHostname):
+        return self.lookup("www." + sHostname, [Record("192.0.2.2")])
+
+    def getWWWv6(self, sHostname):
+        return self.lookup("www." + sHostname, None)
+
+    def getWEBMail(self, sHostname):
+        return self.lookup("webmail." + sHostname, None)
+
+    def getWEBMailv6(self, sHostname):
+        return self.lookup("webmail." + sHostname, None)
+
+    def getM(self, sHostname):
+        return self.lookup("m." + sHostname, [Record("192.0.2.3")])
+
+    def getMv6(self, sHostname):
+        return self.lookup("m." + sHostname, None)
+
+
+class FakeAsyncHostInfo(asynchostinfo.asynchostinfo):
+    """
+    Gives the same answers as FakeHostInfo from the asyncio engine's coroutines, keeping count of how many queries are
+    waiting at once and which were cancelled. The blocking API isn't expected to be used.
+    """
+
+    def __init__(self):
+        super(FakeAsyncHostInfo, self).__init__()
+        self.iWaiting = 0
+        self.iMostWaiting = 0
+        self.lstCancelled = list()
+
+    def do_query(self, prefix, sHostname, rdatatype):
+        raise AssertionError("Blocking lookup of " + sHostname)
+
+    async def lookup(self, strName, answer):
+        self.iWaiting += 1
+        self.iMostWaiting = max(self.iMostWaiting, self.iWaiting)
+        try:
+            if strName == "m.example.com":
+                await asyncio.Event().wait()
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            self.lstCancelled.append(strName)
+            raise
+        finally:
+            self.iWaiting -= 1
+        if not strName.endswith("example.com"):
+            raise dns.resolver.NXDOMAIN()
+        return answer
+
+    async def agetIPv4(self, sHostname):
+        return await self.lookup(sHostname, [Record("192.0.2.1")])
+
+    async def agetIPv6(self, sHostname):
+        return await self.lookup(sHostname, [Record("2001:db8::1")])
+
+    async def agetMX(self, sHostname):
+        return await self.lookup(sHostname, [Record(exchange="mx1.example.com."), Record(exchange="mx2.example.com.")])
+
+    async def agetWWW(self, sHostname):
+        return await self.lookup("www." + sHostname, [Record("192.0.2.2")])
+
+    async def agetWWWv6(self, sHostname):
+        return await self.lookup("www." + sHostname, None)
+
+    async def agetWEBMail(self, sHostname):
+        return await self.lookup("webmail." + sHostname, None)
+
+    async def agetWEBMailv6(self, sHostname):
+        return await self.lookup("webmail." + sHostname, None)
+
+    async def agetM(self, sHostname):
+        return await self.lookup("m." + sHostname, [Record("192.0.2.3")])
+
+    async def agetMv6(self, sHostname):
+        return await self.lookup("m." + sHostname, None)
+
+
+class TestHandleHostAJAX(TestCase):
+    def setUp(self):
+        self.hostinfo = FakeHostInfo()
+        self.original = TypoMagic._hostinfo
+        TypoMagic._hostinfo = self.hostinfo
+
+    def tearDown(self):
+        self.hostinfo.release.set()
+        TypoMagic._hostinfo = self.original
+
+    def test_nxdomain_short_circuits(self):
+        typo = TypoMagic.handleHostAJAX("example.net")
+        self.assertEqual([], typo.IPv4Address)
+        self.assertEqual([], typo.aMX)
+        self.assertFalse(typo.bPartial)
+
+    def test_deadline_returns_partial_result(self):
+        start = time.monotonic()
+        typo = TypoMagic.handleHostAJAX("example.com", 1.0)
+        #Sequentially this would take 15 lookups of 50ms, plus the blocked one
+        self.assertLess(time.monotonic() - start, 1.5)
+
+        self.assertTrue(typo.bPartial)
+        self.assertEqual(["192.0.2.1"], typo.IPv4Address)
+        self.assertEqual(["2001:db8::1"], typo.IPV6Address)
+        self.assertEqual(["192.0.2.2"], typo.wwwv4)
+        self.assertEqual(["mx1.example.com", "mx2.example.com"], typo.aMX)
+        self.assertEqual(["192.0.2.1"], typo.aMXIPv4["mx2.example.com"])
+        self.assertEqual([], typo.mv4)
+
+    def test_extra_info_for_every_address(self):
+        class Provider(TypoMagic.extrainfoquery.ExtraInfoQuery):
+            strName = "test"
+
+            def query(self, hostname, ipaddress):
+                return ("Listed", "") if ipaddress == "192.0.2.2" else (None, None)
+
+        original = TypoMagic._extrainfo
+        TypoMagic._extrainfo = TypoMagic.extrainfoquery.ProviderRegistry()
+        TypoMagic._extrainfo.register(Provider())
+        try:
+            typo = TypoMagic.handleHostAJAX("example.com", 1.0)
+        finally:
+            TypoMagic._extrainfo = original
+        self.assertEqual({"test": {"192.0.2.2": ("Listed", "")}}, typo.ExtraInfo)
+
+
+class TestHandleHostAJAXAsync(TestCase):
+    def setUp(self):
+        self.hostinfo = FakeAsyncHostInfo()
+        self.original = TypoMagic._hostinfo
+        TypoMagic._hostinfo = self.hostinfo
+
+    def tearDown(self):
+        TypoMagic._hostinfo = self.original
+
+    def test_nxdomain_short_circuits(self):
+        typo = TypoMagic.handleHostAJAX("example.net")
+        self.assertEqual([], typo.IPv4Address)
+        self.assertEqual([], typo.aMX)
+        self.assertFalse(typo.bPartial)
+
+    def test_queries_wait_together_on_the_loop(self):
+        start = time.monotonic()
+        typo = TypoMagic.handleHostAJAX("example.com", 1.0)
+        self.assertLess(time.monotonic() - start, 1.5)
+
+        self.assertTrue(typo.bPartial)
+        self.assertEqual(["192.0.2.1"], typo.IPv4Address)
+        self.assertEqual(["2001:db8::1"], typo.IPV6Address)
+        self.assertEqual(["192.0.2.2"], typo.wwwv4)
+        self.assertEqual(["mx1.example.com", "mx2.example.com"], typo.aMX)
+        self.assertEqual(["2001:db8::1"], typo.aMXIPv6["mx2.example.com"])
+        self.assertEqual([], typo.mv4)
+        #The A and AAAA queries of www, webmail, m and the MX records at least
+        self.assertGreaterEqual(self.hostinfo.iMostWaiting, 7)
+
+        #The lookup still stuck at the deadline is cancelled, rather than left waiting on the loop
+        for i in range(100):
+            if self.hostinfo.iWaiting == 0:
+                break
+            time.sleep(0.01)
+        self.assertIn("m.example.com", self.hostinfo.lstCancelled)
+        self.assertEqual(0, self.hostinfo.iWaiting)
+
+
+class TestIterHostsAJAX(TestCase):
+    def test_close_cancels_queued_lookups(self):
+        release = threading.Event()
+        lstLookedUp = list()
+
+        def lookup(sDomain):
+            lstLookedUp.append(sDomain)
+            if sDomain != "0.example.com":
+                release.wait(5)
+            return sDomain
+
+        lstDomains = ["%d.example.com" % i for i in range(200)]
+        results = TypoMagic.iterHostsAJAX(lstDomains, len(lstDomains), lookup)
+        self.assertEqual("0.example.com", next(results))
+        #As when the client of a stream disconnects
+        results.close()
+        release.set()
+
+        #Queued after every lookup, so once it has run the rest have either run or been cancelled
+        TypoMagic._entity_executor.submit(lambda: None).result()
+        self.assertLess(len(lstLookedUp), len(lstDomains))
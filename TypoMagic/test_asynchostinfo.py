@@ -0,0 +1,69 @@
+import asyncio
+import socket
+import threading
+from unittest import TestCase
+
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.resolver
+import dns.rrset
+
+from asynchostinfo import AsyncResolver
+
+
+class StubNameServer(object):
+    """A UDP name server on localhost which knows a single A record, and drops queries for 'slow.example.'"""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(4096)
+            except OSError:
+                return
+            request = dns.message.from_wire(data)
+            qname = request.question[0].name
+            if str(qname) == "slow.example.":
+                continue
+            response = dns.message.make_response(request)
+            if str(qname) == "www.example." and request.question[0].rdtype == dns.rdatatype.A:
+                response.answer.append(dns.rrset.from_text(qname, 60, "IN", "A", "192.0.2.10"))
+            elif str(qname) != "www.example.":
+                response.set_rcode(dns.rcode.NXDOMAIN)
+            self.sock.sendto(response.to_wire(), addr)
+
+    def close(self):
+        self.sock.close()
+
+
+class TestAsyncResolver(TestCase):
+    def setUp(self):
+        self.server = StubNameServer()
+        self.resolver = AsyncResolver(['127.0.0.1'], port=self.server.port, timeout=0.2, retries=0)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_concurrent_queries(self):
+        async def lookups():
+            return await asyncio.gather(*[self.resolver.resolve("www.example.", dns.rdatatype.A) for _ in range(50)])
+
+        answers = asyncio.run(lookups())
+        self.assertEqual(["192.0.2.10"] * 50, [answer[0].address for answer in answers])
+
+    def test_nxdomain_and_noanswer(self):
+        with self.assertRaises(dns.resolver.NXDOMAIN):
+            asyncio.run(self.resolver.resolve("nx.example.", dns.rdatatype.A))
+        with self.assertRaises(dns.resolver.NoAnswer):
+            asyncio.run(self.resolver.resolve("www.example.", dns.rdatatype.AAAA))
+
+    def test_timeout(self):
+        with self.assertRaises(dns.exception.Timeout):
+            asyncio.run(self.resolver.resolve("slow.example.", dns.rdatatype.A))
@@ -0,0 +1,188 @@
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+from unittest import TestCase, mock
+
+import testutils
+import typogen
+from objtypo import objtypo
+from resultstore import ResultStore
+
+#The typogen created when TypoMagic is imported would otherwise need the real Alexa list
+with mock.patch.object(typogen.typogen, "loadalexa", testutils.loadalexa):
+    try:
+        #pytest imports this directory as a package, because of its __init__.py
+        from TypoMagic import TypoMagic
+    except ImportError:
+        import TypoMagic
+
+#bulkscan imports TypoMagic by name, which would otherwise be the package
+with mock.patch.dict(sys.modules, TypoMagic=TypoMagic):
+    import bulkscan
+
+TYPOS = OrderedDict([("exampel.com", ["example.com"]), ("exmaple.com", ["example.com"]),
+                     ("examp1e.com", ["example.com", "examp1e.org"]), ("xample.com", ["example.com"])])
+
+
+class TestBulkScan(TestCase):
+    def setUp(self):
+        self.strDir = tempfile.mkdtemp()
+        self.lstScanned = list()
+        patchers = [mock.patch.object(bulkscan, "generate_typos", lambda lstBrands, dictOptions: TYPOS),
+                    mock.patch.object(bulkscan, "scan_typo", self.scan_typo)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.strDir)
+
+    def scan_typo(self, strTypo, bWhois=True, dictPrevious=None, store=None):
+        self.lstScanned.append(strTypo)
+        typo = objtypo()
+        typo.strDomain = strTypo
+        if strTypo == "exampel.com":
+            typo.IPv4Address = ["192.0.2.1", "192.0.2.2"]
+            return typo, dict(registrar=dict(name="Example Registrar"), date=dict(created="2015-01-01")), None
+        return typo, None, None
+
+    def path(self, strName):
+        return os.path.join(self.strDir, strName)
+
+    def test_read_brands(self):
+        with open(self.path("brands.txt"), "w", encoding="utf-8") as f:
+            f.write("# brands\nExample.com\n\n  example.org \nexample.com\n")
+        self.assertEqual(["example.com", "example.org"], bulkscan.read_brands(self.path("brands.txt")))
+
+    def test_jsonl(self):
+        self.assertEqual(4, bulkscan.scan(["example.com"], self.path("out.jsonl")))
+        with open(self.path("out.jsonl"), encoding="utf-8") as f:
+            lstRecords = [json.loads(line) for line in f]
+
+        self.assertEqual(sorted(TYPOS), sorted(dictRecord['typo'] for dictRecord in lstRecords))
+        dictRecord = [dictRecord for dictRecord in lstRecords if dictRecord['typo'] == "exampel.com"][0]
+        self.assertEqual(["example.com"], dictRecord['brands'])
+        self.assertEqual(["192.0.2.1", "192.0.2.2"], dictRecord['IPv4Addresses'])
+        self.assertEqual("Example Registrar", dictRecord['whois']['registrar']['name'])
+        self.assertNotIn('strDomain', dictRecord)
+
+    def test_csv(self):
+        bulkscan.scan(["example.com"], self.path("out.csv"), "csv")
+        with open(self.path("out.csv"), encoding="utf-8", newline="") as f:
+            lstRows = list(csv.reader(f))
+
+        self.assertEqual(list(bulkscan.CSV_FIELDS), lstRows[0])
+        dictRows = dict((row[0], dict(zip(bulkscan.CSV_FIELDS, row))) for row in lstRows[1:])
+        self.assertEqual(sorted(TYPOS), sorted(dictRows))
+        self.assertEqual("192.0.2.1;192.0.2.2", dictRows["exampel.com"]['IPv4Addresses'])
+        self.assertEqual("Example Registrar", dictRows["exampel.com"]['registrar'])
+        self.assertEqual("2015-01-01", dictRows["exampel.com"]['created'])
+        self.assertEqual("example.com;examp1e.org", dictRows["examp1e.com"]['brands'])
+        self.assertEqual("", dictRows["xample.com"]['registrar'])
+
+    def test_resume_after_partial_line(self):
+        with open(self.path("out.jsonl"), "w", encoding="utf-8") as f:
+            f.write(json.dumps(dict(typo="exampel.com")) + "\n")
+            f.write(json.dumps(dict(typo="exmaple.com")) + "\n")
+            #Cut short by an interrupted scan
+            f.write('{"typo": "examp1e.com", "bra')
+
+        self.assertEqual(2, bulkscan.scan(["example.com"], self.path("out.jsonl"), bResume=True))
+        self.assertEqual(["examp1e.com", "xample.com"], sorted(self.lstScanned))
+        with open(self.path("out.jsonl"), encoding="utf-8") as f:
+            lstTypos = [json.loads(line)['typo'] for line in f]
+        self.assertEqual(sorted(TYPOS), sorted(lstTypos))
+
+    def test_resume_csv(self):
+        bulkscan.scan(["example.com"], self.path("out.csv"), "csv")
+        with open(self.path("out.csv"), "rb+") as f:
+            #Drop the last row, and leave half of the one before it
+            lstLines = f.read().splitlines(True)
+            f.seek(0)
+            f.truncate()
+            f.write(b"".join(lstLines[:-2]) + lstLines[-2][:10])
+        strLost = lstLines[-1].split(b",")[0].decode("utf-8")
+        strPartial = lstLines[-2].split(b",")[0].decode("utf-8")
+
+        del self.lstScanned[:]
+        self.assertEqual(2, bulkscan.scan(["example.com"], self.path("out.csv"), "csv", bResume=True))
+        self.assertEqual(sorted([strLost, strPartial]), sorted(self.lstScanned))
+        with open(self.path("out.csv"), encoding="utf-8", newline="") as f:
+            lstRows = list(csv.reader(f))
+        #A single header, and a complete row for every typo
+        self.assertEqual(list(bulkscan.CSV_FIELDS), lstRows[0])
+        self.assertEqual(sorted(TYPOS), sorted(row[0] for row in lstRows[1:]))
+        self.assertTrue(all(len(row) == len(bulkscan.CSV_FIELDS) for row in lstRows))
+
+
+class TestBulkScanStore(TestCase):
+    def setUp(self):
+        self.strDir = tempfile.mkdtemp()
+        self.clock = testutils.FakeClock(1000000.0)
+        self.store = ResultStore(os.path.join(self.strDir, "results.db"), iRecheckRegistered=100,
+                                 iRecheckUnregistered=1000, iRecheckWhois=500, clock=self.clock)
+        #Only exampel.com and exmaple.com are registered
+        self.dictAddresses = {"exampel.com": ["192.0.2.1"], "exmaple.com": ["192.0.2.2"]}
+        self.lstLookedUp = list()
+        self.lstWhois = list()
+        patchers = [mock.patch.object(bulkscan, "generate_typos", lambda lstBrands, dictOptions: TYPOS),
+                    mock.patch.object(bulkscan.TypoMagic, "handleHostAJAXSafe", self.lookup),
+                    mock.patch.object(bulkscan.whois, "whois", self.whois),
+                    mock.patch.object(bulkscan.whois, "parse", lambda strWhois: dict(registrar=dict(name=strWhois)))]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.strDir)
+
+    def lookup(self, strTypo):
+        self.lstLookedUp.append(strTypo)
+        typo = objtypo()
+        typo.strDomain = strTypo
+        typo.IPv4Address = list(self.dictAddresses.get(strTypo, ()))
+        return typo
+
+    def whois(self, strTypo):
+        self.lstWhois.append(strTypo)
+        return "Registrar of " + strTypo
+
+    def scan(self, strName):
+        strPath = os.path.join(self.strDir, strName)
+        bulkscan.scan(["example.com"], strPath, store=self.store, bDiff=True)
+        with open(strPath, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_diff(self):
+        lstRecords = self.scan("first.jsonl")
+        self.assertEqual(sorted(TYPOS), sorted(self.lstLookedUp))
+        self.assertEqual(["exampel.com", "exmaple.com"], sorted(self.lstWhois))
+        #The unregistered typos haven't changed in any way worth reporting
+        self.assertEqual([("exampel.com", "new"), ("exmaple.com", "new")],
+                         sorted((dictRecord['typo'], dictRecord['change']) for dictRecord in lstRecords))
+
+        self.clock.now += 200
+        self.dictAddresses["exmaple.com"] = ["192.0.2.3"]
+        del self.lstLookedUp[:]
+        lstRecords = self.scan("second.jsonl")
+        #The unregistered typos aren't due a recheck yet, and the whois records are still fresh
+        self.assertEqual(["exampel.com", "exmaple.com"], sorted(self.lstLookedUp))
+        self.assertEqual(["exampel.com", "exmaple.com"], sorted(self.lstWhois))
+        self.assertEqual(1, len(lstRecords))
+        self.assertEqual("exmaple.com", lstRecords[0]['typo'])
+        self.assertEqual("changed", lstRecords[0]['change'])
+        self.assertEqual(["192.0.2.3"], lstRecords[0]['IPv4Addresses'])
+        self.assertEqual("Registrar of exmaple.com", lstRecords[0]['whois']['registrar']['name'])
+
+        #Committed, so another connection sees the latest results
+        reader = ResultStore(os.path.join(self.strDir, "results.db"), clock=self.clock)
+        try:
+            dictResult = reader.get_many(["exmaple.com"])["exmaple.com"]
+        finally:
+            reader.close()
+        self.assertEqual(["192.0.2.3"], dictResult['entity']['IPv4Addresses'])
@@ -0,0 +1,76 @@
+import threading
+import time
+from unittest import TestCase
+
+import dns.message
+import dns.name
+import dns.rdataclass
+import dns.rdatatype
+import dns.resolver
+import dns.rrset
+
+import dnsbl
+import dnscache
+
+
+class FakeResolver(object):
+    """Lists 127.0.0.2 in every zone, counting the queries which reach it."""
+
+    nameservers = ['192.0.2.53']
+
+    def __init__(self):
+        self.queries = list()
+        self.lock = threading.Lock()
+
+    def query(self, qname, rdtype):
+        with self.lock:
+            self.queries.append((str(qname), rdtype))
+        time.sleep(0.05)
+        qname = dns.name.from_text(str(qname))
+        request = dns.message.make_query(qname, rdtype)
+        response = dns.message.make_response(request)
+        if not str(qname).startswith("2.0.0.127."):
+            response.set_rcode(dns.rcode.NXDOMAIN)
+            raise dns.resolver.NXDOMAIN(qnames=[qname], responses={qname: response})
+
+        if rdtype == dns.rdatatype.A:
+            response.answer.append(dns.rrset.from_text(qname, 60, "IN", "A", "127.0.0.2"))
+        else:
+            response.answer.append(dns.rrset.from_text(qname, 60, "IN", "TXT", '"https://www.spamhaus.org/query/ip/127.0.0.2"'))
+        response = dns.message.from_wire(response.to_wire())
+        return dns.resolver.Answer(qname, rdtype, dns.rdataclass.IN, response)
+
+
+class TestDNSBL(TestCase):
+    def setUp(self):
+        dnscache.shared_cache.clear()
+        self.checker = dnsbl.DNSBL(["zen.example", "bl.example"])
+        self.checker._resolver = FakeResolver()
+
+    def tearDown(self):
+        dnscache.shared_cache.clear()
+
+    def test_query_name(self):
+        self.assertEqual("2.0.0.127.zen.example", dnsbl.query_name("127.0.0.2", "zen.example"))
+        self.assertTrue(dnsbl.query_name("2001:db8::1", "zen.example").startswith("1.0.0.0."))
+        self.assertTrue(dnsbl.query_name("2001:db8::1", "zen.example").endswith(".8.b.d.0.1.0.0.2.zen.example"))
+
+    def test_listed_addresses_only_fetch_txt(self):
+        dictListed = self.checker.check(["127.0.0.2", "192.0.2.1", "not an address"])
+        self.assertEqual(["127.0.0.2"], list(dictListed))
+        self.assertEqual(["bl.example", "zen.example"], sorted(listing['zone'] for listing in dictListed["127.0.0.2"]))
+        self.assertEqual(["127.0.0.2"], dictListed["127.0.0.2"][0]['codes'])
+        self.assertIn("spamhaus.org/query", dictListed["127.0.0.2"][0]['detail'])
+
+        lstTXT = [qname for qname, rdtype in self.checker._resolver.queries if rdtype == dns.rdatatype.TXT]
+        self.assertEqual(["2.0.0.127.bl.example", "2.0.0.127.zen.example"], sorted(lstTXT))
+
+    def test_shared_addresses_checked_once(self):
+        threads = [threading.Thread(target=self.checker.check, args=(["192.0.2.1"], )) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.checker.check(["192.0.2.1"])
+        #One query per zone, whether concurrent or cached
+        self.assertEqual(2, len(self.checker._resolver.queries))
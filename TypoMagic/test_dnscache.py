@@ -0,0 +1,77 @@
+from unittest import TestCase
+
+import dns.message
+import dns.name
+import dns.rdatatype
+import dns.resolver
+
+from dnscache import DNSCache
+from testutils import FakeClock
+
+
+class FakeResolver(object):
+    """Answers from canned responses, counting the queries which reach it."""
+
+    nameservers = ['192.0.2.1']
+
+    def __init__(self):
+        self.queries = 0
+
+    def query(self, qname, rdtype):
+        self.queries += 1
+        qname = dns.name.from_text(str(qname))
+        request = dns.message.make_query(qname, rdtype)
+        response = dns.message.make_response(request)
+
+        if str(qname) == "nx.example.":
+            response.set_rcode(dns.rcode.NXDOMAIN)
+            response.authority.append(dns.rrset.from_text("example.", 3600, "IN", "SOA",
+                                                          "ns.example. admin.example. 1 7200 900 1209600 60"))
+            raise dns.resolver.NXDOMAIN(qnames=[qname], responses={qname: response})
+
+        response.answer.append(dns.rrset.from_text(qname, 30, "IN", "A", "192.0.2.10"))
+        #Round trip through the wire format, as a real response would be
+        response = dns.message.from_wire(response.to_wire())
+        return dns.resolver.Answer(qname, rdtype, dns.rdataclass.IN, response)
+
+
+class TestDNSCache(TestCase):
+    def setUp(self):
+        self.clock = FakeClock(1000.0)
+        self.cache = DNSCache(clock=self.clock)
+        self.resolver = FakeResolver()
+
+    def test_positive_answer_cached_for_ttl(self):
+        answer = self.cache.query(self.resolver, dns.name.from_text("www.example."), dns.rdatatype.A)
+        self.assertEqual("192.0.2.10", answer[0].address)
+        self.cache.query(self.resolver, dns.name.from_text("WWW.example."), dns.rdatatype.A)
+        self.assertEqual(1, self.resolver.queries)
+
+        self.clock.now += 31
+        self.cache.query(self.resolver, dns.name.from_text("www.example."), dns.rdatatype.A)
+        self.assertEqual(2, self.resolver.queries)
+
+    def test_nxdomain_cached_for_soa_minimum(self):
+        lstExceptions = list()
+        for _ in range(3):
+            with self.assertRaises(dns.resolver.NXDOMAIN) as context:
+                self.cache.query(self.resolver, dns.name.from_text("nx.example."), dns.rdatatype.A)
+            lstExceptions.append(context.exception)
+        self.assertEqual(1, self.resolver.queries)
+        self.assertEqual(2, self.cache.stats()['negative_hits'])
+        #Each hit raises its own exception, for the same name
+        self.assertIsNot(lstExceptions[1], lstExceptions[2])
+        self.assertEqual([dns.name.from_text("nx.example.")], lstExceptions[2].qnames())
+
+        #The SOA MINIMUM of 60 is lower than its TTL of 3600, so wins
+        self.clock.now += 61
+        with self.assertRaises(dns.resolver.NXDOMAIN):
+            self.cache.query(self.resolver, dns.name.from_text("nx.example."), dns.rdatatype.A)
+        self.assertEqual(2, self.resolver.queries)
+
+    def test_size_bounded(self):
+        cache = DNSCache(maxsize=2, clock=self.clock)
+        for name in ("a.example.", "b.example.", "c.example."):
+            cache.query(self.resolver, dns.name.from_text(name), dns.rdatatype.A)
+        self.assertEqual(2, cache.stats()['size'])
+        self.assertEqual(1, cache.stats()['evictions'])
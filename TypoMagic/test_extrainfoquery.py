@@ -0,0 +1,91 @@
+import threading
+import time
+from unittest import TestCase
+
+import extrainfoquery
+from testutils import FakeClock
+
+
+class StaticProvider(extrainfoquery.ExtraInfoQuery):
+    """Says every address is listed, counting its queries."""
+
+    strName = "static"
+
+    def __init__(self):
+        self.iQueries = 0
+
+    def query(self, hostname, ipaddress):
+        self.iQueries += 1
+        return "Listed", "Listed for " + hostname
+
+
+class FailingProvider(extrainfoquery.ExtraInfoQuery):
+    strName = "failing"
+
+    def __init__(self):
+        self.iQueries = 0
+
+    def query(self, hostname, ipaddress):
+        self.iQueries += 1
+        raise IOError("Service unavailable")
+
+
+class SlowProvider(extrainfoquery.ExtraInfoQuery):
+    strName = "slow"
+    fTimeout = 0.1
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def query(self, hostname, ipaddress):
+        self.release.wait(5)
+        return "Too late", ""
+
+
+class TestProviderRegistry(TestCase):
+    def test_results_cached_per_hostname(self):
+        registry = extrainfoquery.ProviderRegistry()
+        provider = StaticProvider()
+        registry.register(provider)
+
+        self.assertEqual({"static": {"192.0.2.1": ("Listed", "Listed for a.example")}},
+                         registry.query("a.example", ["192.0.2.1"]))
+        registry.query("a.example", ["192.0.2.1"])
+        self.assertEqual(1, provider.iQueries)
+
+        registry.query("b.example", ["192.0.2.1"])
+        self.assertEqual(2, provider.iQueries)
+        self.assertEqual(1, registry.stats()["static"]["cache_hits"])
+
+    def test_slow_provider_does_not_hold_up_others(self):
+        registry = extrainfoquery.ProviderRegistry()
+        slow = SlowProvider()
+        registry.register(slow)
+        registry.register(StaticProvider())
+
+        fStart = time.monotonic()
+        dictResults = registry.query("a.example", ["192.0.2.1"])
+        fElapsed = time.monotonic() - fStart
+        slow.release.set()
+
+        self.assertEqual(["static"], list(dictResults))
+        self.assertLess(fElapsed, 1)
+        self.assertEqual(1, registry.stats()["slow"]["timeouts"])
+
+    def test_circuit_breaker(self):
+        clock = FakeClock()
+        registry = extrainfoquery.ProviderRegistry(clock=clock)
+        provider = FailingProvider()
+        registry.register(provider)
+
+        for i in range(extrainfoquery.FAILURE_THRESHOLD + 3):
+            self.assertEqual({}, registry.query("a.example", ["192.0.2.%d" % i]))
+        self.assertEqual(extrainfoquery.FAILURE_THRESHOLD, provider.iQueries)
+        self.assertTrue(registry.stats()["failing"]["open"])
+        self.assertEqual(3, registry.stats()["failing"]["skipped"])
+
+        #After the cool down a single trial call is let through, and its failure reopens the breaker
+        clock.now += extrainfoquery.COOLDOWN
+        registry.query("a.example", ["192.0.2.100", "192.0.2.101"])
+        self.assertEqual(extrainfoquery.FAILURE_THRESHOLD + 1, provider.iQueries)
+        self.assertTrue(registry.stats()["failing"]["open"])
@@ -0,0 +1,40 @@
+from unittest import TestCase
+
+import flagimages
+import hostinfo
+
+
+class TestGeo(TestCase):
+    def setUp(self):
+        self.hostinfo = hostinfo.hostinfo()
+
+    def test_lookups_are_cached(self):
+        self.assertEqual("US", self.hostinfo.getGeo("8.8.8.8"))
+        self.assertEqual("US", self.hostinfo.getGeo("2001:4860:4860::8888"))
+        self.assertIsNone(self.hostinfo.getGeo("10.0.0.1"))
+        self.assertIsNone(self.hostinfo.getGeo("not an address"))
+
+        self.hostinfo.getGeo("8.8.8.8")
+        self.hostinfo.getGeo("10.0.0.1")
+        self.assertEqual(2, self.hostinfo._geocache.hits)
+
+    def test_databases_cached_apart(self):
+        self.assertIsNone(self.hostinfo.getGeobyIPv6("8.8.8.8"))
+        self.assertEqual("US", self.hostinfo.getGeobyIP("8.8.8.8"))
+
+
+class TestFlagImages(TestCase):
+    def setUp(self):
+        self.flags = flagimages.FlagImages()
+
+    def test_get(self):
+        data, strETag = self.flags.get("GB")
+        self.assertTrue(data.startswith(b"\x89PNG"))
+        self.assertEqual(self.flags.get("GB"), self.flags.get_path("/flags/flags-iso/shiny/16/GB.png"))
+        self.assertNotEqual(strETag, self.flags.get("US")[1])
+
+    def test_unknown(self):
+        self.assertEqual(self.flags.get(flagimages.UNKNOWN), self.flags.get(None))
+        self.assertEqual(self.flags.get(flagimages.UNKNOWN), self.flags.get("XX"))
+        self.assertIsNone(self.flags.get_path("/flags/flags-iso/shiny/32/GB.png"))
+        self.assertIsNone(self.flags.get_path("/images/logo.png"))
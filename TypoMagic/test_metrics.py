@@ -0,0 +1,54 @@
+from unittest import TestCase
+
+import metrics
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counter(self):
+        counter = self.registry.register(metrics.Counter("test_total", "Test", ("kind", )))
+        counter.inc(kind="a")
+        counter.inc(2, kind="a")
+        counter.inc(kind='b"')
+        lstLines = self.registry.render().splitlines()
+        self.assertEqual(lstLines[:2], ["# HELP test_total Test", "# TYPE test_total counter"])
+        self.assertIn('test_total{kind="a"} 3', lstLines)
+        self.assertIn('test_total{kind="b\\""} 1', lstLines)
+
+    def test_register_returns_existing(self):
+        gauge = self.registry.register(metrics.Gauge("test", "Test"))
+        self.assertIs(self.registry.register(metrics.Gauge("test", "Test")), gauge)
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        self.assertIn("test 1", self.registry.render().splitlines())
+
+    def test_histogram(self):
+        histogram = self.registry.register(metrics.Histogram("test_seconds", "Test", ("outcome", ), (0.1, 1.0)))
+        histogram.observe(0.05, outcome="ok")
+        histogram.observe(0.5, outcome="ok")
+        histogram.observe(5, outcome="ok")
+        with histogram.time(outcome="ok") as dictLabels:
+            dictLabels['outcome'] = "failed"
+
+        lstLines = self.registry.render().splitlines()
+        self.assertIn('test_seconds_bucket{outcome="ok",le="0.1"} 1', lstLines)
+        self.assertIn('test_seconds_bucket{outcome="ok",le="1.0"} 2', lstLines)
+        self.assertIn('test_seconds_bucket{outcome="ok",le="+Inf"} 3', lstLines)
+        self.assertIn('test_seconds_sum{outcome="ok"} 5.55', lstLines)
+        self.assertIn('test_seconds_count{outcome="ok"} 3', lstLines)
+        self.assertIn('test_seconds_count{outcome="failed"} 1', lstLines)
+
+    def test_callback(self):
+        dictHits = {("dns", ): 4}
+        self.registry.register(metrics.Callback("test_hits", "Test", "counter", lambda: dictHits, ("cache", )))
+        self.assertIn('test_hits{cache="dns"} 4', self.registry.render().splitlines())
+        dictHits[("dns", )] = 5
+        self.assertIn('test_hits{cache="dns"} 5', self.registry.render().splitlines())
+
+    def test_broken_callback(self):
+        self.registry.register(metrics.Callback("test_broken", "Test", "gauge", lambda: 1 / 0))
+        self.registry.register(metrics.Gauge("test_other", "Test")).set(2)
+        self.assertIn("test_other 2", self.registry.render().splitlines())
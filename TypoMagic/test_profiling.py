@@ -0,0 +1,81 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock
+
+import profiling
+
+
+def busy(fSeconds):
+    fEnd = time.perf_counter() + fSeconds
+    while time.perf_counter() < fEnd:
+        pass
+
+
+class TestProfiling(TestCase):
+    def setUp(self):
+        self.strDir = tempfile.mkdtemp()
+        self.profiler = profiling.Profiler(os.path.join(self.strDir, "profiles"), fInterval=0.001)
+
+    def tearDown(self):
+        shutil.rmtree(self.strDir)
+
+    def test_wanted(self):
+        self.assertTrue(self.profiler.wanted({profiling.HEADER: "1"}))
+        self.assertFalse(self.profiler.wanted({profiling.HEADER: "0"}))
+        self.assertFalse(self.profiler.wanted({}))
+
+        profiler = profiling.Profiler(self.strDir, 0.1, fnRandom=lambda: 0.05)
+        self.assertTrue(profiler.wanted({}))
+        profiler = profiling.Profiler(self.strDir, 0.1, fnRandom=lambda: 0.5)
+        self.assertFalse(profiler.wanted({}))
+
+    def test_not_profiled(self):
+        self.assertIsNone(profiling.current())
+        fn = lambda: None
+        self.assertIs(profiling.wrap(fn), fn)
+        profiling.tag(host="example.com")
+
+    def test_profile(self):
+        session = self.profiler.start("typov2.ncc")
+        self.assertIs(profiling.current(), session)
+        profiling.tag(host="exämple.com", typos=True)
+        busy(0.05)
+        worker = threading.Thread(target=profiling.wrap(busy), args=(0.05, ))
+        worker.start()
+        worker.join()
+        strPath = session.stop()
+        self.assertIsNone(profiling.current())
+
+        self.assertTrue(os.path.basename(strPath).endswith("-typov2.ncc-ex_mple.com.folded"))
+        with open(strPath, encoding="utf-8") as f:
+            lstLines = f.read().splitlines()
+        self.assertTrue(any(strLine.startswith("request;") and "test_profiling.py:busy " in strLine
+                            for strLine in lstLines))
+        self.assertTrue(any(strLine.startswith("worker;") and "test_profiling.py:busy " in strLine
+                            for strLine in lstLines))
+
+        with open(strPath[:-len(".folded")] + ".json", encoding="utf-8") as f:
+            dictProfile = json.load(f)
+        self.assertEqual(dictProfile['tags'], {"host": "exämple.com", "typos": True})
+        self.assertEqual(dictProfile['samples'], sum(int(strLine.rsplit(" ", 1)[1]) for strLine in lstLines))
+
+    def test_max_sessions(self):
+        lstSessions = [self.profiler.start("entity.ncc") for i in range(profiling.MAX_SESSIONS)]
+        self.assertIsNone(self.profiler.start("entity.ncc"))
+        for session in lstSessions:
+            session.stop()
+        self.assertIsNotNone(self.profiler.start("entity.ncc"))
+        profiling.current().stop()
+
+    def test_failed_start_releases_slot(self):
+        for i in range(profiling.MAX_SESSIONS + 1):
+            with mock.patch.object(profiling.threading.Thread, "start", side_effect=RuntimeError):
+                with self.assertRaises(RuntimeError):
+                    self.profiler.start("entity.ncc")
+        session = self.profiler.start("entity.ncc")
+        self.assertIsNotNone(session)
+        session.stop()
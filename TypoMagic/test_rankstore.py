@@ -0,0 +1,42 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import rankstore
+
+
+class TestRankStore(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.csv = os.path.join(self.tempdir.name, "top-1m.csv")
+        self.store_path = os.path.join(self.tempdir.name, "top-1m.ranks")
+        with open(self.csv, "w") as f:
+            f.write("1,google.com\n2,facebook.com\n3,example.com\n4,google.com\n")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_lookup(self):
+        store = rankstore.load(self.csv, self.store_path)
+        self.assertEqual(1, store.lookup("google.com"))
+        self.assertEqual(3, store.lookup("example.com"))
+        self.assertIsNone(store.lookup("example.org"))
+        self.assertIn("facebook.com", store)
+        self.assertNotIn("facebook.co", store)
+        self.assertEqual(3, len(store))
+        store.close()
+
+    def test_rebuilt_when_source_changes(self):
+        rankstore.load(self.csv, self.store_path).close()
+        with open(self.csv, "a") as f:
+            f.write("5,example.org\n")
+        store = rankstore.load(self.csv, self.store_path)
+        self.assertEqual(5, store.lookup("example.org"))
+        store.close()
+
+    def test_corrupt_store_rebuilt(self):
+        with open(self.store_path, "wb") as f:
+            f.write(b"garbage")
+        store = rankstore.load(self.csv, self.store_path)
+        self.assertEqual(2, store.lookup("facebook.com"))
+        store.close()
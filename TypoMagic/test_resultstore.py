@@ -0,0 +1,55 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import resultstore
+from objtypo import objtypo
+from resultstore import ResultStore
+from testutils import FakeClock
+
+
+def entity(lstIPv4=(), bPartial=False):
+    typo = objtypo()
+    typo.strDomain = "examp1e.com"
+    typo.IPv4Address = list(lstIPv4)
+    typo.bPartial = bPartial
+    return typo.reprJSON()
+
+
+class TestResultStore(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "results.db")
+        self.clock = FakeClock(1000000.0)
+        self.store = ResultStore(self.path, iRecheckRegistered=100, iRecheckUnregistered=1000, clock=self.clock)
+
+    def tearDown(self):
+        self.store.close()
+        self.dir.cleanup()
+
+    def test_changes(self):
+        self.assertIsNone(self.store.update("examp1e.com", entity(), None))
+        self.clock.now += 1000
+        self.assertEqual(resultstore.REGISTERED, self.store.update("examp1e.com", entity(["192.0.2.1"]), None))
+        self.clock.now += 100
+        self.assertEqual(resultstore.CHANGED, self.store.update("examp1e.com", entity(["192.0.2.1", "192.0.2.2"]), None))
+        #Only the order of the records differs
+        self.assertIsNone(self.store.update("examp1e.com", entity(["192.0.2.2", "192.0.2.1"]), None))
+        self.assertEqual(resultstore.DROPPED, self.store.update("examp1e.com", entity(), None))
+        self.assertEqual(resultstore.NEW, self.store.update("exampl3.com", entity(["192.0.2.1"]), None))
+
+    def test_due(self):
+        self.store.update("registered.com", entity(["192.0.2.1"]), None)
+        self.store.update("unregistered.com", entity(), None)
+        #Partial results aren't stored, so stay due
+        self.store.update("partial.com", entity(["192.0.2.1"], bPartial=True), None)
+        lstTypos = ["registered.com", "unregistered.com", "partial.com", "unseen.com"]
+
+        self.assertEqual(["partial.com", "unseen.com"], self.store.due(lstTypos))
+        self.clock.now += 100
+        self.assertEqual(["registered.com", "partial.com", "unseen.com"], self.store.due(lstTypos))
+
+        #And survive a restart
+        self.store.close()
+        self.store = ResultStore(self.path, clock=self.clock)
+        self.assertEqual(["192.0.2.1"], self.store.get_many(lstTypos)["registered.com"]["entity"]["IPv4Addresses"])
@@ -0,0 +1,137 @@
+import base64
+import hashlib
+import http.server
+import json
+import threading
+from unittest import TestCase
+
+import safebrowsing
+from safebrowsing import SafeBrowsing, TokenBucket
+
+
+def b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+MALWARE_HASH = hashlib.sha256(b"malware.example/").digest()
+#Shares its prefix with MALWARE_HASH, but isn't listed
+COLLIDING_PREFIXES = [hashlib.sha256(b"phishing.example/").digest()[:4], MALWARE_HASH[:4]]
+
+
+class StubSafeBrowsingHandler(http.server.BaseHTTPRequestHandler):
+    """Serves one prefix on each list, and the full hash for malware.example."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        dictRequest = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode("utf-8"))
+        self.server.requests.append((self.path.split("?")[0], dictRequest))
+
+        if self.path.startswith("/v4/threatListUpdates:fetch"):
+            lstUpdates = list()
+            for dictList in dictRequest["listUpdateRequests"]:
+                prefix = COLLIDING_PREFIXES[0] if dictList["threatType"] == "SOCIAL_ENGINEERING" else MALWARE_HASH[:4]
+                lstUpdates.append(dict(threatType=dictList["threatType"], platformType=dictList["platformType"],
+                                       threatEntryType=dictList["threatEntryType"], responseType="FULL_UPDATE",
+                                       additions=[dict(compressionType="RAW",
+                                                       rawHashes=dict(prefixSize=4, rawHashes=b64(prefix)))],
+                                       newClientState="state1",
+                                       checksum=dict(sha256=b64(hashlib.sha256(prefix).digest()))))
+            dictResponse = dict(listUpdateResponses=lstUpdates, minimumWaitDuration="600s")
+        else:
+            setPrefixes = set(base64.b64decode(entry["hash"]) for entry in dictRequest["threatInfo"]["threatEntries"])
+            lstMatches = list()
+            if MALWARE_HASH[:4] in setPrefixes:
+                lstMatches.append(dict(threatType="MALWARE", platformType="ANY_PLATFORM", threatEntryType="URL",
+                                       threat=dict(hash=b64(MALWARE_HASH)), cacheDuration="300s"))
+            dictResponse = dict(matches=lstMatches, negativeCacheDuration="300s")
+
+        body = json.dumps(dictResponse).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestSafeBrowsing(TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubSafeBrowsingHandler)
+        self.server.requests = list()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = SafeBrowsing("testkey", "127.0.0.1", self.server.server_address[1], bTLS=False)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def requests(self, strMethod):
+        return [dictRequest for strPath, dictRequest in self.server.requests if strPath == "/v4/" + strMethod]
+
+    def test_lookups(self):
+        #Downloaded in the background on start up
+        self.assertTrue(self.client.ready.wait(5))
+        #Answered from the local database alone
+        self.assertEqual(set(), self.client.lookup("www.clean.example"))
+        self.assertEqual(1, len(self.requests("threatListUpdates:fetch")))
+        self.assertEqual(0, len(self.requests("fullHashes:find")))
+
+        self.assertEqual({"MALWARE"}, self.client.lookup("www.malware.example"))
+        self.assertIn(safebrowsing.WARNINGS[1][1], safebrowsing.warning({"MALWARE"}))
+        #A prefix match which isn't really listed
+        self.assertEqual(set(), self.client.lookup("phishing.example"))
+        self.assertEqual(2, len(self.requests("fullHashes:find")))
+
+        #Both answered from the caches
+        self.assertEqual({"MALWARE"}, self.client.lookup("malware.example"))
+        self.assertEqual(set(), self.client.lookup("phishing.example"))
+        self.assertEqual(2, len(self.requests("fullHashes:find")))
+
+    def test_not_yet_downloaded(self):
+        client = SafeBrowsing("testkey", "127.0.0.1", self.server.server_address[1], bTLS=False,
+                              bucket=TokenBucket(0, 0))
+        with self.assertRaises(safebrowsing.SafeBrowsingError):
+            client.lookup("www.clean.example")
+
+    def test_concurrent_lookups_batched(self):
+        bJoined = threading.Event()
+
+        def sleep(fSeconds):
+            #Holds the batch open until every lookup has joined it, rather than for a real time window
+            self.assertTrue(bJoined.wait(5))
+
+        self.client = SafeBrowsing("testkey", "127.0.0.1", self.server.server_address[1], bTLS=False, sleep=sleep)
+        self.assertTrue(self.client.ready.wait(5))
+        lstResults = list()
+        threads = [threading.Thread(target=lambda strHost=strHost: lstResults.append(self.client.lookup(strHost)))
+                   for strHost in ("malware.example", "phishing.example") * 3]
+        for thread in threads:
+            thread.start()
+        while self.client._batch is None or self.client._batch.iMembers < len(threads):
+            threading.Event().wait(0.001)
+        bJoined.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(3, lstResults.count({"MALWARE"}))
+        self.assertEqual(1, len(self.requests("fullHashes:find")))
+        lstEntries = self.requests("fullHashes:find")[0]["threatInfo"]["threatEntries"]
+        self.assertEqual(sorted(b64(prefix) for prefix in COLLIDING_PREFIXES), sorted(e["hash"] for e in lstEntries))
+
+    def test_quota(self):
+        client = SafeBrowsing("testkey", "127.0.0.1", self.server.server_address[1], bTLS=False,
+                              bucket=TokenBucket(0, 1))
+        self.assertTrue(client.ready.wait(5))
+        self.assertEqual(set(), client.lookup("www.clean.example"))
+        with self.assertRaises(safebrowsing.SafeBrowsingError):
+            client.lookup("malware.example")
+
+
+class TestURLExpressions(TestCase):
+    def test_expressions(self):
+        self.assertEqual(["example.com/"], safebrowsing.url_expressions("example.com"))
+        self.assertEqual(["a.b.c.d.e.f.g/", "c.d.e.f.g/", "d.e.f.g/", "e.f.g/", "f.g/"],
+                         safebrowsing.url_expressions("a.b.c.d.e.f.g"))
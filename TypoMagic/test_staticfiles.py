@@ -0,0 +1,61 @@
+import gzip
+import os
+import shutil
+import tempfile
+from email.utils import formatdate
+from unittest import TestCase
+
+import staticfiles
+
+
+class TestStaticFiles(TestCase):
+    def setUp(self):
+        self.strDir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.strDir, "root", "js"))
+        self.strScript = os.path.join(self.strDir, "root", "js", "app.js")
+        with open(self.strScript, "w") as f:
+            f.write("var x = 1;\n" * 200)
+        with open(os.path.join(self.strDir, "root", "secret.txt"), "w") as f:
+            f.write("secret")
+        with open(os.path.join(self.strDir, "outside.js"), "w") as f:
+            f.write("secret")
+        self.static = staticfiles.StaticFiles(os.path.join(self.strDir, "root"))
+
+    def tearDown(self):
+        shutil.rmtree(self.strDir)
+
+    def test_compressed(self):
+        staticfile = self.static.get("/js/app.js")
+        self.assertEqual("application/javascript", staticfile.strMimeType)
+        self.assertEqual(staticfile.data, gzip.decompress(staticfile.gzipped))
+        self.assertLess(len(staticfile.gzipped), len(staticfile.data))
+        self.assertIs(staticfile, self.static.get("/js/app.js"))
+
+    def test_conditional(self):
+        staticfile = self.static.get("/js/app.js")
+        self.assertTrue(staticfile.is_fresh(staticfile.strETag, None))
+        self.assertTrue(staticfile.is_fresh('"other", ' + staticfile.strETag, None))
+        self.assertNotEqual(staticfile.strETag, staticfile.strGzipETag)
+        self.assertTrue(staticfile.is_fresh(staticfile.strGzipETag, None))
+        self.assertTrue(staticfile.is_fresh('W/' + staticfile.strGzipETag, None))
+        self.assertFalse(staticfile.is_fresh('"other"', formatdate(staticfile.fModified + 60, usegmt=True)))
+        self.assertTrue(staticfile.is_fresh(None, formatdate(staticfile.fModified + 60, usegmt=True)))
+        self.assertFalse(staticfile.is_fresh(None, formatdate(staticfile.fModified - 60, usegmt=True)))
+        self.assertFalse(staticfile.is_fresh(None, "not a date"))
+        self.assertFalse(staticfile.is_fresh(None, None))
+
+    def test_reloaded_when_changed(self):
+        strETag = self.static.get("/js/app.js").strETag
+        with open(self.strScript, "w") as f:
+            f.write("var y = 2;\n")
+        os.utime(self.strScript, (0, 0))
+        staticfile = self.static.get("/js/app.js")
+        self.assertNotEqual(strETag, staticfile.strETag)
+        self.assertIsNone(staticfile.gzipped)
+        self.assertIsNone(staticfile.strGzipETag)
+
+    def test_only_known_files_under_root(self):
+        self.assertIsNone(self.static.get("/secret.txt"))
+        self.assertIsNone(self.static.get("/js/missing.js"))
+        self.assertIsNone(self.static.get("/../outside.js"))
+        self.assertIsNotNone(self.static.get("/js/../js/app.js"))
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import typocache
+
+
+class FakeTypogen(object):
+    def __init__(self):
+        self.iCalls = 0
+
+    def generatetyposv2(self, strHost, *args):
+        self.iCalls += 1
+        return sorted([strHost, "x" + strHost, str(args)])
+
+
+class TestTypoCache(TestCase):
+    def setUp(self):
+        self.strDir = tempfile.mkdtemp()
+        self.typogen = FakeTypogen()
+        self.strVersion = "0123456789abcdef"
+
+    def tearDown(self):
+        shutil.rmtree(self.strDir)
+
+    def make_cache(self, strDir=None):
+        return typocache.TypoCache(self.typogen, strDir=strDir, fnVersion=lambda: self.strVersion)
+
+    def test_keyed_on_options(self):
+        cache = self.make_cache()
+        lstTypos = cache.generatetyposv2("example.com")
+        self.assertEqual(lstTypos, cache.generatetyposv2("example.com"))
+        self.assertEqual(1, self.typogen.iCalls)
+
+        cache.generatetyposv2("example.com", "us")
+        cache.generatetyposv2("example.com", iLimit=10)
+        self.assertEqual(3, self.typogen.iCalls)
+        self.assertEqual(1, cache.stats()['hits'])
+
+        #Callers get their own copy
+        lstTypos.append("changed")
+        self.assertNotIn("changed", cache.generatetyposv2("example.com"))
+
+    def test_persisted_until_datasources_change(self):
+        self.make_cache(self.strDir).generatetyposv2("example.com")
+        cache = self.make_cache(self.strDir)
+        cache.generatetyposv2("example.com")
+        self.assertEqual(1, self.typogen.iCalls)
+        self.assertEqual(1, cache.stats()['disk_hits'])
+
+        #The data sources typogen has loaded don't change while it runs, so neither does the version
+        self.strVersion = "fedcba9876543210"
+        cache.generatetyposv2("example.com")
+        self.assertEqual(1, self.typogen.iCalls)
+        self.assertEqual("0123456789abcdef", cache.version())
+
+        #Until it's restarted with the new data sources
+        cache = self.make_cache(self.strDir)
+        self.assertEqual([], os.listdir(self.strDir))
+        cache.generatetyposv2("example.com")
+        self.assertEqual(2, self.typogen.iCalls)
+        self.assertEqual([self.strVersion], os.listdir(self.strDir))
+
+    def test_datasource_version(self):
+        strPath = os.path.join(self.strDir, "keybgb.txt")
+        with open(strPath, "w") as f:
+            f.write("qwerty")
+        strVersion = typocache.datasource_version([strPath])
+        self.assertEqual(strVersion, typocache.datasource_version([strPath]))
+        with open(strPath, "a") as f:
+            f.write("uiop")
+        self.assertNotEqual(strVersion, typocache.datasource_version([strPath]))
@@ -30,4 +30,48 @@ class TestTypogen(TestCase):
     def test_generate_miskeyed_addition_typos(self):
         result = typogen.generate_miskeyed_addition_typos("abc", "gb")
         self.assertListEqual(sorted(['abcd', 'abcf', 'abcv', 'abcx', 'abfc', 'abgc', 'abhc', 'abnc', 'abvc', 'aqbc', 'asbc', 'awbc', 'axbc', 'azbc',
-                              'abdc', 'abfc', 'abvc', 'abxc', 'afbc', 'agbc', 'ahbc', 'anbc', 'avbc', 'qabc', 'sabc', 'wabc', 'xabc', 'zabc']), sorted(result))
\ No newline at end of file
+                              'abdc', 'abfc', 'abvc', 'abxc', 'afbc', 'agbc', 'ahbc', 'anbc', 'avbc', 'qabc', 'sabc', 'wabc', 'xabc', 'zabc']), sorted(result))
+
+    def test_generate_homoglyph_confusables_typos(self):
+        import codecs
+        import typogen as typogen_module
+
+        typogen.loadconfusables()
+        confusables = typogen_module._homoglyphs_confusables
+
+        def brute_force(strHost):
+            #The original scan over every confusable subsequence
+            results = set()
+            for homoglyph_subsequence in confusables:
+                idx = strHost.find(homoglyph_subsequence)
+                while idx > -1:
+                    for replacement_subsequence in confusables[homoglyph_subsequence]:
+                        for newhostname in (strHost[:idx] + replacement_subsequence + strHost[idx + len(homoglyph_subsequence):],
+                                            strHost.replace(homoglyph_subsequence, replacement_subsequence)):
+                            try:
+                                results.add(str(codecs.encode(newhostname, "idna"), "ascii"))
+                            except UnicodeError:
+                                pass
+                    idx = strHost.find(homoglyph_subsequence, idx + len(homoglyph_subsequence))
+            return sorted(results)
+
+        for host in ("abc.com", "rnicrosoft.com", "wwwvvv.co.uk", "paypal.com", "aaaa.org"):
+            result = typogen.generate_homoglyph_confusables_typos(host)
+            self.assertListEqual(brute_force(host), sorted(result))
+            self.assertEqual(len(result), len(set(result)))
+
+    def test_generate_country_code_doppelgangers(self):
+        self.assertListEqual([], typogen.generate_country_code_doppelgangers("abc.com", 0))
+        all_codes = typogen.generate_country_code_doppelgangers("abc.com")
+        self.assertIn("usabc.com", all_codes)
+        self.assertIn("usaabc.com", all_codes)
+        self.assertEqual(len(all_codes), len(set(all_codes)))
+        #2 letter codes rank above 3 letter codes
+        self.assertTrue(all(len(typo) == len("xxabc.com") for typo in all_codes[:len(all_codes) // 3]))
+        self.assertTrue(all(len(typo) == len("xxxabc.com") for typo in all_codes[-len(all_codes) // 3:]))
+        #Intensity takes the most likely prefixes
+        some_codes = typogen.generate_country_code_doppelgangers("abc.com", 10)
+        self.assertListEqual(all_codes[:len(some_codes)], some_codes)
+        self.assertLess(len(some_codes), len(all_codes) // 5)
+        #The host's own ccTLD comes first
+        self.assertEqual("frabc.fr", typogen.generate_country_code_doppelgangers("abc.fr", 10)[0])
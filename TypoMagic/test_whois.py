@@ -0,0 +1,113 @@
+import asyncio
+import glob
+from unittest import TestCase
+
+import whois
+from whois import ServerScheduler, WhoisCache
+
+
+class FakeTime(object):
+    """A clock which only moves when slept on."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def clock(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestServerScheduler(TestCase):
+    def test_queries_spaced_and_rate_limits_retried(self):
+        fake = FakeTime()
+        lstQueries = list()
+        lstResponses = ["Domain Name: A.COM\n", "WHOIS LIMIT EXCEEDED\n", "Domain Name: B.COM\n"]
+
+        async def lookup(sServer, sQuery):
+            lstQueries.append((fake.now, sQuery))
+            return lstResponses.pop(0)
+
+        async def lookups():
+            scheduler = ServerScheduler(fInterval=1.0, fBackoff=10.0, lookup=lookup, clock=fake.clock, sleep=fake.sleep)
+            return [await scheduler.lookup("whois.example", "a.com"), await scheduler.lookup("whois.example", "b.com")]
+
+        self.assertEqual(["Domain Name: A.COM\n", "Domain Name: B.COM\n"], asyncio.run(lookups()))
+        self.assertEqual([(0.0, "a.com"), (1.0, "b.com"), (11.0, "b.com")], lstQueries)
+
+
+class TestWhoisCache(TestCase):
+    def test_concurrent_duplicates_looked_up_once(self):
+        cache = WhoisCache()
+        lstLookups = list()
+
+        async def lookup():
+            lstLookups.append(1)
+            await asyncio.sleep(0.1)
+            return "Domain Name: EXAMPLE.COM\n"
+
+        async def lookups():
+            return await asyncio.gather(*[cache.get("example.com", lookup) for _ in range(5)])
+
+        self.assertEqual(["Domain Name: EXAMPLE.COM\n"] * 5, asyncio.run(lookups()))
+        self.assertEqual(1, len(lstLookups))
+
+    def test_failures_not_cached(self):
+        cache = WhoisCache()
+
+        async def lookups():
+            async def timeout():
+                return "Timeout connecting to whois.example"
+
+            async def success():
+                return "Domain Name: EXAMPLE.COM\n"
+
+            await cache.get("example.com", timeout)
+            return await cache.get("example.com", success)
+
+        self.assertEqual("Domain Name: EXAMPLE.COM\n", asyncio.run(lookups()))
+
+
+class TestWhoisLookup(TestCase):
+    def test_multibyte_characters_split_between_reads(self):
+        response = "Registrant Name: Zoë Squatter\r\n".encode("utf-8")
+        split = response.index("ë".encode("utf-8")) + 1
+
+        async def handle(reader, writer):
+            self.assertEqual(b"xn--zo-ija.example\r\n", await reader.readline())
+            writer.write(response[:split])
+            await writer.drain()
+            await asyncio.sleep(0.05)
+            writer.write(response[split:])
+            writer.close()
+
+        async def lookup():
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            async with server:
+                return await whois._whois_lookup("127.0.0.1", "zoë.example", server.sockets[0].getsockname()[1])
+
+        self.assertEqual("Registrant Name: Zoë Squatter\r\n", asyncio.run(lookup()))
+
+
+class TestParse(TestCase):
+    def test_same_as_field_by_field(self):
+        lstPaths = glob.glob("testdata/whois/*.txt")
+        self.assertTrue(lstPaths)
+        for strPath in lstPaths:
+            with open(strPath, "r", encoding="utf-8") as f:
+                whois_str = f.read()
+            self.assertEqual(whois._parse_by_field(whois_str), whois.parse(whois_str), strPath)
+
+    def test_fields(self):
+        result = whois.parse("Registrant Name: A\nRegistrant Name: B\nOwner zip......: 99999\nAdmin Fax: null\n"
+                             "Registrar URL: http://registrar.example\nCreation Date: 2005-02-14\nTech Email: x")
+        self.assertEqual("A, B", result['registrant']['name'])
+        #Postal codes belong to the contact they are listed under
+        self.assertEqual("99999", result['registrant']['post_code'])
+        self.assertIsNone(result['tech']['post_code'])
+        self.assertIsNone(result['admin']['fax'])
+        self.assertEqual("http://registrar.example", result['registrar']['url'])
+        self.assertEqual(2005, result['date']['created'].year)
+        #Only complete lines are parsed
+        self.assertIsNone(result['tech']['email'])
@@ -0,0 +1,44 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# Helpers shared by the unit tests
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import atexit
+import os
+import shutil
+import tempfile
+
+import rankstore
+
+
+class FakeClock(object):
+    """A clock for the classes which take one, which only moves when a test sets or advances now."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def loadalexa(lstDomains=("google.com", "facebook.com", "example.com")):
+    """
+    A stand in for typogen.loadalexa, as the real Alexa list is only there once updatedatasources.py has been run.
+
+    @param lstDomains: The domains in the list, highest ranked first.
+    @return: A RankStore of the domains, compiled in a temporary directory.
+    """
+    strDir = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, strDir, True)
+    strCsvPath = os.path.join(strDir, "top-1m.csv")
+    with open(strCsvPath, "w") as f:
+        for iRank, strDomain in enumerate(lstDomains, 1):
+            f.write("%d,%s\n" % (iRank, strDomain))
+    return rankstore.load(strCsvPath, os.path.join(strDir, "top-1m.ranks"))
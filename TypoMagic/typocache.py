@@ -0,0 +1,150 @@
+#
+# Typofinder for domain typo discovery
+#
+# Released as open source by NCC Group Plc - http://www.nccgroup.com/
+#
+# Cache of generated typo lists, so that repeated searches for the same domain with the same options are instant
+#
+# http://www.github.com/nccgroup/typofinder
+#
+# Released under AGPL see LICENSE for more information
+#
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from lrucache import LRUCache
+
+#Bump this whenever a change to typogen changes the typos it generates, to invalidate existing caches
+GENERATOR_VERSION = 1
+#The data sources typo generation depends on
+DATASOURCES = ("datasources/effective_tld_names.dat", "datasources/tlds-alpha-by-domain.txt", "datasources/keyb*.txt",
+               "datasources/homoglyphs.txt", "datasources/confusables.txt", "datasources/top-1m.csv",
+               "datasources/countrynames.txt", "datasources/subdomains.txt")
+
+
+def datasource_version(lstPatterns=DATASOURCES):
+    """
+    @param lstPatterns: The glob patterns of the data source files.
+    @return: A digest of the generator version and the names, sizes and modification times of the data source files,
+    which changes whenever any of them is updated. The files aren't read, as the Alexa list alone is tens of megabytes.
+    """
+    digest = hashlib.sha256(str(GENERATOR_VERSION).encode('utf-8'))
+    for strPattern in lstPatterns:
+        for strPath in sorted(glob.glob(strPattern)):
+            stat = os.stat(strPath)
+            digest.update(("%s:%d:%d;" % (strPath, stat.st_size, stat.st_mtime_ns)).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class TypoCache(object):
+    """
+    Caches the typo lists generated by typogen.generatetyposv2, in memory and optionally on disk. Lists are keyed on
+    the domain and every generation option, along with the version of the data sources, so lists generated from old
+    data sources aren't used after a restart with new ones. Safe to share between threads.
+
+    typogen loads its data sources once per process, so the version is taken once, when the cache is created alongside
+    the typogen instance. Checking the files again later would store lists generated from the data in memory under the
+    version of the files on disk.
+    """
+
+    def __init__(self, typogen, maxsize=256, strDir=None, fnVersion=datasource_version):
+        """
+        @param typogen: The typogen instance to generate typos with on a miss, which has loaded its data sources.
+        @param maxsize: The maximum number of typo lists to hold in memory.
+        @param strDir: The directory to also cache typo lists in across restarts, or None to only cache in memory.
+        @param fnVersion: The function returning the data source version, replaceable for testing.
+        """
+        self._typogen = typogen
+        self.strDir = strDir
+        self._memory = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self._strVersion = fnVersion()
+        self.iDiskHits = 0
+        #Lists cached on disk for other versions will never be used again
+        self._prune(self._strVersion)
+
+    def version(self):
+        """
+        @return: The version of the data sources the typos are generated from.
+        """
+        return self._strVersion
+
+    def _prune(self, strVersion):
+        """Removes the lists cached on disk for other data source versions."""
+        if self.strDir is None:
+            return
+        try:
+            for strEntry in os.listdir(self.strDir):
+                #Only touch what looks like one of our version directories
+                if strEntry != strVersion and len(strEntry) == 16 and \
+                        all(c in "0123456789abcdef" for c in strEntry):
+                    shutil.rmtree(os.path.join(self.strDir, strEntry), ignore_errors=True)
+        except OSError:
+            #No cache directory yet
+            pass
+
+    def _path(self, strVersion, strKey):
+        return os.path.join(self.strDir, strVersion, hashlib.sha256(strKey.encode('utf-8')).hexdigest() + ".json")
+
+    def _load(self, strVersion, strKey):
+        if self.strDir is None:
+            return None
+        try:
+            with open(self._path(strVersion, strKey), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _store(self, strVersion, strKey, lstTypos):
+        if self.strDir is None:
+            return
+        try:
+            os.makedirs(os.path.join(self.strDir, strVersion), exist_ok=True)
+            fd, strTempPath = tempfile.mkstemp(dir=os.path.join(self.strDir, strVersion), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(lstTypos, f)
+            os.replace(strTempPath, self._path(strVersion, strKey))
+        except (IOError, OSError):
+            print("[!] Unable to write to the typo cache in " + self.strDir)
+
+    def generatetyposv2(self, strHost, strCountry="gb", bTypos=True, iTypoIntensity=100, bTLDS=False, bBitFlip=True,
+                        bHomoglyphs=True, bDoppelganger=True, bOnlyAlexa=False, bNeverAlexa=False, icharsetamount=100,
+                        iLimit=None, iCountryCodeIntensity=0):
+        """
+        As typogen.generatetyposv2, but answered from the cache when the same typos have been generated before.
+
+        @return: A new list of the typos.
+        """
+        strVersion = self.version()
+        strKey = json.dumps([strVersion, strHost, strCountry, bTypos, iTypoIntensity, bTLDS, bBitFlip, bHomoglyphs,
+                             bDoppelganger, bOnlyAlexa, bNeverAlexa, icharsetamount, iLimit, iCountryCodeIntensity])
+
+        lstTypos = self._memory.get(strKey)
+        if lstTypos is None:
+            lstTypos = self._load(strVersion, strKey)
+            if lstTypos is not None:
+                with self._lock:
+                    self.iDiskHits += 1
+            else:
+                lstTypos = self._typogen.generatetyposv2(strHost, strCountry, bTypos, iTypoIntensity, bTLDS, bBitFlip,
+                                                         bHomoglyphs, bDoppelganger, bOnlyAlexa, bNeverAlexa,
+                                                         icharsetamount, iLimit, iCountryCodeIntensity)
+                self._store(strVersion, strKey, lstTypos)
+            self._memory.put(strKey, lstTypos)
+        return list(lstTypos)
+
+    def stats(self):
+        """
+        @return: A dict of the in memory cache's size and hit/miss counters, plus the number of its misses which were
+        answered from disk.
+        """
+        dictStats = self._memory.stats()
+        with self._lock:
+            dictStats['disk_hits'] = self.iDiskHits
+        return dictStats
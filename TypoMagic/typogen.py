@@ -11,44 +11,157 @@
 #
 
 import re
-import copy
+import glob
+import itertools
 import codecs
 import stringprep
+import threading
+import time
 from publicsuffix import PublicSuffixList
 
+import datacache
+import metrics
+import rankstore
+from ahocorasick import Automaton
+
+
+_stage_seconds = metrics.histogram("typofinder_typogen_stage_seconds",
+                                   "Time spent inside each typo generation stage, excluding the consumer", ("stage", ))
+_generate_seconds = metrics.histogram("typofinder_typogen_seconds", "Complete typo list generations")
+
+
+def _timed(strStage, candidates):
+    """
+    @param strStage: The name of the generation stage.
+    @param candidates: The stage's candidates.
+    @return: A generator of the candidates, which records the time spent producing them. Only the time inside the
+    stage is counted, not the time the consumer spends between candidates, e.g. waiting on lookups when streaming.
+    """
+    fElapsed = 0.0
+    iterator = iter(candidates)
+    try:
+        while True:
+            fStart = time.perf_counter()
+            try:
+                candidate = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                fElapsed += time.perf_counter() - fStart
+            yield candidate
+    finally:
+        _stage_seconds.observe(fElapsed, stage=strStage)
+
+
+def loadpublicsuffixlist():
+    filename = "datasources/effective_tld_names.dat"
+    return datacache.load("publicsuffix", [filename],
+                          lambda: PublicSuffixList(input_file=codecs.open(filename, "r", "utf8")))
+
 
 class typogen(object):
     """generate typo"""
-    psl = PublicSuffixList(input_file=codecs.open("datasources/effective_tld_names.dat", "r", "utf8"))
+    psl = loadpublicsuffixlist()
+
+    #Shared, memory-mapped store of the Alexa top 1m ranks, opened by the first typogen instance
+    alexa_top = None
 
-    alexa_top = {}
+    #Data sources which are loaded once, on first use, then shared read only between all instances and threads
+    _shared_data = dict()
+    _shared_lock = threading.Lock()
 
     def __init__(self):
         #Load up the list of TLDs
-        self.lstTlds = list()
-        filename = "datasources/tlds-alpha-by-domain.txt"
-        with open(filename) as f:
-            for line in f:
-                if not line.lstrip().startswith('#'):
-                    self.lstTlds.append(line.rstrip().lower())
+        self.lstTlds = self.loadtlds()
         print("Loading confusables...", end=" ", flush=True)
         self.loadconfusables()
         print("Loading Alexa data...", end=" ", flush=True)
-        with open(r'datasources/top-1m.csv') as top1m:
-            for line in top1m:
-                parts = line.rstrip().split(',', 1)
-                if len(parts) == 2:
-                    self.alexa_top[parts[1]] = int(parts[0])
+        if typogen.alexa_top is None:
+            typogen.alexa_top = typogen.loadalexa()
         print("Done.")
 
 
+    @staticmethod
+    def _shared(strName, fnLoad):
+        """
+        Returns the shared copy of a data source, loading it with fnLoad if this is the first use. Callers must not
+        modify the returned data.
+        """
+        try:
+            return typogen._shared_data[strName]
+        except KeyError:
+            with typogen._shared_lock:
+                if strName not in typogen._shared_data:
+                    typogen._shared_data[strName] = fnLoad()
+                return typogen._shared_data[strName]
+
+    @staticmethod
+    def keyboards():
+        """
+        @return: The registry of keyboard layouts, a dict of layout name (e.g. "gb" for keybgb.txt) -> keyboard map.
+        """
+        return typogen._shared("keyboards", typogen.loadkeyboards)
+
+    @staticmethod
+    def getkeyb(strCountry):
+        """
+        @param strCountry: The name of the keyboard layout, e.g. "gb".
+        @return: The shared keyboard map for the layout.
+        @raise ValueError: If there is no such layout.
+        """
+        try:
+            return typogen.keyboards()[strCountry]
+        except KeyError:
+            raise ValueError("Unknown keyboard layout " + strCountry)
+
+    @staticmethod
+    def compiledatasources():
+        """
+        Compiles every data source into the on-disk cache (see datacache.py), rebuilding any which are out of date.
+        """
+        loadpublicsuffixlist()
+        typogen.loadtlds()
+        typogen.loadconfusables()
+        typogen.loadadditionalhomoglyphs()
+        typogen.loadkeyboards()
+        typogen.loadalexa().close()
+
+    @staticmethod
+    def loadalexa():
+        return rankstore.load("datasources/top-1m.csv", datacache.CACHE_DIR + "/top-1m.ranks")
+
+    @staticmethod
+    def loadtlds():
+        filename = "datasources/tlds-alpha-by-domain.txt"
+        return datacache.load("tlds", [filename], lambda: typogen._parsetlds(filename))
+
+    @staticmethod
+    def _parsetlds(filename):
+        lstTlds = list()
+        with open(filename) as f:
+            for line in f:
+                if not line.lstrip().startswith('#'):
+                    lstTlds.append(line.rstrip().lower())
+        return lstTlds
+
+    @staticmethod
+    def loadkeyboards():
+        keyboards = dict()
+        for filename in glob.glob("datasources/keyb*.txt"):
+            strCountry = filename[len("datasources/keyb"):-len(".txt")]
+            keyboards[strCountry] = typogen.loadkeyb(strCountry)
+        return keyboards
+
     @staticmethod
     def loadkeyb(strCountry):
+        # obviously you can have other maps here, just add another datasources/keyb<name>.txt
+        filename = "datasources/keyb" + strCountry + ".txt"
+        return datacache.load("keyb" + strCountry, [filename], lambda: typogen._parsekeyb(filename))
+
+    @staticmethod
+    def _parsekeyb(filename):
         keyDict = dict()
 
-        # obviously you can have other maps here
-        # I've only included this one
-        filename = "datasources/keyb" + strCountry + ".txt"
         with open(filename) as f:
             for line in f:
                 split = line.rstrip().split(',')
@@ -61,8 +174,13 @@ class typogen(object):
 
     @staticmethod
     def loadadditionalhomoglyphs():
+        filename = "datasources/homoglyphs.txt"
+        return datacache.load("homoglyphs", [filename], lambda: typogen._parseadditionalhomoglyphs(filename))
+
+    @staticmethod
+    def _parseadditionalhomoglyphs(filename):
         homoglyphs = dict()
-        with open("datasources/homoglyphs.txt", "r", encoding="utf8") as f:
+        with open(filename, "r", encoding="utf8") as f:
             for line in f:
                 if not line.startswith("#"):
                     split = line.rstrip().split(',')
@@ -84,12 +202,18 @@ class typogen(object):
 
     @staticmethod
     def loadconfusables():
-        global _homoglyphs_confusables
-        _homoglyphs_confusables = dict()
+        global _homoglyphs_confusables, _confusables_matcher
+        filename = "datasources/confusables.txt"
+        _homoglyphs_confusables = datacache.load("confusables", [filename], lambda: typogen._parseconfusables(filename))
+        _confusables_matcher = Automaton(_homoglyphs_confusables)
+
+    @staticmethod
+    def _parseconfusables(filename):
+        confusables = dict()
         rejected_sequences = set()
 
         #'utf_8_sig' swallows the BOM at start of file
-        with open("datasources/confusables.txt", "r", encoding="'utf_8_sig") as f:
+        with open(filename, "r", encoding="'utf_8_sig") as f:
             for line in f:
                 #If line contains more than whitespace and isn't a comment
                 if line.strip() and not line.startswith("#"):
@@ -110,7 +234,7 @@ class typogen(object):
                         continue
 
                     #Skip pairs already in the _homoglyphs dict
-                    if part0 in _homoglyphs_confusables and part1 in _homoglyphs_confusables[part0]:
+                    if part0 in confusables and part1 in confusables[part0]:
                         continue
 
                     try:
@@ -134,14 +258,16 @@ class typogen(object):
                         continue
 
                     #Include left to right pair mapping in the dict
-                    if part0 not in _homoglyphs_confusables:
-                        _homoglyphs_confusables[part0] = set()
-                    _homoglyphs_confusables[part0].add(part1)
+                    if part0 not in confusables:
+                        confusables[part0] = set()
+                    confusables[part0].add(part1)
 
                     #Include right to left pair mapping in the dict
-                    if part1 not in _homoglyphs_confusables:
-                        _homoglyphs_confusables[part1] = set()
-                    _homoglyphs_confusables[part1].add(part0)
+                    if part1 not in confusables:
+                        confusables[part1] = set()
+                    confusables[part1].add(part0)
+
+        return confusables
 
     def is_domain_valid(self, domain):
         #Ensure its in the correct character set
@@ -176,24 +302,85 @@ class typogen(object):
         return result
 
     @staticmethod
-    def generate_country_code_doppelgangers(strHost):
-        result = list()
-        with open("datasources/countrynames.txt", 'r', encoding="UTF-8") as countrynames:
+    def loadcountrycodes():
+        filename = "datasources/countrynames.txt"
+        psl_filename = "datasources/effective_tld_names.dat"
+        return datacache.load("countrycodes", [filename, psl_filename],
+                              lambda: typogen._parsecountrycodes(filename, psl_filename))
+
+    @staticmethod
+    def _parsecountrycodes(filename, psl_filename):
+        """
+        Builds the table of country code prefixes used for doppelgangers, most likely first. 2 letter codes rank above 3
+        letter codes, then countries rank by how many public suffix rules sit under their ccTLD, a rough measure of
+        how busy that country's domain space is.
+
+        @return: The ranked list of lower case country code prefixes.
+        """
+        rules_per_tld = dict()
+        with open(psl_filename, "r", encoding="utf8") as psl:
+            for line in psl:
+                line = line.strip()
+                if line and not line.startswith("//"):
+                    tld = line.split('.')[-1].lstrip('!*')
+                    rules_per_tld[tld] = rules_per_tld.get(tld, 0) + 1
+
+        alpha2 = list()
+        alpha3 = list()
+        with open(filename, 'r', encoding="UTF-8") as countrynames:
             for line in countrynames:
                 if not line.startswith('#'):
                     parts = line.split(';', maxsplit=2)
-                    # 2 letter country code subdomain, but without the dot
-                    result.append(parts[0].strip().lower() + strHost)
-                    # 3 letter country code subdomain, but without the dot
-                    result.append(parts[1].strip().lower() + strHost)
-        return result
+                    code2 = parts[0].strip().lower()
+                    popularity = rules_per_tld.get(code2, 0)
+                    # 2 letter country code
+                    alpha2.append((popularity, code2))
+                    # 3 letter country code
+                    alpha3.append((popularity, parts[1].strip().lower()))
+
+        ranked = list()
+        for codes in (alpha2, alpha3):
+            for popularity, code in sorted(codes, key=lambda entry: (-entry[0], entry[1])):
+                if code not in ranked:
+                    ranked.append(code)
+        return ranked
+
+    @staticmethod
+    def loadsubdomains():
+        with open("datasources/subdomains.txt", 'r') as subdomains:
+            return [subdomain.strip() for subdomain in subdomains]
+
+    @staticmethod
+    def generate_country_code_doppelgangers(strHost, iIntensity=100):
+        """
+        Prefixes the host with country codes, e.g. ukexample.com, most likely first.
+
+        @param strHost: The hostname to generate doppelgangers for.
+        @param iIntensity: The percentage of the ranked country codes to use.
+        @return: The list of doppelgangers.
+        """
+        countrycodes = typogen._shared("countrycodes", typogen.loadcountrycodes)
+        count = (len(countrycodes) * max(0, min(iIntensity, 100)) + 99) // 100
+
+        # the country of the host's own ccTLD (if any) is the most likely of all
+        tld = strHost[strHost.rfind('.') + 1:]
+        if len(tld) != 2:
+            prefixes = countrycodes[:count]
+        elif tld in countrycodes[:count]:
+            prefixes = [tld] + [countrycode for countrycode in countrycodes[:count] if countrycode != tld]
+        elif tld in countrycodes and count:
+            prefixes = [tld] + countrycodes[:count - 1]
+        else:
+            prefixes = countrycodes[:count]
+
+        # country code subdomain, but without the dot
+        return [countrycode + strHost for countrycode in prefixes]
 
     @staticmethod
     def generate_subdomain_doppelgangers(strHost):
         result = list()
-        with open("datasources/subdomains.txt", 'r') as subdomains:
-            for subdomain in subdomains:
-                result.append(subdomain.strip() + strHost)
+        for subdomain in typogen._shared("subdomains", typogen.loadsubdomains):
+            result.append(subdomain + strHost)
         return result
 
     @staticmethod
@@ -255,8 +442,8 @@ class typogen(object):
         # swap to a surrounding key for each character
 
         result = list()
-        # load keyboard mapping
-        typoDict = typogen.loadkeyb(strCountry)
+        # shared keyboard mapping
+        typoDict = typogen.getkeyb(strCountry)
 
         for idx, char in enumerate(strHost):
             if char in typoDict:
@@ -268,45 +455,46 @@ class typogen(object):
     def generate_homoglyph_confusables_typos(strHost):
         # swap characters to similar looking characters, based on Unicode's confusables.txt
 
-        results = list()
-        global _homoglyphs_confusables
-        #Replace each homoglyph subsequence in the strHost with each replacement subsequence associated with the homoglyph subsequence
-        for homoglyph_subsequence in _homoglyphs_confusables:
-            idx = 0
-            while 1:
-                idx = strHost.find(homoglyph_subsequence, idx)
-                if idx > -1:
-                    for replacement_subsequence in _homoglyphs_confusables[homoglyph_subsequence]:
-                        #Add with just one change
-                        newhostname = strHost[:idx] + replacement_subsequence + strHost[idx + len(homoglyph_subsequence):]
-                        try:
-                            results.append(str(codecs.encode(newhostname, "idna"), "ascii"))
-                        except UnicodeError:
-                            #This can be caused by domain parts which are too long for IDNA encoding, so just skip it
-                            pass
-
-                        #Add with all occurrences changed
-                        newhostname = strHost.replace(homoglyph_subsequence, replacement_subsequence)
-                        try:
-                            if newhostname not in results:
-                                results.append(str(codecs.encode(newhostname, "idna"), "ascii"))
-                        except UnicodeError:
-                            #This can be caused by domain parts which are too long for IDNA encoding, so just skip it
-                            pass
-
-                    idx += len(homoglyph_subsequence)
-                else:
-                    break
+        results = set()
+        global _homoglyphs_confusables, _confusables_matcher
+        #The index that the next occurrence of each homoglyph subsequence must start at. As with str.replace(), only
+        #non-overlapping occurrences of the same subsequence are swapped.
+        next_idx = dict()
+        #Find every homoglyph subsequence in the strHost in one pass, and replace each with each replacement
+        #subsequence associated with it
+        for idx, homoglyph_subsequence in _confusables_matcher.find_all(strHost):
+            if idx < next_idx.get(homoglyph_subsequence, 0):
+                continue
+            first_occurrence = homoglyph_subsequence not in next_idx
+            next_idx[homoglyph_subsequence] = idx + len(homoglyph_subsequence)
+
+            for replacement_subsequence in _homoglyphs_confusables[homoglyph_subsequence]:
+                #Add with just one change
+                newhostname = strHost[:idx] + replacement_subsequence + strHost[idx + len(homoglyph_subsequence):]
+                try:
+                    results.add(str(codecs.encode(newhostname, "idna"), "ascii"))
+                except UnicodeError:
+                    #This can be caused by domain parts which are too long for IDNA encoding, so just skip it
+                    pass
+
+                #Add with all occurrences changed, which is the same for every occurrence so only do it once
+                if first_occurrence:
+                    newhostname = strHost.replace(homoglyph_subsequence, replacement_subsequence)
+                    try:
+                        results.add(str(codecs.encode(newhostname, "idna"), "ascii"))
+                    except UnicodeError:
+                        #This can be caused by domain parts which are too long for IDNA encoding, so just skip it
+                        pass
 
-        return results
+        return list(results)
 
     @staticmethod
     def generate_additional_homoglyph_typos(strHost):
         # swap characters to similar looking characters, based on homoglyphs.txt
 
         result = list()
-        # load homoglyph mapping
-        homoglyphs = typogen.loadadditionalhomoglyphs()
+        # shared homoglyph mapping
+        homoglyphs = typogen._shared("homoglyphs", typogen.loadadditionalhomoglyphs)
 
         for idx, char in enumerate(strHost):
             if char in homoglyphs:
@@ -325,8 +513,8 @@ class typogen(object):
         # add a surrounding key either side of each character
 
         result = list()
-        # load keyboard mapping
-        typoDict = typogen.loadkeyb(strCountry)
+        # shared keyboard mapping
+        typoDict = typogen.getkeyb(strCountry)
 
         for idx, char in enumerate(strHost):
             if char in typoDict:
@@ -340,8 +528,8 @@ class typogen(object):
         # repeated surrounding keys for any character sequences in the string
 
         result = list()
-        # load keyboard mapping
-        typoDict = typogen.loadkeyb(strCountry)
+        # shared keyboard mapping
+        typoDict = typogen.getkeyb(strCountry)
 
         idx = 0
         while idx < len(strHost):
@@ -400,79 +588,119 @@ class typogen(object):
             return typogen.is_ascii(domainname)
 
 
-    def generatetyposv2(self, strHost, strCountry="gb", bTypos=True, iTypoIntensity=100, bTLDS=False, bBitFlip=True,
-                        bHomoglyphs=True, bDoppelganger=True, bOnlyAlexa=False, bNeverAlexa=False, icharsetamount=100):
-        """
-        generate the typos
+    def generate_tld_swapped_typos(self, strHost):
+        # swap the public suffix for each TLD
+        public_suffix = self.psl.get_public_suffix(strHost)
+        no_suffix = public_suffix[:public_suffix.find('.')] + '.'
+        return (no_suffix + gtld for gtld in self.lstTlds)
 
-        @param strHost The hostname to generate typos for
-        @param strCountry The country code of the keyboard to use when generating miskeyed typos
-        @param bTypos Flag to indicate that typos should be generated
-        @param iTypoIntensity A percentage of how intense the typo generation should be.
-        @param bTLDS Flag to indicate that the TLDs should be swapped
-        @param bBitFlip Flag to indicate that the hostname should be bitflipped
-        @param bHomoglyphs Flag to indicate that homoglyphs should be generated
-        @param bDoppelganger Flag to indicate that domain doppleganers should be generated
-        @param bOnlyAlexa Flag to indicate that only results which appear in the Alexa top 1m domains should be returned
-        @param bNeverAlexa Flag to indicate that results which are in the Alexa top 1m domains should not be returned
+    def _itercandidates(self, strHost, strCountry, bTypos, iTypoIntensity, bTLDS, bBitFlip, bHomoglyphs,
+                        bDoppelganger, iCountryCodeIntensity):
         """
+        Lazily runs each enabled stage of generators in turn, so that no generator runs until the previous one's
+        candidates have been consumed.
 
-        # result list of typos
-        lstTypos = []
-
+        @return: A generator of candidate (IDNA encoded) typo domains, which may contain duplicates and invalid domains.
+        """
         if bBitFlip:
-            lstTypos += self.bitflipstring(strHost)
+            yield from _timed("bitflip", self.bitflipstring(strHost))
 
         if bTypos:
-            #Quick:
-            lstTypos += self.generate_missing_character_typos(strHost)
-            lstTypos += self.generate_duplicate_character_typos(strHost)
-            #Balanced:
-            if iTypoIntensity > 0:
-                lstTypos += self.generate_miskeyed_typos(strHost, strCountry)
-                lstTypos += self.generate_miskeyed_sequence_typos(strHost, strCountry)
-            #Rigorous:
-            if iTypoIntensity > 50:
-                lstTypos += self.generate_transposed_character_typos(strHost)
-                lstTypos += self.generate_miskeyed_addition_typos(strHost, strCountry)
+            yield from _timed("typos", self._itertypos(strHost, strCountry, iTypoIntensity))
 
         if bTLDS:
-            public_suffix = self.psl.get_public_suffix(strHost)
-            no_suffix = public_suffix[:public_suffix.find('.')] + '.'
-            # Add each TLD
-            for gtld in self.lstTlds:
-                newHost = no_suffix + gtld
-                lstTypos.append(newHost)
+            yield from _timed("tlds", self.generate_tld_swapped_typos(strHost))
 
         if bHomoglyphs:
-            lstTypos += self.generate_homoglyph_confusables_typos(strHost)
-            lstTypos += self.generate_additional_homoglyph_typos(strHost)
+            yield from _timed("homoglyphs", self._iterhomoglyphs(strHost))
 
         if bDoppelganger:
-            #Commented out until a slider is put in - this following line results in Ssssllloooowwww searches
-            #lstTypos += self.generate_country_code_doppelgangers(strHost)
-            lstTypos += self.generate_subdomain_doppelgangers(strHost)
-            lstTypos += self.generate_extra_dot_doppelgangers(strHost)
-
-        uniqueTypos = set(lstTypos)
-        # Remove any invalid typos
-        for typo in copy.copy(uniqueTypos):
+            yield from _timed("doppelganger", self._iterdoppelgangers(strHost, iCountryCodeIntensity))
+
+    def _itertypos(self, strHost, strCountry, iTypoIntensity):
+        #Quick:
+        yield from self.generate_missing_character_typos(strHost)
+        yield from self.generate_duplicate_character_typos(strHost)
+        #Balanced:
+        if iTypoIntensity > 0:
+            yield from self.generate_miskeyed_typos(strHost, strCountry)
+            yield from self.generate_miskeyed_sequence_typos(strHost, strCountry)
+        #Rigorous:
+        if iTypoIntensity > 50:
+            yield from self.generate_transposed_character_typos(strHost)
+            yield from self.generate_miskeyed_addition_typos(strHost, strCountry)
+
+    def _iterhomoglyphs(self, strHost):
+        yield from self.generate_homoglyph_confusables_typos(strHost)
+        yield from self.generate_additional_homoglyph_typos(strHost)
+
+    def _iterdoppelgangers(self, strHost, iCountryCodeIntensity):
+        yield from self.generate_subdomain_doppelgangers(strHost)
+        yield from self.generate_extra_dot_doppelgangers(strHost)
+        if iCountryCodeIntensity > 0:
+            yield from self.generate_country_code_doppelgangers(strHost, iCountryCodeIntensity)
+
+    def itertyposv2(self, strHost, strCountry="gb", bTypos=True, iTypoIntensity=100, bTLDS=False, bBitFlip=True,
+                    bHomoglyphs=True, bDoppelganger=True, bOnlyAlexa=False, bNeverAlexa=False, icharsetamount=100,
+                    iCountryCodeIntensity=0):
+        """
+        Lazily generates the typos, filtering each candidate as it is produced. The parameters are as for
+        generatetyposv2, which this underlies.
+
+        @return: A generator of unique, unicode typo domains in generation order, starting with strHost itself.
+        """
+        seen = set()
+
+        # The original domain comes first, for comparison purposes and to ensure we have at least one result
+        seen.add(strHost)
+        unicode_host = codecs.decode(strHost.encode(), "idna")
+        if typogen.is_in_charset(unicode_host, icharsetamount):
+            yield unicode_host
+
+        for typo in self._itercandidates(strHost, strCountry, bTypos, iTypoIntensity, bTLDS, bBitFlip, bHomoglyphs,
+                                         bDoppelganger, iCountryCodeIntensity):
+            if typo in seen:
+                continue
+            seen.add(typo)
+
+            # Remove any invalid typos
             if not self.is_domain_valid(typo):
-                uniqueTypos.remove(typo)
+                continue
             elif bOnlyAlexa and typo not in self.alexa_top:
-                uniqueTypos.remove(typo)
+                continue
             elif bNeverAlexa and typo in self.alexa_top:
-                uniqueTypos.remove(typo)
+                continue
 
-        # Add the original domain for comparison purposes and to ensure we have at least one result
-        try:
-            uniqueTypos.add(strHost)
-        except KeyError:
-            pass
+            try:
+                unicode_typo = codecs.decode(typo.encode(), "idna")
+            except UnicodeError:
+                #Not valid punycode, e.g. an "xn--" label produced by bit flipping
+                continue
 
-        unicode_typos = sorted([codecs.decode(asciiHost.encode(), "idna") for asciiHost in uniqueTypos])
-        for typo in copy.copy(unicode_typos):
-            if not typogen.is_in_charset(typo, icharsetamount):
-                unicode_typos.remove(typo)
+            if typogen.is_in_charset(unicode_typo, icharsetamount):
+                yield unicode_typo
 
-        return unicode_typos
+    def generatetyposv2(self, strHost, strCountry="gb", bTypos=True, iTypoIntensity=100, bTLDS=False, bBitFlip=True,
+                        bHomoglyphs=True, bDoppelganger=True, bOnlyAlexa=False, bNeverAlexa=False, icharsetamount=100,
+                        iLimit=None, iCountryCodeIntensity=0):
+        """
+        generate the typos
+
+        @param strHost The hostname to generate typos for
+        @param strCountry The country code of the keyboard to use when generating miskeyed typos
+        @param bTypos Flag to indicate that typos should be generated
+        @param iTypoIntensity A percentage of how intense the typo generation should be.
+        @param bTLDS Flag to indicate that the TLDs should be swapped
+        @param bBitFlip Flag to indicate that the hostname should be bitflipped
+        @param bHomoglyphs Flag to indicate that homoglyphs should be generated
+        @param bDoppelganger Flag to indicate that domain doppleganers should be generated
+        @param bOnlyAlexa Flag to indicate that only results which appear in the Alexa top 1m domains should be returned
+        @param bNeverAlexa Flag to indicate that results which are in the Alexa top 1m domains should not be returned
+        @param icharsetamount The character set typos must be in: 100 for all, 50 for RFC3491 and 0 for ASCII only
+        @param iLimit The maximum number of typos to return, generation stops once this many are found. None for all.
+        @param iCountryCodeIntensity A percentage of the ranked country codes to use for doppelgangers, 0 for none.
+        """
+        with _generate_seconds.time():
+            typos = self.itertyposv2(strHost, strCountry, bTypos, iTypoIntensity, bTLDS, bBitFlip, bHomoglyphs,
+                                     bDoppelganger, bOnlyAlexa, bNeverAlexa, icharsetamount, iCountryCodeIntensity)
+            return sorted(itertools.islice(typos, iLimit))
@@ -47,5 +47,12 @@ print('.', end='', flush=True)
 
 urllib.request.urlretrieve("http://geolite.maxmind.com/download/geoip/database/GeoIPv6.dat.gz", "datasources/GeoIPv6.dat.gz")
 ungzip("datasources/GeoIPv6.dat.gz", "datasources/GeoIPv6.dat")
+print('.', end='', flush=True)
+
+#Recompile the data source cache from the refreshed files
+import datacache
+from typogen import typogen
+datacache.clear()
+typogen.compiledatasources()
 
 print(' Done')
\ No newline at end of file
@@ -15,11 +15,20 @@
 # Released under AGPL see LICENSE for more information
 #
 
-import socket
+import asyncio
 import codecs
+import hashlib
+import os
 import re
+import tempfile
+import threading
+import time
+from functools import lru_cache
 
 from publicsuffix import PublicSuffixList
+import datacache
+import metrics
+from lrucache import LRUCache
 import datetime
 import pprint
 import sys
@@ -36,6 +45,33 @@ RATE_LIMITTED_RESPONSES = ("WHOIS LIMIT EXCEEDED",
                            "Still in grace period, wait",
                            "Permission denied.")
 
+#Seconds to wait for a whois server to accept a connection, and for each read from it
+WHOIS_TIMEOUT = 5
+#Maximum number of bytes to read from a whois server
+WHOIS_MAX_RESPONSE = 10000
+#Maximum number of domains whois_many looks up at once
+MAX_CONCURRENT_LOOKUPS = 50
+
+#Seconds a whois result is cached for
+WHOIS_CACHE_TTL = 86400
+#Directory to also cache whois results in, so that they survive restarts, or None to only cache in memory
+WHOIS_CACHE_DIR = None
+#Responses which mean the query failed, so mustn't be cached
+FAILED_RESPONSES = ("Timeout connecting to ", "Unable to connect to ", "Rate limited by ", "Empty response from ")
+
+_whois_seconds = metrics.histogram("typofinder_whois_seconds",
+                                   "Whois lookups by outcome, including those answered from the cache", ("outcome", ))
+_server_seconds = metrics.histogram("typofinder_whois_server_seconds", "Queries sent to whois servers")
+
+#Maximum number of connections open to any one whois server at once
+MAX_CONNECTIONS_PER_SERVER = 2
+#Minimum number of seconds between starting queries to the same whois server
+MIN_QUERY_INTERVAL = 1.0
+#Number of seconds to leave a whois server alone for after it rate limits us, doubling each time in a row it does so
+RATE_LIMIT_BACKOFF = 10.0
+#Number of times to retry a query which was rate limited
+RATE_LIMIT_RETRIES = 3
+
 _tld_to_whois = dict()
 
 with open("datasources/whois-servers.txt", "r") as whois_servers:
@@ -45,72 +81,295 @@ with open("datasources/whois-servers.txt", "r") as whois_servers:
         parts = line.split(' ')
         _tld_to_whois['.' + parts[0].strip()] = parts[1].strip()
 
-_psl = PublicSuffixList(input_file=codecs.open("datasources/effective_tld_names.dat", "r", "utf8"))
+_psl = datacache.load("publicsuffix", ["datasources/effective_tld_names.dat"],
+                      lambda: PublicSuffixList(input_file=codecs.open("datasources/effective_tld_names.dat", "r", "utf8")))
+
+
+class ServerScheduler(object):
+    """
+    Queues queries to each whois server, so that no more than MAX_CONNECTIONS_PER_SERVER are open to it at once and
+    they start at least MIN_QUERY_INTERVAL seconds apart. Servers which rate limit us are backed off from, and the
+    query is retried after the back off rather than failing. Must only be used from a single event loop.
+    """
+
+    def __init__(self, iMaxConnections=MAX_CONNECTIONS_PER_SERVER, fInterval=MIN_QUERY_INTERVAL,
+                 fBackoff=RATE_LIMIT_BACKOFF, iRetries=RATE_LIMIT_RETRIES, lookup=None, clock=time.monotonic,
+                 sleep=asyncio.sleep):
+        """
+        @param lookup: The coroutine function performing the query, taking the server and query string.
+        @param clock: The function returning the current time in seconds, replaceable for testing.
+        @param sleep: The coroutine function to wait with, replaceable for testing.
+        """
+        self.iMaxConnections = iMaxConnections
+        self.fInterval = fInterval
+        self.fBackoff = fBackoff
+        self.iRetries = iRetries
+        self._lookup = lookup or _whois_lookup
+        self._clock = clock
+        self._sleep = sleep
+        #server -> Semaphore
+        self._connections = dict()
+        #server -> time the next query may start
+        self._next_slot = dict()
+        #server -> number of rate limited responses in a row
+        self._strikes = dict()
+
+    async def _wait_for_slot(self, sServer):
+        fNow = self._clock()
+        fSlot = max(fNow, self._next_slot.get(sServer, fNow))
+        self._next_slot[sServer] = fSlot + self.fInterval
+        if fSlot > fNow:
+            await self._sleep(fSlot - fNow)
+
+    def _rate_limited(self, sServer):
+        iStrikes = self._strikes.get(sServer, 0) + 1
+        self._strikes[sServer] = iStrikes
+        self._next_slot[sServer] = max(self._next_slot.get(sServer, 0),
+                                       self._clock() + self.fBackoff * 2 ** (iStrikes - 1))
+
+    async def lookup(self, sServer, sQuery):
+        """
+        Queries the whois server once it's this query's turn.
+
+        @param sServer: The hostname of the whois server to query.
+        @param sQuery: The query to send.
+        @return: The whois result string, which may still be a rate limited response if every retry was too.
+        """
+        connections = self._connections.get(sServer)
+        if connections is None:
+            connections = asyncio.Semaphore(self.iMaxConnections)
+            self._connections[sServer] = connections
+
+        for attempt in range(self.iRetries + 1):
+            await self._wait_for_slot(sServer)
+            async with connections:
+                response = await self._lookup(sServer, sQuery)
+
+            if not _is_rate_limited(response):
+                self._strikes.pop(sServer, None)
+                return response
+
+            print("[!] Rate limited by " + sServer + ", backing off")
+            self._rate_limited(sServer)
+
+        return response
+
+
+def _is_rate_limited(response):
+    for error_message in RATE_LIMITTED_RESPONSES:
+        if error_message in response:
+            return True
+    return False
 
 
-def _whois_lookup(sServer, sDomain):
+class WhoisCache(object):
+    """
+    Caches whois results in memory, and optionally on disk, for WHOIS_CACHE_TTL. Concurrent requests for the same
+    result wait for the first one to finish rather than querying again. Must only be used from a single event loop.
+    """
+
+    def __init__(self, maxsize=10000, ttl=WHOIS_CACHE_TTL, strDir=None):
+        """
+        @param maxsize: The maximum number of results to hold in memory.
+        @param ttl: The number of seconds to cache each result for.
+        @param strDir: The directory to also cache results in, or None to only cache in memory.
+        """
+        self.ttl = ttl
+        self.strDir = strDir
+        self._memory = LRUCache(maxsize, ttl)
+        #key -> Future of the lookup in progress
+        self._inflight = dict()
+
+    def _path(self, strKey):
+        return os.path.join(self.strDir, hashlib.sha256(strKey.encode('utf-8')).hexdigest() + ".txt")
+
+    def _load(self, strKey):
+        if self.strDir is None:
+            return None
+        try:
+            strPath = self._path(strKey)
+            if os.path.getmtime(strPath) + self.ttl < time.time():
+                return None
+            with open(strPath, "r", encoding="utf-8") as f:
+                return f.read()
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _store(self, strKey, result):
+        self._memory.put(strKey, result)
+        if self.strDir is None:
+            return
+        try:
+            os.makedirs(self.strDir, exist_ok=True)
+            fd, strTempPath = tempfile.mkstemp(dir=self.strDir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(result)
+            os.replace(strTempPath, self._path(strKey))
+        except (IOError, OSError):
+            print("[!] Unable to write to the whois cache in " + self.strDir)
+
+    async def get(self, strKey, fnLookup):
+        """
+        @param strKey: The key to cache the result under.
+        @param fnLookup: The function to call to look up the result on a miss, returning an awaitable.
+        @return: The cached or looked up result.
+        """
+        result = self._memory.get(strKey)
+        if result is not None:
+            return result
+
+        future = self._inflight.get(strKey)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[strKey] = future
+        try:
+            result = self._load(strKey)
+            if result is not None:
+                self._memory.put(strKey, result)
+            else:
+                result = await fnLookup()
+                if not result.startswith(FAILED_RESPONSES):
+                    self._store(strKey, result)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            #Mark the exception as retrieved, in case there's no one else waiting for it
+            future.exception()
+            raise
+        finally:
+            del self._inflight[strKey]
+
+    def clear(self):
+        self._memory.clear()
+
+    def stats(self):
+        """
+        @return: A dict of the in memory cache's size and hit/miss counters.
+        """
+        return self._memory.stats()
+
+
+async def _whois_lookup(sServer, sDomain, iPort=43):
     """
     Perform the network connection to the Whois Server and query for the given domain.
 
     @param sServer: The hostname of the whois server to query.
     @param sDomain: The domain to query for.
+    @param iPort: The port the whois server listens on.
     @return: The whois result string.
     """
+    with _server_seconds.time():
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(sServer, iPort), WHOIS_TIMEOUT)
+        except asyncio.TimeoutError:
+            return "Timeout connecting to " + sServer
+        except (OSError, UnicodeError):
+            return "Unable to connect to " + sServer
 
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.settimeout(5)
-    try:
-        s.connect((sServer, 43))
-    except socket.timeout:
-        return "Timeout connecting to " + sServer
-    except socket.error:
-        return "Unable to connect to " + sServer
-
-    try:
-        query = str(codecs.encode(sDomain, "idna"), "ascii") + '\r\n'
-    except:
-        #Assumes an encoding error, just send the raw string instead.
-        query = sDomain + '\r\n'
-
-    response = ''
-
-    try:
-        s.send(query.encode())
-
-        while len(response) < 10000:
-            bytes = s.recv(1000)
-            try:
-                block = bytes.decode("utf-8")
-            except:
-                #If it's not UTF-8, the second most popular encoding appears to be iso-8859-1
-                block = bytes.decode("iso-8859-1")
-
-            if block == '':
-                break
-            response = response + block
-    except socket.error:
-        pass
-    finally:
         try:
-            s.shutdown(socket.SHUT_RDWR)
-        except socket.error:
-            #Not much more we can do here
+            query = str(codecs.encode(sDomain, "idna"), "ascii") + '\r\n'
+        except:
+            #Assumes an encoding error, just send the raw string instead.
+            query = sDomain + '\r\n'
+
+        response = bytearray()
+
+        try:
+            writer.write(query.encode())
+
+            while len(response) < WHOIS_MAX_RESPONSE:
+                block = await asyncio.wait_for(reader.read(WHOIS_MAX_RESPONSE - len(response)), WHOIS_TIMEOUT)
+                if not block:
+                    break
+                response += block
+        except (OSError, asyncio.TimeoutError):
             pass
         finally:
-            s.close()
+            writer.close()
 
-    return response
+        #Decoded in one go, so that multi-byte characters split between reads survive
+        try:
+            return response.decode("utf-8")
+        except UnicodeDecodeError:
+            #If it's not UTF-8, the second most popular encoding appears to be iso-8859-1
+            return response.decode("iso-8859-1")
+
+
+def _get_loop():
+    """
+    @return: The event loop which all whois queries run on, started on its own thread on first use.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="whois", daemon=True).start()
+        return _loop
 
 
 def whois(sDomain):
     """
-    Entry point for this package, which fetches whois data from the appropriate server.
+    Entry point for this package, which fetches whois data from the appropriate server, or the cache. Blocks the
+    calling thread until the lookup is done.
 
     @param sDomain: The domain to query whois for.
     @return: The whois result.
     """
-    sDomain = _psl.get_public_suffix(sDomain)
+    return asyncio.run_coroutine_threadsafe(_awhois(sDomain), _get_loop()).result()
+
+
+async def awhois(sDomain):
+    """
+    Asynchronous version of whois(), which may be awaited from any event loop.
+
+    @param sDomain: The domain to query whois for.
+    @return: The whois result.
+    """
+    loop = _get_loop()
+    if asyncio.get_running_loop() is loop:
+        return await _awhois(sDomain)
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(_awhois(sDomain), loop))
+
+
+async def whois_many(lstDomains, iConcurrency=MAX_CONCURRENT_LOOKUPS):
+    """
+    Looks up whois for many domains at once. Queries to different servers run in parallel, while each server's
+    queries are still queued by the scheduler.
+
+    @param lstDomains: The domains to query whois for.
+    @param iConcurrency: The maximum number of domains to look up at once.
+    @return: A dict of each domain to its whois result.
+    """
+    semaphore = asyncio.Semaphore(iConcurrency)
 
+    async def lookup(sDomain):
+        async with semaphore:
+            return await awhois(sDomain)
+
+    lstResults = await asyncio.gather(*[lookup(sDomain) for sDomain in lstDomains])
+    return dict(zip(lstDomains, lstResults))
+
+
+async def _awhois(sDomain):
+    with _whois_seconds.time(outcome="ok") as dictLabels:
+        sDomain = _psl.get_public_suffix(sDomain)
+        try:
+            result = await _cache.get(sDomain, lambda: _uncached_whois(sDomain))
+        except Exception:
+            dictLabels['outcome'] = "error"
+            raise
+        if result.startswith(FAILED_RESPONSES):
+            dictLabels['outcome'] = "failed"
+        return result
+
+
+async def _uncached_whois(sDomain):
     sLDot = sDomain.find(".")
     tld = sDomain[sLDot:]
 
@@ -120,30 +379,33 @@ def whois(sDomain):
         sServer = "whois.iana.org"
 
         try:
-            for sLine in _whois_lookup(sServer, tld).split('\n'):
+            iana_response = await _cache.get("iana " + tld, lambda: _scheduler.lookup("whois.iana.org", tld))
+            for sLine in iana_response.split('\n'):
                 if "refer:" in sLine or "whois:" in sLine:
                     sServer = sLine[6:].lstrip()
-                    _tld_to_whois[tld] = sServer
                     break
+            if not iana_response.startswith(FAILED_RESPONSES):
+                #Also remember the TLDs which iana has no whois server for, so that it isn't asked again
+                _tld_to_whois[tld] = sServer
         except:
             pass
 
-    result = _recursive_whois(sServer, sDomain)
+    result = await _recursive_whois(sServer, sDomain)
 
     #Special case to handle the fuzzy matching at the ICANN whois server
     if 'To single out one record, look it up with "xxx", where xxx is one of the' in result:
-        all_domain_records = _whois_lookup(sServer, '=' + sDomain)
+        all_domain_records = await _scheduler.lookup(sServer, '=' + sDomain)
         all_whois_servers = _extract_field(all_domain_records, "Whois Server")
         if all_whois_servers != None:
             next_whois_server = all_whois_servers.split(', ')[-1]
-            return _recursive_whois(next_whois_server, sDomain)
+            return await _recursive_whois(next_whois_server, sDomain)
         else:
             return result
     else:
         return result
 
 
-def _recursive_whois(sServer, sDomain):
+async def _recursive_whois(sServer, sDomain):
     """
     A recursive whois function which will follow the "Whois Server:" referals.
 
@@ -151,15 +413,14 @@ def _recursive_whois(sServer, sDomain):
     @param sDomain: The domain to query for.
     @return: The whois result string.
     """
-    result = _whois_lookup(sServer, sDomain)
+    result = await _scheduler.lookup(sServer, sDomain)
 
     next_whois_server = _extract_field(result, "Whois Server")
     if next_whois_server and next_whois_server != sServer and not next_whois_server.startswith("http"):
-        return _recursive_whois(next_whois_server, sDomain)
+        return await _recursive_whois(next_whois_server, sDomain)
 
-    for error_message in RATE_LIMITTED_RESPONSES:
-        if error_message in result:
-            return "Rate limited by " + sServer
+    if _is_rate_limited(result):
+        return "Rate limited by " + sServer
 
     if result.strip() == '':
         return "Empty response from " + sServer
@@ -167,6 +428,26 @@ def _recursive_whois(sServer, sDomain):
     return result.lstrip()
 
 
+_scheduler = ServerScheduler()
+_cache = WhoisCache(strDir=WHOIS_CACHE_DIR)
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def set_cache_dir(strDir):
+    """
+    Also caches whois results on disk in strDir, so that they survive restarts.
+    """
+    _cache.strDir = strDir
+
+
+def cache_stats():
+    """
+    @return: A dict of the whois cache's size and hit/miss counters.
+    """
+    return _cache.stats()
+
+
 def _extract_field(whois_blob, *args):
     """
     Extract from the given WHOIS result blob the value that is associated with the given field name.
@@ -275,6 +556,76 @@ date_fields = {"created": ("Creation Date", "(?:Date )?created(?: on)?", "Regist
                "expires": ("Expiration Date", "Expiry Date", "renewal date", "Expires(?: on)?", "Expire Date")}
 
 
+def _field_regex(*args):
+    """
+    @param *args One or more field names (interpreted as regexes) that a value may be referred to as.
+    @return The compiled regex matching any of the names at the end of a key.
+    """
+    return re.compile("(?:" + "|".join("(?:" + arg + ")" for arg in args) + r")\Z", flags=re.IGNORECASE)
+
+
+#(section, field, regex) for every field parse() extracts, each regex matching the end of a key
+_fields = list()
+for _type in contact_types.keys():
+    for _field in contact_fields.keys():
+        _fields.append((_type, _field, _field_regex(contact_types[_type] + "(?: |-)(?:" + contact_fields[_field] + ")")))
+for _field in registrar_fields.keys():
+    _fields.append(('registrar', _field, _field_regex(registrar_fields[_field])))
+_fields.append(('reseller', 'name', _field_regex("Reseller")))
+for _field in date_fields.keys():
+    _fields.append(('date', _field, _field_regex(*date_fields[_field])))
+del _type, _field
+
+
+@lru_cache(maxsize=4096)
+def _key_fields(key):
+    """
+    @param key The text before a colon on a line, with any trailing dots removed.
+    @return A tuple of (index into _fields, start) for each field whose name the key ends with, where start is the
+    position in the key at which the name starts.
+    """
+    result = list()
+    for index, (section, field, regex) in enumerate(_fields):
+        match = regex.search(key)
+        if match:
+            result.append((index, match.start()))
+    return tuple(result)
+
+
+def _parse_fields(whois_str):
+    """
+    Finds the values of every field in a single pass over the whois result. A field's value is the rest of any line
+    on which its name is followed by optional dots and a colon, exactly as _extract_field would find it.
+
+    @param whois_str The raw WHOIS result
+    @return A list, indexed like _fields, of the list of values found for each field
+    """
+    values = [list() for _ in _fields]
+
+    #Only complete lines can hold a value
+    for line in whois_str.split('\n')[:-1]:
+        colon = line.find(':')
+        if colon == -1:
+            continue
+
+        #field index -> (start, value) of the match for the field which starts furthest left on the line
+        matches = dict()
+        while colon != -1:
+            #There has to be at least one character after the colon
+            if colon < len(line) - 1:
+                for index, start in _key_fields(line[:colon].rstrip('.')):
+                    if index not in matches or start < matches[index][0]:
+                        matches[index] = (start, line[colon + 1:])
+            colon = line.find(':', colon + 1)
+
+        for index, (start, value) in matches.items():
+            value = value.strip()
+            if value and value != "null":
+                values[index].append(value)
+
+    return values
+
+
 def parse(whois_str):
     """
     Parses the given whois result string in an attempt to extract common fields.
@@ -282,13 +633,30 @@ def parse(whois_str):
     @param whois_str The raw WHOIS result
     @return A dictionary of dictionaries containing the parsed data.
     """
+    result_dict = dict((section, dict()) for section in ('registrant', 'tech', 'admin', 'registrar', 'reseller', 'date'))
+
+    for (section, field, regex), values in zip(_fields, _parse_fields(whois_str)):
+        value = FIELD_SEPERATOR.join(values) if values else None
+        if section == 'date':
+            if value:
+                value = _date_parse(value.split(FIELD_SEPERATOR)[0])
+        result_dict[section][field] = value
+
+    return result_dict
+
+
+def _parse_by_field(whois_str):
+    """
+    The original implementation of parse(), which searches the whole whois result once for each field. Kept as the
+    reference that parse() is tested and benchmarked against.
+    """
     result_dict = {}
 
     for type in contact_types.keys():
         person_dict = dict()
 
         for field in contact_fields.keys():
-            person_dict[field] = _extract_field(whois_str, contact_types[type] + "(?: |-)" + contact_fields[field])
+            person_dict[field] = _extract_field(whois_str, contact_types[type] + "(?: |-)(?:" + contact_fields[field] + ")")
 
         result_dict[type] = person_dict
 
@@ -311,4 +679,4 @@ def parse(whois_str):
 
     result_dict['date'] = dates_dict
 
-    return result_dict
\ No newline at end of file
+    return result_dict